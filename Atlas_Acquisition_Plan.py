@@ -0,0 +1,182 @@
+"""
+Atlas_Acquisition_Plan.py
+
+Which device feeds which channel, and how long each one needs to convert,
+compiled once from a config instead of worked out by position every tick.
+
+- Each channel is bound to a device by I2C address (and bus, when the same
+  address is used on two buses) or by the name stored on the board
+  ("Name,<name>"); a binding that matches no device, or more than one, is
+  an error at startup rather than a wrong column in the datalog
+- The "R" timeout of every device comes from, in order: the channel's
+  "timeout", the config's "timeouts" for its module type, the EZO datasheet
+  conversion time for its module type (READ_TIMEOUTS) and finally the
+  driver's LONG_TIMEOUT
+- Devices are grouped into timeout classes per bus, so an EC board (600 ms)
+  is read as soon as it is ready instead of waiting for the pH boards on
+  the same bus (900 ms); Multi_Bus_Reader compiles the classes of each bus
+  once and hands them to the driver's read_cycle every tick
+- Only bound devices are read; a discovered board the plan does not use
+  costs nothing
+
+Config (JSON):
+
+    {"channels": [{"channel": "K0.1 #1", "address": 106},
+                  {"channel": "K0.1 #2", "address": 107, "bus": 1},
+                  {"channel": "pH Unitrode", "name": "Unitrode"},
+                  {"channel": "Press 1", "address": 110, "timeout": 1.0}],
+     "timeouts": {"EC": 0.6, "pH": 0.9}}
+
+Usage:
+
+    plan = load_plan("rig.json", Config_AtlasI2C.get_devices())
+    reader = Multi_Bus_Reader(plan.devices, plan=plan)
+    readings = reader.read_all().readings      # one per plan.channels
+    readings[plan.index("pH Unitrode")]
+"""
+
+import json
+
+from Atlas_I2C_Driver_JQ import timeout_classes
+
+# Time (s) an "R" takes to convert, per module type, from the EZO datasheets
+READ_TIMEOUTS = {
+    "EC": 0.6,
+    "PH": 0.9,
+    "ORP": 0.9,
+    "DO": 0.6,
+    "RTD": 0.6,
+    "PRS": 0.9,
+}
+
+
+class Channel_Binding:
+    """
+    One channel of the plan: its device and that device's "R" timeout.
+    """
+
+    __slots__ = ("channel", "device", "timeout")
+
+    def __init__(self, channel, device, timeout):
+        self.channel = channel
+        self.device = device
+        self.timeout = timeout
+
+    def __repr__(self):
+        return f"Channel_Binding({self.channel!r} -> {self.device.get_device_info()} bus {self.device.bus}, {self.timeout:g} s)"
+
+
+class Acquisition_Plan:
+    """
+    Channel bindings in channel order; devices[i] feeds channels[i].
+    command is the command the timeouts are for.
+    """
+
+    def __init__(self, bindings, command="R"):
+        self.bindings = list(bindings)
+        self.command = command
+        self._index = {b.channel: i for i, b in enumerate(self.bindings)}
+        self._timeouts = {id(b.device): b.timeout for b in self.bindings}
+
+    @property
+    def channels(self):
+        return [b.channel for b in self.bindings]
+
+    @property
+    def devices(self):
+        return [b.device for b in self.bindings]
+
+    def index(self, channel):
+        try:
+            return self._index[channel]
+        except KeyError:
+            raise KeyError(f"the acquisition plan has no channel {channel!r}") from None
+
+    def timeout(self, device):
+        return self._timeouts[id(device)]
+
+    def classes_for(self, device_list, command="R"):
+        """
+        Timeout classes of device_list (one bus's devices) for command, in
+        the form read_cycle takes: [(timeout, [indices])], fastest first.
+        Commands other than the plan's use the driver's timeouts.
+        """
+        if command.upper() != self.command.upper():
+            return timeout_classes(device_list, command)
+        by_timeout = {}
+        for i, dev in enumerate(device_list):
+            by_timeout.setdefault(self.timeout(dev), []).append(i)
+        return sorted(by_timeout.items())
+
+    def describe(self):
+        """
+        One line per bus and timeout class, for the startup banner.
+        """
+        by_bus = {}
+        for b in self.bindings:
+            by_bus.setdefault(b.device.bus, []).append(b)
+        lines = []
+        for bus in sorted(by_bus):
+            devices = [b.device for b in by_bus[bus]]
+            for timeout, members in self.classes_for(devices, self.command):
+                names = ", ".join(by_bus[bus][i].channel for i in members)
+                lines.append(f"bus {bus}, {timeout:g} s: {names}")
+        return lines
+
+
+def _matches(entry, dev):
+    if "address" in entry:
+        if dev.address != int(entry["address"]):
+            return False
+        return entry.get("bus") is None or dev.bus == int(entry["bus"])
+    return dev.name == entry["name"]
+
+
+def read_timeout(dev, timeouts=None, command="R"):
+    """
+    The device's timeout for command: the config's for its module type, else
+    the datasheet figure, else the driver's.
+    """
+    moduletype = dev.moduletype.upper()
+    timeouts = {k.upper(): v for k, v in (timeouts or {}).items()}
+    if moduletype in timeouts:
+        return float(timeouts[moduletype])
+    if moduletype in READ_TIMEOUTS:
+        return READ_TIMEOUTS[moduletype]
+    return dev.get_command_timeout(command)
+
+
+def compile_plan(config, device_list):
+    """
+    Bind the config's channels to devices in device_list (see the module
+    docstring for the config). Raises ValueError for a channel that matches
+    no device or several, or a device bound twice.
+    """
+    timeouts = config.get("timeouts")
+    bindings = []
+    bound = {}
+    for entry in config["channels"]:
+        channel = entry["channel"]
+        if "address" not in entry and "name" not in entry:
+            raise ValueError(f"channel {channel!r} needs an address or a name")
+        matches = [dev for dev in device_list if _matches(entry, dev)]
+        where = (f"address {entry['address']}" + (f" on bus {entry['bus']}" if entry.get("bus") is not None else "")
+                 if "address" in entry else f"name {entry['name']!r}")
+        if not matches:
+            raise ValueError(f"channel {channel!r}: no device with {where}")
+        if len(matches) > 1:
+            raise ValueError(f"channel {channel!r}: {len(matches)} devices with {where}, give the bus")
+        dev = matches[0]
+        if id(dev) in bound:
+            raise ValueError(f"channels {bound[id(dev)]!r} and {channel!r} are bound to the same device")
+        bound[id(dev)] = channel
+        timeout = float(entry["timeout"]) if "timeout" in entry else read_timeout(dev, timeouts)
+        bindings.append(Channel_Binding(channel, dev, timeout))
+    if len(set(b.channel for b in bindings)) != len(bindings):
+        raise ValueError("channel names in the acquisition plan must be unique")
+    return Acquisition_Plan(bindings)
+
+
+def load_plan(path, device_list):
+    with open(path, "r", encoding="utf-8") as f:
+        return compile_plan(json.load(f), device_list)
@@ -0,0 +1,225 @@
+"""
+Atlas_Bench.py
+
+Loop-throughput benchmark for the acquisition path, run against the simulated
+EZO bus in Atlas_I2C_Sim.py so no Pi is needed.
+
+Three benchmarks:
+  - driver : read_recieve_all called back to back on the simulated rig
+  - main   : Atlas_Cont_Read_I2C_V2.main end to end (discovery, parsing,
+             CSV I/O and console output included), console sent to /dev/null
+  - replay : main end to end on a recorded datalog (Atlas_Replay) replayed
+             as fast as possible, i.e. the pipeline's throughput on real data
+
+All report samples per second and p50/p99 of the loop period. "main" also
+reports the time spent inside read_recieve_all per tick.
+
+Usage:
+    python Atlas_Bench.py --ticks 20
+    python Atlas_Bench.py --ticks 200 --time-scale 0.1 --bench driver
+    python Atlas_Bench.py --bench replay --replay "Novus Long COnd Only 3.csv"
+
+--time-scale shrinks the driver timeouts and the simulated conversion times
+by the same factor so comparisons between changes can run in seconds.
+"""
+
+import argparse
+import contextlib
+import math
+import os
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import Atlas_Cont_Read_I2C_V2
+import Atlas_Replay
+from Atlas_I2C_Driver_JQ import Atlas_I2C, Config_AtlasI2C, read_recieve_all
+from Atlas_I2C_Sim import make_cond_rig
+from Atlas_Multi_Bus import Multi_Bus_Reader
+
+DEFAULT_REPLAY_LOG = Path(__file__).with_name("Novus Long Cond Only Test 1.csv")
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list (pct in 0..100).
+    """
+    if not sorted_values:
+        return float("nan")
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(label, periods, total_time, samples):
+    """
+    Print and return the rate and latency summary for one benchmark.
+    """
+    periods = sorted(periods)
+    rate = samples / total_time if total_time > 0 else float("nan")
+    result = {
+        "bench": label,
+        "ticks": len(periods),
+        "samples_per_s": rate,
+        "p50_s": percentile(periods, 50),
+        "p99_s": percentile(periods, 99),
+        "max_s": periods[-1] if periods else float("nan"),
+    }
+    print(
+        f"{label:<8} ticks={result['ticks']:<5d} "
+        f"samples/s={rate:8.3f}  "
+        f"p50={result['p50_s'] * 1000:8.2f} ms  "
+        f"p99={result['p99_s'] * 1000:8.2f} ms  "
+        f"max={result['max_s'] * 1000:8.2f} ms"
+    )
+    return result
+
+
+@contextlib.contextmanager
+def scaled_timeouts(time_scale):
+    """
+    Temporarily scale Atlas_I2C.LONG_TIMEOUT and SHORT_TIMEOUT.
+    """
+    long_timeout, short_timeout = Atlas_I2C.LONG_TIMEOUT, Atlas_I2C.SHORT_TIMEOUT
+    Atlas_I2C.LONG_TIMEOUT = long_timeout * time_scale
+    Atlas_I2C.SHORT_TIMEOUT = short_timeout * time_scale
+    try:
+        yield
+    finally:
+        Atlas_I2C.LONG_TIMEOUT, Atlas_I2C.SHORT_TIMEOUT = long_timeout, short_timeout
+
+
+@contextlib.contextmanager
+def scratch_manifest():
+    """
+    Keep the simulated rig out of the real device manifest.
+    """
+    previous = Config_AtlasI2C.MANIFEST_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        Config_AtlasI2C.MANIFEST_PATH = Path(tmp) / "manifest.json"
+        try:
+            yield
+        finally:
+            Config_AtlasI2C.MANIFEST_PATH = previous
+
+
+def bench_driver(ticks, time_scale=1.0, seed=0, poll=False, buses=(1,)):
+    """
+    Time read_recieve_all alone on the simulated rig.
+    """
+    network = make_cond_rig(time_scale=time_scale, seed=seed, buses=buses)
+    with network.installed(), scaled_timeouts(time_scale), scratch_manifest():
+        device_list = Config_AtlasI2C.get_devices(buses=buses)
+        periods = []
+        start = perf_counter()
+        for _ in range(ticks):
+            t0 = perf_counter()
+            read_recieve_all(device_list, poll=poll)
+            periods.append(perf_counter() - t0)
+        total = perf_counter() - start
+    return summarize("driver", periods, total, ticks)
+
+
+def bench_main(ticks, time_scale=1.0, seed=0, rate_hz=None, poll=False, buses=(1,)):
+    """
+    Time Atlas_Cont_Read_I2C_V2.main end to end.
+
+    The loop period is measured between successive Multi_Bus_Reader.read_all
+    calls, so it includes everything main does per sample. rate_hz=None runs main's
+    scheduler free to find the fastest loop; otherwise the rate is scaled
+    with time_scale.
+    """
+    network = make_cond_rig(time_scale=time_scale, seed=seed, buses=buses)
+    call_starts = []
+    read_times = []
+
+    class Timed_Reader(Multi_Bus_Reader):
+        def read_all(self, command="R", idle_until=None):
+            t0 = perf_counter()
+            call_starts.append(t0)
+            try:
+                return super().read_all(command, idle_until)
+            finally:
+                read_times.append(perf_counter() - t0)
+
+    original = Atlas_Cont_Read_I2C_V2.Multi_Bus_Reader
+    Atlas_Cont_Read_I2C_V2.Multi_Bus_Reader = Timed_Reader
+    try:
+        with tempfile.TemporaryDirectory() as tmp, \
+                network.installed(), scaled_timeouts(time_scale), scratch_manifest(), \
+                open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            Atlas_Cont_Read_I2C_V2.main(filename=os.path.join(tmp, "bench.csv"),
+                                        max_ticks=ticks + 1,
+                                        rate_hz=rate_hz / time_scale if rate_hz else None,
+                                        poll=poll, buses=list(buses))
+            end = perf_counter()
+    finally:
+        Atlas_Cont_Read_I2C_V2.Multi_Bus_Reader = original
+
+    # last call's period runs to the end of main
+    periods = [b - a for a, b in zip(call_starts, call_starts[1:] + [end])]
+    result = summarize("main", periods[1:], end - call_starts[1], ticks)
+    read_summary = summarize("  read", read_times[1:], sum(read_times[1:]), ticks)
+    result["read_p50_s"] = read_summary["p50_s"]
+    result["read_p99_s"] = read_summary["p99_s"]
+    return result
+
+
+def bench_replay(path=DEFAULT_REPLAY_LOG, ticks=None):
+    """
+    Time Atlas_Cont_Read_I2C_V2.main on a recorded datalog replayed at full
+    speed; ticks=None replays the whole log.
+    """
+    call_starts = []
+
+    class Timed_Replay(Atlas_Replay.Replay_Source):
+        def read_all(self, command="R", idle_until=None):
+            call_starts.append(perf_counter())
+            return super().read_all(command, idle_until)
+
+    # main() imports Replay_Source from Atlas_Replay when it replays
+    original = Atlas_Replay.Replay_Source
+    Atlas_Replay.Replay_Source = Timed_Replay
+    try:
+        with tempfile.TemporaryDirectory() as tmp, \
+                open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            Atlas_Cont_Read_I2C_V2.main(filename=os.path.join(tmp, "bench.csv"), max_ticks=ticks,
+                                        replay=str(path), replay_speed=None)
+            end = perf_counter()
+    finally:
+        Atlas_Replay.Replay_Source = original
+
+    # the last call is the one that found the end of the log
+    periods = [b - a for a, b in zip(call_starts, call_starts[1:] + [end])]
+    if ticks is None:
+        periods = periods[:-1]
+    return summarize("replay", periods, sum(periods), len(periods))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Atlas acquisition loop on the simulated EZO bus")
+    parser.add_argument("--ticks", type=int, default=20, help="loop iterations to time")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="multiply driver timeouts and simulated conversion times by this")
+    parser.add_argument("--bench", choices=("driver", "main", "both", "replay"), default="both")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="sample rate for the main bench (0 = free running)")
+    parser.add_argument("--poll", action="store_true",
+                        help="use readiness polling instead of the fixed LONG_TIMEOUT sleep")
+    parser.add_argument("--buses", type=int, default=1,
+                        help="spread the simulated probes over this many I2C buses")
+    parser.add_argument("--replay", default=str(DEFAULT_REPLAY_LOG),
+                        help="datalog for the replay bench (default: the Test 1 log)")
+    args = parser.parse_args()
+
+    if args.bench in ("driver", "both"):
+        bench_driver(args.ticks, args.time_scale, args.seed, args.poll, tuple(range(1, args.buses + 1)))
+    if args.bench in ("main", "both"):
+        bench_main(args.ticks, args.time_scale, args.seed, args.rate or None, args.poll,
+                   tuple(range(1, args.buses + 1)))
+    if args.bench == "replay":
+        bench_replay(args.replay)
+
+
+if __name__ == "__main__":
+    main()
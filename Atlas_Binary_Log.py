@@ -0,0 +1,218 @@
+"""
+Atlas_Binary_Log.py
+
+Compact append-only binary datalog, with a streaming exporter back to the
+semicolon CSV layout.
+
+File layout (all little-endian):
+
+    8 bytes   magic b"ATLASBIN"
+    uint16    format version
+    uint16    reserved
+    uint32    length of the JSON header that follows
+    JSON      {"channels": [...], "addresses": [...], "start_time": <epoch s>,
+               "record_format": "<d7fI", "record_size": 40, ...}
+    padding   NULs up to a multiple of 8 bytes
+    records   float64 time (epoch seconds), float32 per channel (NaN when
+              missing), uint32 error bits (bit i set = channel i errored)
+
+Every record has the same size, so a file can be opened zero-copy with
+numpy.memmap (open_memmap) and a torn final record after a power cut is just
+ignored. A row of 3 conductivity + 3 resistivity channels and the loop time
+is 40 bytes against ~150 bytes of CSV text.
+
+Usage:
+
+    sink = Binary_Log_Sink("run.bin", channels, addresses)
+    Background_Writer(sink).write((epoch_time, values, error_bits))
+
+    header, log = open_memmap("run.bin")  # log["time"], log["values"][:, i]
+    export_csv("run.bin", "run.csv")
+"""
+
+import csv
+import datetime
+import json
+import math
+import os
+import struct
+
+MAGIC = b"ATLASBIN"
+VERSION = 1
+_PREAMBLE = struct.Struct("<8sHHI")
+_ALIGN = 8
+
+
+def record_struct(n_channels):
+    return struct.Struct("<d%dfI" % n_channels)
+
+
+class Binary_Log_Sink:
+    """
+    Writes fixed-size records; usable as a Background_Writer sink.
+
+    Rows are (epoch_time, values, error_bits) with one value per channel, None
+    for a missing value. addresses gives the I2C address behind each channel
+    (None for channels that are not a probe, e.g. loop time).
+    """
+
+    def __init__(self, path, channels, addresses=None, start_time=None, extra=None):
+        self.path = path
+        self.channels = list(channels)
+        self.addresses = list(addresses) if addresses is not None else [None] * len(self.channels)
+        if len(self.addresses) != len(self.channels):
+            raise ValueError("need one address (or None) per channel")
+        self._record = record_struct(len(self.channels))
+        self._nan = float("nan")
+
+        header = {
+            "channels": self.channels,
+            "addresses": self.addresses,
+            "start_time": start_time,
+            "record_format": self._record.format,
+            "record_size": self._record.size,
+        }
+        if extra:
+            header.update(extra)
+        header_bytes = json.dumps(header).encode("utf-8")
+        preamble = _PREAMBLE.pack(MAGIC, VERSION, 0, len(header_bytes))
+        pad = -(len(preamble) + len(header_bytes)) % _ALIGN
+
+        self._file = open(path, "wb")
+        self._file.write(preamble + header_bytes + b"\x00" * pad)
+        self._file.flush()
+
+    def write_rows(self, rows):
+        pack = self._record.pack
+        nan = self._nan
+        self._file.write(b"".join(
+            pack(t, *[nan if v is None else v for v in values], bits)
+            for t, values, bits in rows
+        ))
+
+    def flush(self):
+        self._file.flush()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+def read_header(path):
+    """
+    Returns (header dict, offset of the first record).
+    """
+    with open(path, "rb") as f:
+        return read_header_from(f, path)
+
+
+def read_header_from(f, name="stream"):
+    """
+    read_header for a binary file object positioned at the start of the log
+    (e.g. a gzip stream); leaves it positioned at the first record.
+    """
+    preamble = f.read(_PREAMBLE.size)
+    if len(preamble) < _PREAMBLE.size:
+        raise ValueError(f"{name}: too short to be an Atlas binary log")
+    magic, version, _, header_len = _PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ValueError(f"{name}: not an Atlas binary log")
+    if version > VERSION:
+        raise ValueError(f"{name}: binary log version {version} is newer than this reader")
+    header = json.loads(f.read(header_len).decode("utf-8"))
+    offset = _PREAMBLE.size + header_len
+    pad = -offset % _ALIGN
+    f.read(pad)
+    return header, offset + pad
+
+
+def is_binary_log(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def record_dtype(n_channels):
+    """
+    numpy dtype matching record_struct(n_channels).
+    """
+    import numpy as np  # only the readers need numpy, not the logger on the Pi
+    return np.dtype([("time", "<f8"), ("values", "<f4", (n_channels,)), ("error_bits", "<u4")])
+
+
+def open_memmap(path):
+    """
+    Zero-copy, read-only view of every complete record in a binary log.
+
+    Returns (header, records) where records is a numpy.memmap with fields
+    "time", "values" (n_records x n_channels) and "error_bits".
+    """
+    import numpy as np
+    header, offset = read_header(path)
+    dtype = record_dtype(len(header["channels"]))
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count <= 0:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def iter_records(path, chunk_records=4096):
+    """
+    Stream (time, values tuple, error_bits) from a binary log without numpy.
+    """
+    header, offset = read_header(path)
+    record = record_struct(len(header["channels"]))
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            chunk = f.read(record.size * chunk_records)
+            usable = len(chunk) - len(chunk) % record.size
+            if not usable:
+                return
+            for fields in record.iter_unpack(chunk[:usable]):
+                yield fields[0], fields[1:-1], fields[-1]
+            if usable < len(chunk):
+                return
+
+
+def export_csv(src, dst, delimiter=";"):
+    """
+    Stream a binary log out as the semicolon CSV the loggers write: time,
+    time from start, every channel, ErrorFlag and ErrorDetail (the names of
+    the channels that errored). Missing values become empty cells; float32
+    values are written with the 7 significant digits they hold.
+    """
+    header, _ = read_header(src)
+    channels = header["channels"]
+    start = header.get("start_time")
+    subsecond = 0 < (header.get("period") or 1.0) < 1.0
+    rows = 0
+    with open(dst, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out, delimiter=delimiter)
+        writer.writerow(["Time (Y-M-D-H-M-S)", "Time from Start (Seconds)"] + channels + ["ErrorFlag", "ErrorDetail"])
+        for t, values, bits in iter_records(src):
+            if start is None:
+                start = t
+            cells = ["" if math.isnan(v) else "%.7g" % v for v in values]
+            detail = "; ".join(f"error:{name}" for i, name in enumerate(channels) if bits >> i & 1)
+            stamp = datetime.datetime.fromtimestamp(t)
+            stamp = (stamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if subsecond
+                     else stamp.strftime("%Y-%m-%d %H:%M:%S"))
+            writer.writerow([stamp, round(t - start, 6)] + cells + [1 if bits else 0, detail])
+            rows += 1
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export an Atlas binary datalog to semicolon CSV")
+    parser.add_argument("src")
+    parser.add_argument("dst", nargs="?", help="defaults to src with a .csv suffix")
+    args = parser.parse_args()
+    dst = args.dst or os.path.splitext(args.src)[0] + ".csv"
+    print(f"{export_csv(args.src, dst)} rows written to {dst}")
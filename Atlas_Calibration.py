@@ -0,0 +1,238 @@
+"""
+Atlas_Calibration.py
+
+Calibrates every probe of one module type together, so recalibrating a rack
+costs one settle time and one calibration timeout instead of one per probe.
+
+- All probes of the module type sit in the same standard and are read
+  together every interval (the driver's read_cycle) into a
+  Stability_Monitor; calibration waits until every probe has been stable for
+  hold_s seconds (or gives up after timeout_s)
+- The calibration command ("Cal,low,12880", "Cal,mid,7.00", "Cal,dry",
+  "Cal,84", ...) is then written to every probe before one shared wait and
+  one read of each, with the driver's retries for NACKs and boards still
+  busy (read_cycle)
+- "Cal,?" is asked of every probe (again all at once) before and after, and
+  a probe passes when the board accepted the command and now reports at
+  least one calibration point (none after "Cal,clear"); the count need not
+  go up, as recalibrating a point replaces it and a pH "Cal,mid" clears
+  the others
+- One JSON line per calibration goes to the calibration record: time,
+  command, and per probe its bus, address, name, firmware, settled mean and
+  sigma, the board's answer and the Cal,? counts before and after
+
+Usage:
+
+    calibrator = Parallel_Calibrator(Config_AtlasI2C.get_devices(), moduletype="EC")
+    calibrator.wait_stable()
+    results = calibrator.calibrate("low", 12880)
+
+    python Atlas_Calibration.py --module EC --point low --value 12880
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+
+from Atlas_I2C_Driver_JQ import Config_AtlasI2C, read_cycle
+from Atlas_Scheduler import Fixed_Rate_Scheduler
+from Atlas_Stability import Stability_Monitor
+
+RECORD_PATH = "Atlas_Calibration_Record.jsonl"
+
+
+class Calibration_Error(RuntimeError):
+    """
+    The probes did not settle, or no probe of the module type was found.
+    """
+
+
+def calibration_command(point=None, value=None):
+    """
+    "Cal,<point>,<value>", "Cal,<point>" or "Cal,<value>" (single point).
+    """
+    parts = ["Cal"]
+    if point:
+        parts.append(str(point))
+    if value is not None:
+        # :g keeps only 6 significant digits ("Cal,low,1.41324e+06")
+        parts.append(f"{value:.10g}" if isinstance(value, float) else str(value))
+    if len(parts) == 1:
+        raise ValueError("a calibration needs a point, a value or both")
+    return ",".join(parts)
+
+
+def _cal_points(reading):
+    # "?CAL,2" -> 2, None when the board did not answer
+    if reading is None or not reading.ok:
+        return None
+    try:
+        return int(reading.payload.decode("latin-1").rsplit(",", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+class Calibration_Result:
+    """
+    One probe's outcome.
+    """
+
+    __slots__ = ("device", "command", "ok", "response", "points_before", "points_after", "settled")
+
+    def __init__(self, device, command, ok, response, points_before, points_after, settled):
+        self.device = device
+        self.command = command
+        self.ok = ok
+        self.response = response
+        self.points_before = points_before
+        self.points_after = points_after
+        self.settled = settled
+
+    def __repr__(self):
+        return (f"Calibration_Result({self.device.get_device_info()}: {self.command} "
+                f"{'ok' if self.ok else 'FAILED'}, {self.response}, points {self.points_before} -> {self.points_after})")
+
+    def record(self):
+        dev = self.device
+        entry = {"bus": dev.bus, "address": dev.address, "name": dev.name, "firmware": dev.firmware,
+                 "ok": self.ok, "response": self.response,
+                 "points_before": self.points_before, "points_after": self.points_after}
+        if self.settled is not None:
+            entry.update({"mean": self.settled["mean"], "sigma": self.settled["sigma"],
+                          "stable_for": self.settled["stable_for"]})
+        return entry
+
+
+class Parallel_Calibrator:
+    """
+    Calibrates the probes of device_list whose module type is moduletype.
+    hold_s, window and k go to the Stability_Monitor; interval is the read
+    period while waiting, timeout_s how long to wait for every probe to
+    settle. on_event(Stability_Event) sees every stability change.
+    """
+
+    def __init__(self, device_list, moduletype="EC", hold_s=30.0, window=30, k=4.5,
+                 interval=1.0, timeout_s=900.0, record_path=RECORD_PATH, on_event=None):
+        self.devices = [dev for dev in device_list if dev.moduletype.upper() == moduletype.upper()]
+        if not self.devices:
+            raise Calibration_Error(f"no {moduletype} probes in the device list")
+        self.moduletype = moduletype
+        self.interval = interval
+        self.timeout_s = timeout_s
+        self.record_path = record_path
+        self.on_event = on_event
+        self.monitor = Stability_Monitor(hold_s=hold_s, window=window, k=k)
+        self.names = [dev.get_device_info() for dev in self.devices]
+        self.settled = None
+
+    def wait_stable(self):
+        """
+        Read every probe together until all are settled; returns the
+        Stability_Monitor summary. Raises Calibration_Error on timeout.
+        """
+        scheduler = Fixed_Rate_Scheduler(1.0 / self.interval)
+        scheduler.start()
+        for tick in scheduler:
+            readings = read_cycle(self.devices, "R")
+            values = {name: None if reading is None or not reading.ok else reading.value
+                      for name, reading in zip(self.names, readings)}
+            for event in self.monitor.update_all(tick.offset, values):
+                if self.on_event is not None:
+                    self.on_event(event)
+            if self.monitor.all_settled(self.names):
+                self.settled = self.monitor.summary()
+                return self.settled
+            if tick.offset >= self.timeout_s:
+                waiting = [name for name in self.names if self.monitor.state(name) != "settled"]
+                raise Calibration_Error(f"not stable after {self.timeout_s:g} s: {', '.join(waiting)}")
+
+    def query_points(self):
+        """
+        "Cal,?" on every probe at once: calibration points per probe (None
+        where the board did not answer).
+        """
+        return [_cal_points(reading) for reading in read_cycle(self.devices, "Cal,?")]
+
+    def calibrate(self, point=None, value=None, verify=True):
+        """
+        Send the calibration to every probe at once and verify it; returns a
+        Calibration_Result per probe and appends the record. Call
+        wait_stable first (the settled values go into the record).
+        """
+        command = calibration_command(point, value)
+        before = self.query_points() if verify else [None] * len(self.devices)
+        readings = read_cycle(self.devices, command)
+        after = self.query_points() if verify else [None] * len(self.devices)
+        clearing = command.upper() == "CAL,CLEAR"
+
+        results = []
+        for dev, name, reading, n_before, n_after in zip(self.devices, self.names, readings, before, after):
+            accepted = reading is not None and reading.ok
+            if verify:
+                ok = accepted and n_after is not None and (n_after == 0 if clearing else n_after >= 1)
+            else:
+                ok = accepted
+            response = "no response" if reading is None else dev.format_reading(reading)
+            settled = self.settled.get(name) if self.settled else None
+            results.append(Calibration_Result(dev, command, ok, response, n_before, n_after, settled))
+        self.write_record(command, results)
+        return results
+
+    def write_record(self, command, results):
+        entry = {"time": datetime.datetime.now().isoformat(timespec="seconds"),
+                 "moduletype": self.moduletype, "command": command,
+                 "ok": all(r.ok for r in results),
+                 "probes": [r.record() for r in results]}
+        with open(self.record_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate every Atlas probe of one module type at once")
+    parser.add_argument("--module", default="EC", help="module type to calibrate (default EC)")
+    parser.add_argument("--point", help="calibration point: dry, low, high, mid, clear, ...")
+    parser.add_argument("--value", type=float, help="value of the calibration standard")
+    parser.add_argument("--hold", type=float, default=30.0,
+                        help="seconds every probe must be stable before calibrating (default 30)")
+    parser.add_argument("--timeout", type=float, default=900.0,
+                        help="give up when the probes have not settled after this many seconds")
+    parser.add_argument("--skip-stability", action="store_true",
+                        help="calibrate right away (e.g. Cal,dry, Cal,clear)")
+    parser.add_argument("--record", default=RECORD_PATH, help=f"calibration record (default {RECORD_PATH})")
+    parser.add_argument("--rescan", action="store_true",
+                        help="ignore the cached device manifest and scan the whole I2C bus")
+    args = parser.parse_args()
+    try:
+        command = calibration_command(args.point, args.value)
+    except ValueError as e:
+        parser.error(str(e))
+
+    device_list = Config_AtlasI2C.get_devices(rescan=args.rescan)
+    try:
+        calibrator = Parallel_Calibrator(device_list, moduletype=args.module, hold_s=args.hold,
+                                         timeout_s=args.timeout, record_path=args.record,
+                                         on_event=lambda event: print(f"{event.probe}: {event.previous} -> {event.state}"))
+        print(f"{command} on {', '.join(calibrator.names)}")
+        if not args.skip_stability:
+            print(f"Waiting for every probe to be stable for {args.hold:g} s...")
+            started = time.monotonic()
+            calibrator.wait_stable()
+            print(f"Stable after {time.monotonic() - started:.0f} s")
+        for result in calibrator.calibrate(args.point, args.value):
+            print(f"  {result.device.get_device_info()}: {'ok' if result.ok else 'FAILED'} "
+                  f"({result.response}, Cal,? {result.points_before} -> {result.points_after})")
+        print(f"Recorded in {args.record}")
+    except Calibration_Error as e:
+        print(f">> {e}")
+    except KeyboardInterrupt:
+        print("Calibration stopped by user")
+    finally:
+        Config_AtlasI2C.close_devices(device_list)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Atlas_Circuit_Breaker.py
+
+Per-device circuit breaker, so one failing probe cannot take the others down.
+
+- Every read cycle (Atlas_I2C_Driver_JQ.read_cycle) reports each device's
+  outcome to its breaker; a NACK, a board still answering 254 after its
+  retries, or any other error status counts as a failure
+- After failure_threshold consecutive failures the breaker opens: the device
+  is quarantined, read cycles skip it and report a "quarantined" fault for
+  it, so the healthy devices keep their full sample rate
+- While open, a daemon thread probes the address with a single read, backing
+  off from probe_interval to max_probe_interval. The first probe that gets
+  an answer other than 254 half-opens the breaker: the next cycle includes
+  the device again, and a good reading there closes it (reinstated) while a
+  bad one opens it again
+- on_change(breaker, old_state, new_state) is called on every transition,
+  from whichever thread made it
+
+Usage:
+
+    breakers = attach_breakers(device_list, on_change=report)
+    readings = read_cycle(device_list)       # skips quarantined devices
+    ...
+    close_breakers(device_list)
+"""
+
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class Circuit_Breaker:
+    """
+    Breaker for one Atlas_I2C; attach it as device.breaker.
+    """
+
+    def __init__(self, device, failure_threshold=3, probe_interval=2.0,
+                 max_probe_interval=60.0, on_change=None):
+        self.device = device
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self.last_fault = None
+        self.trips = 0
+        self.probes = 0
+        self.reinstated = 0
+        self.opened_at = None
+        self._interval = probe_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def quarantined(self):
+        return self.state == OPEN
+
+    def allow(self):
+        """
+        Whether the next read cycle should include the device.
+        """
+        return self.state != OPEN
+
+    def record(self, reading):
+        """
+        Outcome of one cycle for the device: an EZO_Reading or Read_Fault
+        (None, a device asleep, is not counted).
+        """
+        if reading is None:
+            return
+        if reading.ok:
+            with self._lock:
+                self.failures = 0
+                if self.state != HALF_OPEN:
+                    return
+                self._interval = self.probe_interval
+                self.reinstated += 1
+            self._set_state(CLOSED)
+            return
+
+        with self._lock:
+            self.failures += 1
+            self.last_fault = getattr(reading, "code", None) or str(reading.status)
+            if self.state == HALF_OPEN:
+                # failed its trial cycle, wait longer before the next probe
+                self._interval = min(self._interval * 2, self.max_probe_interval)
+            elif self.state != CLOSED or self.failures < self.failure_threshold:
+                return
+            self.trips += 1
+            self.opened_at = time.monotonic()
+        self._set_state(OPEN)
+        self._start_probing()
+
+    def _set_state(self, state):
+        old, self.state = self.state, state
+        if old != state and self.on_change is not None:
+            self.on_change(self, old, state)
+
+    def _start_probing(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._probe_loop, daemon=True,
+                                        name=f"atlas-probe-{self.device.address}")
+        self._thread.start()
+
+    def probe(self):
+        """
+        One single read of the address; True when the board answered with
+        anything but "still processing".
+        """
+        self.probes += 1
+        reading = self.device.safe_read_reading(retries=0)
+        return not getattr(reading, "code", None) and reading.status != self.device.STATUS_PENDING
+
+    def _probe_loop(self):
+        while self.state == OPEN and not self._stop.wait(self._interval):
+            if self.probe():
+                self._set_state(HALF_OPEN)
+                return
+            self._interval = min(self._interval * 2, self.max_probe_interval)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures, "last_fault": self.last_fault,
+                "trips": self.trips, "probes": self.probes, "reinstated": self.reinstated}
+
+
+def attach_breakers(device_list, **settings):
+    """
+    Give every device in device_list a Circuit_Breaker (settings are passed
+    to each); returns the breakers in device_list order.
+    """
+    for dev in device_list:
+        dev.breaker = Circuit_Breaker(dev, **settings)
+    return [dev.breaker for dev in device_list]
+
+
+def close_breakers(device_list):
+    for dev in device_list:
+        if dev.breaker is not None:
+            dev.breaker.close()
+            dev.breaker = None
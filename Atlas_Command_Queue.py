@@ -0,0 +1,200 @@
+"""
+Atlas_Command_Queue.py
+
+Per-device command queue, so management traffic never races the acquisition
+loop or stretches the sample period.
+
+- Anything that wants to talk to a probe submits the command to the probe's
+  Device_Command_Queue (queue_for(dev).submit(...)) and gets a Future for the
+  response, instead of calling Atlas_I2C.write/query itself
+- Commands run in priority order: ACQUISITION ("R"), then CONTROL (operator
+  and calibration commands), then HOUSEKEEPING ("T,", "Status", "name,?"...);
+  first come first served within a priority
+- Repeats are coalesced: an identical query still waiting ("Status" twice)
+  is sent once and both callers get its answer, and a newer setpoint
+  ("T,24.8" after "T,25.1") replaces the older one in its place in the queue
+- Multi_Bus_Reader's bus workers drain the queues between conversions. A
+  command only runs when its timeout fits before the next "R" is due, except
+  ACQUISITION, and CONTROL commands that have waited CONTROL_MAX_WAIT seconds
+  (these then stretch one sample period rather than wait forever)
+
+Usage:
+
+    reply = queue_for(dev).submit("T,24.8")           # housekeeping
+    cal = queue_for(dev).submit("Cal,?", CONTROL)
+    print(cal.result(timeout=5))
+
+Without a reader running, queue_for(dev).run_pending() sends everything
+queued from the calling thread.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+ACQUISITION = 0
+CONTROL = 1
+HOUSEKEEPING = 2
+
+# setpoint commands where only the newest value waiting matters
+REPLACEABLE_COMMANDS = ("T", "NAME", "L")
+# argument-less commands that are pure queries
+QUERY_COMMANDS = ("R", "STATUS", "I")
+
+
+def default_coalesce_key(command):
+    """
+    Key two pending commands are merged on, None if the command must run
+    every time it is submitted (calibration steps, Sleep, Factory...).
+    """
+    fields = command.strip().upper().split(",")
+    if fields[-1] == "?" or (len(fields) == 1 and fields[0] in QUERY_COMMANDS):
+        return ",".join(fields)
+    if len(fields) > 1 and fields[0] in REPLACEABLE_COMMANDS:
+        return fields[0] + ",="
+    return None
+
+
+class Queued_Command:
+    __slots__ = ("command", "priority", "seq", "key", "futures", "submitted")
+
+    def __init__(self, command, priority, seq, key):
+        self.command = command
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.futures = []
+        self.submitted = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Device_Command_Queue:
+    """
+    Prioritised, coalescing command queue for one Atlas_I2C.
+    """
+
+    # time kept free between a queued command finishing and the next "R"
+    IDLE_MARGIN = .05
+    # a CONTROL command that never fits a gap is sent anyway after this long
+    CONTROL_MAX_WAIT = 5.0
+
+    def __init__(self, device):
+        self.device = device
+        self._lock = threading.Lock()
+        self._heap = []
+        self._by_key = {}
+        self._seq = itertools.count()
+        self.commands_run = 0
+        self.commands_coalesced = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def submit(self, command, priority=HOUSEKEEPING, coalesce_key=default_coalesce_key):
+        """
+        Queue a command and return a Future for its response string.
+        coalesce_key is a function of the command (or None to never merge).
+        """
+        future = Future()
+        key = coalesce_key(command) if coalesce_key else None
+        with self._lock:
+            queued = self._by_key.get((priority, key)) if key is not None else None
+            if queued is not None:
+                queued.command = command
+                self.commands_coalesced += 1
+            else:
+                queued = Queued_Command(command, priority, next(self._seq), key)
+                heapq.heappush(self._heap, queued)
+                if key is not None:
+                    self._by_key[(priority, key)] = queued
+            queued.futures.append(future)
+        return future
+
+    def pending(self):
+        with self._lock:
+            return [(q.priority, q.command) for q in sorted(self._heap)]
+
+    def peek_priority(self):
+        with self._lock:
+            return self._heap[0].priority if self._heap else None
+
+    def _pop(self, until):
+        with self._lock:
+            if not self._heap:
+                return None
+            queued = self._heap[0]
+            now = time.monotonic()
+            forced = (queued.priority == ACQUISITION
+                      or (queued.priority == CONTROL and now - queued.submitted >= self.CONTROL_MAX_WAIT))
+            if until is not None and not forced:
+                needed = (self.device.get_command_timeout(queued.command) or 0) + self.IDLE_MARGIN
+                if now + needed > until:
+                    return None
+            heapq.heappop(self._heap)
+            if queued.key is not None:
+                self._by_key.pop((queued.priority, queued.key), None)
+            return queued
+
+    def _execute(self, queued):
+        futures = [f for f in queued.futures if f.set_running_or_notify_cancel()]
+        if not futures:
+            return
+        try:
+            response = self.device.query(queued.command)
+        except Exception as e:
+            for f in futures:
+                f.set_exception(e)
+        else:
+            for f in futures:
+                f.set_result(response)
+        self.commands_run += 1
+
+    def run_one(self, until=None):
+        """
+        Send the next command if it may run before `until` (time.monotonic());
+        returns whether one was sent.
+        """
+        queued = self._pop(until)
+        if queued is None:
+            return False
+        self._execute(queued)
+        return True
+
+    def run_idle(self, until=None):
+        """
+        Run queued commands on the calling thread until the queue is empty or
+        the next housekeeping command would not finish before `until`.
+        until=None runs everything. Returns how many commands were sent.
+        """
+        ran = 0
+        while self.run_one(until):
+            ran += 1
+        return ran
+
+    def run_pending(self):
+        return self.run_idle(None)
+
+    def stats(self):
+        return {"pending": len(self._heap), "commands_run": self.commands_run,
+                "commands_coalesced": self.commands_coalesced}
+
+
+_queues = weakref.WeakKeyDictionary()
+_queues_lock = threading.Lock()
+
+
+def queue_for(device, create=True):
+    """
+    The Device_Command_Queue for an Atlas_I2C (None if it has none and
+    create is False).
+    """
+    with _queues_lock:
+        queue = _queues.get(device)
+        if queue is None and create:
+            queue = _queues[device] = Device_Command_Queue(device)
+        return queue
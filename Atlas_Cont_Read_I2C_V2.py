@@ -8,13 +8,93 @@ Cleaned and hardened data-logging script for Atlas I2C devices.
 - K1.0 sensor removed from logging (only logs K0.1 #1, K0.1 #2, K0.1 #3)
 - Adds resistivity (MΩ·cm) output for each conductivity measurement:
     Resistivity (MΩ·cm) = 1 / Conductivity (µS/cm)
+- Keeps the datalog open and writes rows on a background thread
+  (Atlas_Data_Writer) so SD card stalls never delay the next reading
+- Samples on a fixed-rate grid (Atlas_Scheduler, 1 Hz by default); times in
+  the log are grid times, overruns skip ticks and are counted
+- Discovers probes on the I2C buses asked for (bus 1 by default) and reads
+  each bus on its own thread (Atlas_Multi_Bus)
+- Optional compact binary datalog (--binary, Atlas_Binary_Log) that exports
+  back to this CSV layout
+- Commands queued for a probe (Atlas_Command_Queue) are sent between readings,
+  in the idle time before the next tick
+- Keeps 10 s / 1 min / 1 h rollup files next to the datalog (Atlas_Rollup) and
+  can prune raw datalogs older than --retention-days
+- Optional metrics endpoint (--metrics-port, Atlas_Metrics): Prometheus text
+  on /metrics and JSON on /metrics.json
+- Times every phase of the loop (Atlas_Profiling) and prints the histogram
+  summary on exit; --phase-columns also logs them, --profile attaches
+  cProfile or a sampling profiler for a window of ticks
+- A probe that NACKs or stays busy is retried, then quarantined by its
+  circuit breaker (Atlas_Circuit_Breaker) and re-probed in the background;
+  the other probes keep their rate and rows keep their good channels, with
+  the failing probe's error code in ErrorDetail
+- Optional shared memory ring (--shared-ring, Atlas_Shared_Ring) with the
+  latest samples, for plotters and controllers in other processes
+- --replay feeds a recorded datalog through the same loop (Atlas_Replay) in
+  real time, N times faster or as fast as possible; rows keep the recorded
+  time and "Time from Start"
+- Optional rotation into numbered, compressed segments with a time index
+  (--segment-mb, --segment-hours, --compress; Atlas_Segmented_Log)
+- Other derived channels (--derived config: temperature compensation, TDS,
+  deltas between probes) come from one Atlas_Derived engine evaluated per
+  tick and are logged as extra columns
+- Without --derived, --replay, --deadband, --shared-ring or segments the
+  logger needs only the standard library (no numpy on the Pi)
+- --plan binds the K0.1 #1..#3 channels to probes by address or name
+  (Atlas_Acquisition_Plan) instead of by discovery order, reads only those
+  probes, and reads each as soon as its module type's conversion is done
+- --deadband writes a probe's values only when its conductivity moves beyond
+  the band or its --heartbeat passes (Atlas_Deadband); held cells are left
+  empty, ticks with nothing to write are skipped, and Atlas_Log_Loader
+  forward-fills them
 """
 
-import csv
+import argparse
 import datetime
+import json
+import os
 from time import time
 
-from Atlas_I2C_Driver_JQ import Config_AtlasI2C, read_recieve_all
+from Atlas_Acquisition_Plan import load_plan
+from Atlas_Binary_Log import Binary_Log_Sink
+from Atlas_Circuit_Breaker import attach_breakers, close_breakers
+from Atlas_Data_Writer import Background_Writer, CSV_Sink
+from Atlas_I2C_Driver_JQ import Config_AtlasI2C
+from Atlas_Metrics import Metrics_Registry, Metrics_Server
+from Atlas_Multi_Bus import Multi_Bus_Reader
+from Atlas_Profiling import Phase_Timer, Profile_Hook
+from Atlas_Rollup import Rollup_Engine, prune_raw_logs
+from Atlas_Scheduler import Fixed_Rate_Scheduler
+# Replay, derived channels, deadbands, segments and the shared ring are
+# imported in main() only when asked for: several need numpy, and the
+# plain logger on the Pi must run without it
+
+
+# Datalog columns (K1.0 removed, resistivity added)
+LOG_HEADER = [
+    "Time (Y-M-D-H-M-S)",
+    "Time from Start (Seconds)",
+    "Loop Time (Seconds)",
+    "K0.1 #1 Conductivity (µS/cm)",
+    "K0.1 #1 Resistivity (MΩ·cm)",
+    "K0.1 #2 Conductivity (µS/cm)",
+    "K0.1 #2 Resistivity (MΩ·cm)",
+    "K0.1 #3 Conductivity (µS/cm)",
+    "K0.1 #3 Resistivity (MΩ·cm)",
+    "ErrorFlag",
+    "ErrorDetail"
+]
+
+# Loop phases, logged as extra columns with phase_columns. "log" and "print"
+# happen after the row is queued, so their columns hold the previous tick's.
+PHASES = ("read", "i2c_write", "i2c_wait", "i2c_read", "i2c_poll", "metrics",
+          "parse", "resistivity", "log", "print")
+PHASE_HEADER = [f"Phase {phase} (Seconds)" for phase in PHASES]
+
+# The probes logged, as named in an acquisition plan, and their conductivity channels
+PROBE_CHANNELS = ("K0.1 #1", "K0.1 #2", "K0.1 #3")
+CONDUCTIVITY_CHANNELS = LOG_HEADER[3:9:2]
 
 
 def parse_sensor_value(resp: str):
@@ -57,6 +137,20 @@ def parse_sensor_value(resp: str):
         return None, f"exception:{type(e).__name__}:{e}"
 
 
+def reading_value(reading, device):
+    """
+    (value, err) for a structured EZO_Reading, same contract as
+    parse_sensor_value but without building and re-splitting a string.
+    """
+    if reading is None:
+        return None, "no_response"
+    if not reading.ok:
+        return None, device.format_reading(reading)
+    if reading.value is None:
+        return None, f"value_error:rhs={reading.payload.decode('latin-1')!r}"
+    return reading.value, None
+
+
 def to_resistivity_mohm(cond_us_cm: float):
     """
     Convert conductivity (µS/cm) to resistivity (MΩ·cm).
@@ -72,111 +166,342 @@ def to_resistivity_mohm(cond_us_cm: float):
         return None
 
 
-def main():
+def derived_engine(spec=None):
+    """
+    The resistivity of every conductivity channel, plus the derived channels
+    of spec (Atlas_Derived.from_spec entries, or a JSON file of them).
+    Needs numpy (Atlas_Derived).
+    """
+    from Atlas_Derived import Derived_Engine, from_spec, resistivity_mohm
+
+    engine = Derived_Engine()
+    for cond, res in zip(CONDUCTIVITY_CHANNELS, LOG_HEADER[4:10:2]):
+        engine.register(res, [cond], resistivity_mohm)
+    if isinstance(spec, str):
+        with open(spec, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+    if spec:
+        from_spec(spec, engine)
+    unknown = [name for name in engine.sources if name not in CONDUCTIVITY_CHANNELS]
+    if unknown:
+        raise ValueError(f"derived channels read channels that are not logged: {unknown}")
+    return engine
+
+
+def main(filename=None, max_ticks=None, rescan=False,
+         fsync_every_rows=500, fsync_every_s=10.0, rate_hz=1.0, poll=False,
+         buses=None, log_format="csv", rollups=True, retention_days=None,
+         metrics_port=None, phase_columns=False, profile=None, profile_ticks=50,
+         profile_start=0, quarantine_after=3, shared_ring=None, replay=None,
+         replay_speed=1.0, segment_mb=None, segment_hours=None, compress=None, derived=None,
+         plan=None, deadband=None, heartbeat_s=60.0):
+    """
+    Log the K0.1 channels until Ctrl-C.
+
+    filename skips the prompt for the datalog name; max_ticks stops after that
+    many loop iterations (used by Atlas_Bench.py); rescan ignores the cached
+    device manifest and probes the whole I2C bus. fsync_every_rows and
+    fsync_every_s set how often the background writer forces the datalog
+    to the SD card. rate_hz is the sample rate (None runs back to back).
+    poll reads each probe as soon as it is ready instead of sleeping the
+    full LONG_TIMEOUT. buses lists the I2C bus numbers to discover probes
+    on (default: only Atlas_I2C.DEFAULT_BUS); each bus is read on its own
+    thread. log_format "binary" writes the compact Atlas_Binary_Log format instead of CSV.
+    rollups keeps the 10 s / 1 min / 1 h rollup files up to date;
+    retention_days deletes raw datalogs (that have rollups) older than that,
+    at startup and then hourly. metrics_port serves live metrics over HTTP
+    on that port. phase_columns adds the per-phase loop times to every row;
+    profile ("cprofile" or "sample") profiles profile_ticks ticks starting
+    at tick profile_start. quarantine_after is how many failed reads in a
+    row quarantine a probe until it answers again (0 never quarantines).
+    shared_ring publishes every row to the shared memory ring of that name
+    for other processes (Atlas_Shared_Ring.Shared_Ring_Reader). replay
+    reads a recorded datalog instead of the probes, at replay_speed times
+    real time (None or 0: as fast as possible), stamps rows with the
+    recorded times and stops at its end.
+    segment_mb / segment_hours rotate the datalog into numbered segments of
+    that size / time span, and compress ("gz" or "xz") compresses each
+    segment in the background once it is closed. derived adds the derived
+    channels of an Atlas_Derived spec (list or JSON file) as extra columns
+    after the phase columns. plan is an Atlas_Acquisition_Plan config (JSON
+    file) binding the channels "K0.1 #1" .. "K0.1 #3" to probes; without
+    it the first three devices found are used, in bus / address order.
+    deadband ("VALUE" for every probe or "K0.1 #2=VALUE", a list of them, in
+    µS/cm) logs a probe only when its conductivity moves more than that or
+    heartbeat_s seconds have passed; rollups, metrics and the shared ring
+    still get every tick. deadband needs the CSV datalog (ValueError with
+    "binary").
+    """
     # Output filename
-    filename_s = input("Enter Name for Datalog File: ").strip()
-    filename = f"{filename_s}.csv" if filename_s else "datalog.csv"
-
-    # Discover devices on I2C
-    device_list = Config_AtlasI2C.get_devices()
-    if not device_list:
-        print("No I2C devices found. Exiting.")
-        return
-
-    # Initialize CSV with extended header (K1.0 removed, resistivity added)
-    with open(filename, "w", newline="") as data_csv:
-        csv_writer = csv.writer(data_csv, delimiter=";")
-        csv_writer.writerow([
-            "Time (Y-M-D-H-M-S)",
-            "Time from Start (Seconds)",
-            "Loop Time (Seconds)",
-            "K0.1 #1 Conductivity (µS/cm)",
-            "K0.1 #1 Resistivity (MΩ·cm)",
-            "K0.1 #2 Conductivity (µS/cm)",
-            "K0.1 #2 Resistivity (MΩ·cm)",
-            "K0.1 #3 Conductivity (µS/cm)",
-            "K0.1 #3 Resistivity (MΩ·cm)",
-            "ErrorFlag",
-            "ErrorDetail"
-        ])
+    binary = log_format == "binary"
+    if binary and deadband is not None:
+        raise ValueError("deadband logging needs the CSV datalog (held values are empty cells)")
+    if filename is None:
+        filename_s = input("Enter Name for Datalog File: ").strip()
+        suffix = ".bin" if binary else ".csv"
+        filename = f"{filename_s}{suffix}" if filename_s else f"datalog{suffix}"
+
+    # Device index of each of PROBE_CHANNELS; by position unless a plan binds them
+    slots = [0, 1, 2]
+    acquisition_plan = None
+    replay_finished = ()  # the exception that ends a replay, nothing to catch otherwise
+    if replay is not None:
+        from Atlas_Replay import Replay_Finished, Replay_Source
+
+        # A recorded log stands in for the bus and paces the loop itself
+        replay_finished = Replay_Finished
+        reader = Replay_Source(replay, speed=replay_speed, channels=PROBE_CHANNELS)
+        device_list = reader.devices
+        rate_hz = None
+        quarantine_after = 0
+        print(f"Replaying {replay} at " + (f"{replay_speed:g}x" if replay_speed else "full speed"))
+    else:
+        # Discover devices on I2C
+        device_list = Config_AtlasI2C.get_devices(rescan=rescan, buses=buses)
+        if not device_list:
+            print("No I2C devices found. Exiting.")
+            return
+        if plan is not None:
+            acquisition_plan = load_plan(plan, device_list)
+            Config_AtlasI2C.close_devices([dev for dev in device_list if dev not in acquisition_plan.devices])
+            device_list = acquisition_plan.devices
+            slots = [acquisition_plan.index(channel) for channel in PROBE_CHANNELS]
+            print(f"Acquisition plan {plan}:")
+            for line in acquisition_plan.describe():
+                print(f"  {line}")
+        reader = Multi_Bus_Reader(device_list, poll=poll, plan=acquisition_plan)
+
+    def breaker_changed(breaker, old, new):
+        info = breaker.device.get_device_info()
+        if new == "open":
+            print(f">> WARNING: {info} quarantined after {breaker.failures} failed reads ({breaker.last_fault})")
+        elif new == "closed":
+            print(f">> {info} reinstated")
+
+    breakers = attach_breakers(device_list, failure_threshold=quarantine_after,
+                               on_change=breaker_changed) if quarantine_after else []
+
+    # The configured extras, one vectorized pass per tick (resistivity
+    # itself needs no engine)
+    engine = derived_engine(derived) if derived else None
+    extra_names = [name for name in engine.names if name not in LOG_HEADER] if engine is not None else []
+    extra_header = PHASE_HEADER if phase_columns else []
+    extra_header = extra_header + extra_names
+
+    # Change-driven logging of the probes (the resistivity follows its conductivity)
+    if deadband is not None:
+        from Atlas_Deadband import HELD_COLUMN, Deadband_Filter, Segment_Fill_Sink, parse_deadbands
+
+        band = Deadband_Filter(parse_deadbands([deadband] if isinstance(deadband, (str, float, int)) else deadband,
+                                               CONDUCTIVITY_CHANNELS), heartbeat_s=heartbeat_s)
+        band_state = {"error": None}
+        print("Deadband logging: " + ", ".join(f"{name} ±{b:g}" for name, b in zip(PROBE_CHANNELS, band.deadbands))
+              + (f", heartbeat {heartbeat_s:g} s" if heartbeat_s else ""))
+    else:
+        band = None
+
+    # Ticks land on an exact grid; times in the log are grid times so the
+    # post-processing gets a uniform time base
+    scheduler = Fixed_Rate_Scheduler(rate_hz, max_ticks=max_ticks)
+    subsecond = scheduler.period < 1.0
+    time_format = "%Y-%m-%d %H:%M:%S.%f" if subsecond else "%Y-%m-%d %H:%M:%S"
+    time_elapsed_start = datetime.datetime.now()
+
+    # Initialize the datalog (K1.0 removed, resistivity added).
+    # The file stays open for the run; rows are written on a background thread.
+    if binary:
+        # Loop time is kept as a channel so the CSV export matches LOG_HEADER
+        probe_addresses = [device_list[slot].address for slot in slots if slot < len(device_list)] + [None] * 3
+        addresses = [None] + [probe_addresses[i // 2] for i in range(6)]
+        channels = LOG_HEADER[2:-2] + extra_header
+        addresses = addresses + [None] * len(extra_header)
+
+        def make_sink(path):
+            return Binary_Log_Sink(path, channels, addresses,
+                                   start_time=time_elapsed_start.timestamp(),
+                                   extra={"period": scheduler.period})
+    elif band is not None:
+        # A segment's first row is written in full, so every segment of a
+        # rotating log loads on its own
+        last_written = {}
+
+        def make_sink(path):
+            return Segment_Fill_Sink(CSV_Sink(path, LOG_HEADER + extra_header + [HELD_COLUMN]),
+                                     range(3, 9), last_written)
+    else:
+        def make_sink(path):
+            return CSV_Sink(path, LOG_HEADER + extra_header)
+    if segment_mb or segment_hours or compress:
+        from Atlas_Segmented_Log import Rotating_Sink, binary_row_time, csv_row_time
+
+        # Numbered segments, compressed as they close, with an index of
+        # their time ranges (<name>.index.json)
+        sink = Rotating_Sink(filename, make_sink,
+                             max_bytes=int(segment_mb * 2**20) if segment_mb else None,
+                             max_seconds=segment_hours * 3600.0 if segment_hours else None,
+                             compression=compress,
+                             time_of=binary_row_time if binary else csv_row_time)
+        print(f"Writing segments of {filename}, index {sink.index.path}")
+    else:
+        sink = make_sink(filename)
+    writer = Background_Writer(
+        sink,
+        fsync_every_rows=fsync_every_rows,
+        fsync_every_s=fsync_every_s,
+    )
+    rollup = Rollup_Engine(filename, LOG_HEADER[3:-2]) if rollups else None
+
+    log_dir = os.path.dirname(os.path.abspath(filename))
+
+    metrics = Metrics_Registry(LOG_HEADER[3:-2]) if metrics_port is not None else None
+    metrics_server = Metrics_Server(metrics, port=metrics_port) if metrics is not None else None
+    if metrics_server is not None:
+        print(f"Metrics on http://0.0.0.0:{metrics_server.port}/metrics")
+
+    # Live samples for other processes (same channels as the binary log)
+    ring = None
+    if shared_ring:
+        from Atlas_Shared_Ring import Shared_Ring_Writer
+
+        ring = Shared_Ring_Writer(shared_ring, LOG_HEADER[2:-2] + extra_header,
+                                  extra={"period": scheduler.period, "datalog": filename})
+        print(f"Publishing samples to shared memory ring '{shared_ring}'")
+
+    timer = Phase_Timer()
+    previous_tail = {}  # "log" and "print" of the previous tick
+    hook = Profile_Hook(profile, ticks=profile_ticks, start_tick=profile_start,
+                        output=os.path.splitext(filename)[0] + (".prof" if profile == "cprofile" else ".folded")
+                        ) if profile else None
+
+    def prune():
+        for path in prune_raw_logs(log_dir, retention_days, keep=[filename]):
+            print(f">> Retention: removed {path}")
+
+    def log_row(now, time_elapsed_overall, loop_time, values, error_detail="", error_channels=None, extras=None):
+        """
+        Queue one row; values holds the six channel values (None = missing).
+        error_channels are the indices into values the error is about
+        (default: every missing value). extras are the extra derived values.
+        """
+        if rollup is not None:
+            rollup.add(now.timestamp(), values)
+        if metrics is not None:
+            metrics.observe_row(values, error_detail)
+            metrics.observe_loop(loop_time)
+            metrics.set_gauge("writer_queue_depth", writer.queue_depth())
+            metrics.set_gauge("writer_rows_dropped", writer.stats()["rows_dropped"])
+            metrics.set_gauge("ticks_missed", scheduler.ticks_missed)
+            metrics.set_gauge("devices_quarantined", sum(b.quarantined for b in breakers))
+            metrics.publish()
+        tail = ([timer.last.get(p, previous_tail.get(p)) for p in PHASES]
+                if phase_columns else [])
+        tail = tail + (extras or [None] * len(extra_names))
+        if binary or ring is not None:
+            error_bits = 0
+            if error_detail:
+                if error_channels is None:
+                    error_channels = [i for i, v in enumerate(values) if v is None]
+                for i in error_channels:
+                    error_bits |= 1 << (i + 1)
+            if ring is not None:
+                ring.write(now.timestamp(), [loop_time] + values + tail, error_bits)
+        if band is not None:
+            kept = band.offer(now.timestamp(), values[0::2], force=error_detail != band_state["error"])
+            if kept is None:
+                return
+            band_state["error"] = error_detail
+            mask, held = kept
+        if binary:
+            writer.write((now.timestamp(), [loop_time] + values + tail, error_bits))
+            return
+        stamp = now.strftime(time_format)
+        if band is None:
+            cells = ["" if v is None else v for v in values]
+        else:
+            # empty = held at the last written value, "nan" = missing
+            cells = ["" if not mask[i // 2] else "nan" if v is None else v for i, v in enumerate(values)]
+        writer.write(
+            [stamp[:-3] if subsecond else stamp, time_elapsed_overall, loop_time]
+            + cells
+            + [1 if error_detail else 0, error_detail]
+            + ["" if v is None else v for v in tail]
+            + ([held] if band is not None else [])
+        )
 
     # Start timing
-    time_elapsed_start = time()
+    prune()
+    next_prune = 3600.0
+    scheduler.start()
 
     try:
-        while True:
+        for tick in scheduler:
+            if hook is not None:
+                hook.tick(tick.index)
+            timer.begin()
             loop_time_start = time()
-            now = datetime.datetime.now()
-
-            # Read from all devices
-            readings = read_recieve_all(device_list)
+            now = time_elapsed_start + datetime.timedelta(seconds=tick.offset)
+            time_elapsed_overall = tick.offset
+            if tick.missed:
+                print(f">> WARNING: loop overran, skipped {tick.missed} tick(s)")
+            if retention_days is not None and time_elapsed_overall >= next_prune:
+                prune()
+                next_prune += 3600.0
+                timer.skip()
+
+            # Read from all devices, every bus in parallel. Free running (and
+            # replaying) the next cycle is due at once, so leave the queue gap
+            # to the workers instead of giving them none
+            bus_tick = reader.read_all(idle_until=scheduler.next_deadline() if rate_hz else None)
+            readings = bus_tick.readings
+            if replay is not None:
+                # stamp replayed rows with the recording's time, not the replay's
+                now = reader.tick_time or now
+                time_elapsed_overall = reader.tick_elapsed
+            timer.lap("read")
+            for phase, seconds in bus_tick.phases.items():
+                timer.add(phase, seconds)
+            if metrics is not None:
+                for dev, read_time in zip(device_list, bus_tick.read_times):
+                    if read_time is not None:
+                        metrics.observe_read(dev.get_device_info(), read_time - bus_tick.started)
+                timer.lap("metrics")
 
             # Guard: ensure we have at least 3 responses for the three K0.1 channels
             if not isinstance(readings, list) or len(readings) < 3:
-                time_elapsed_overall = time() - time_elapsed_start
                 loop_time = time() - loop_time_start
-                with open(filename, "a", newline="") as data_csv:
-                    csv_writer = csv.writer(data_csv, delimiter=";")
-                    csv_writer.writerow([
-                        now.strftime("%Y-%m-%d %H:%M:%S"),
-                        time_elapsed_overall,
-                        loop_time,
-                        "", "", "", "", "", "",
-                        1,
-                        "insufficient_readings"
-                    ])
+                log_row(now, time_elapsed_overall, loop_time, [None] * 6, "insufficient_readings")
                 continue
 
-            # Map indices to channels (adjust if your device order differs)
-            # 0 -> K0.1 #1 Conductivity
-            # 1 -> K0.1 #2 Conductivity
-            # 2 -> K0.1 #3 Conductivity
-            val_k01_1, err_k01_1 = parse_sensor_value(readings[0])
-            val_k01_2, err_k01_2 = parse_sensor_value(readings[1])
-            val_k01_3, err_k01_3 = parse_sensor_value(readings[2])
+            # Map readings to channels: slots[k] is the device of K0.1 #k+1
+            val_k01_1, err_k01_1 = reading_value(readings[slots[0]], device_list[slots[0]])
+            val_k01_2, err_k01_2 = reading_value(readings[slots[1]], device_list[slots[1]])
+            val_k01_3, err_k01_3 = reading_value(readings[slots[2]], device_list[slots[2]])
 
+            # A failed probe only blanks its own two columns; ErrorDetail
+            # carries its error code ("Error EC 107 ...: nack", "...: 254")
             errors = [e for e in [err_k01_1, err_k01_2, err_k01_3] if e]
-            have_error = len(errors) > 0
+            error_channels = [c for k, e in enumerate([err_k01_1, err_k01_2, err_k01_3]) if e
+                              for c in (2 * k, 2 * k + 1)]
+            timer.lap("parse")
 
-            time_elapsed_overall = time() - time_elapsed_start
             loop_time = time() - loop_time_start
 
-            # Compute resistivities (only if not in error)
-            if not have_error:
-                res_k01_1 = to_resistivity_mohm(val_k01_1)
-                res_k01_2 = to_resistivity_mohm(val_k01_2)
-                res_k01_3 = to_resistivity_mohm(val_k01_3)
-            else:
-                res_k01_1 = res_k01_2 = res_k01_3 = None
-
-            # Write CSV row
-            with open(filename, "a", newline="") as data_csv:
-                csv_writer = csv.writer(data_csv, delimiter=";")
-                if have_error:
-                    csv_writer.writerow([
-                        now.strftime("%Y-%m-%d %H:%M:%S"),
-                        time_elapsed_overall,
-                        loop_time,
-                        "", "", "", "", "", "",
-                        1,
-                        "; ".join(errors)
-                    ])
-                    # Skip this iteration; try again next timestep
-                    continue
-                else:
-                    csv_writer.writerow([
-                        now.strftime("%Y-%m-%d %H:%M:%S"),
-                        time_elapsed_overall,
-                        loop_time,
-                        val_k01_1,
-                        "" if res_k01_1 is None else res_k01_1,
-                        val_k01_2,
-                        "" if res_k01_2 is None else res_k01_2,
-                        val_k01_3,
-                        "" if res_k01_3 is None else res_k01_3,
-                        0,
-                        ""
-                    ])
+            # Compute resistivities (only if not in error), then any extra
+            # derived channels
+            res_k01_1 = to_resistivity_mohm(val_k01_1)
+            res_k01_2 = to_resistivity_mohm(val_k01_2)
+            res_k01_3 = to_resistivity_mohm(val_k01_3)
+            extras = None
+            if engine is not None:
+                derived_values = engine.evaluate_row(dict(zip(CONDUCTIVITY_CHANNELS, [val_k01_1, val_k01_2, val_k01_3])))
+                extras = [derived_values[name] for name in extra_names]
+            timer.lap("resistivity")
+
+            # Queue datalog row
+            log_row(now, time_elapsed_overall, loop_time,
+                    [val_k01_1, res_k01_1, val_k01_2, res_k01_2, val_k01_3, res_k01_3],
+                    "; ".join(errors), error_channels, extras)
+            timer.lap("log")
 
             # Optional console output for monitoring
             def fmt(v):
@@ -185,14 +510,112 @@ def main():
             print(
                 f"{now.strftime('%H:%M:%S')} | "
                 f"t={time_elapsed_overall:.1f}s | loop={loop_time:.3f}s | "
+                f"q={writer.queue_depth()} | "
                 f"K0.1#1={fmt(val_k01_1)} µS/cm (R={fmt(res_k01_1)} MΩ·cm), "
                 f"K0.1#2={fmt(val_k01_2)} µS/cm (R={fmt(res_k01_2)} MΩ·cm), "
                 f"K0.1#3={fmt(val_k01_3)} µS/cm (R={fmt(res_k01_3)} MΩ·cm)"
             )
+            timer.lap("print")
+            previous_tail["log"] = timer.last["log"]
+            previous_tail["print"] = timer.last["print"]
 
+    except replay_finished:
+        print(f"Replay finished after {reader.ticks} ticks")
     except KeyboardInterrupt:
         print("Data Logging Stopped By User")
+    finally:
+        if hook is not None:
+            hook.close()
+        reader.close()
+        close_breakers(device_list)
+        writer.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if rollup is not None:
+            rollup.close()
+        if ring is not None:
+            ring.close()
+        stats = writer.stats()
+        print(
+            f"Datalog {filename}: {stats['rows_written']} rows written, "
+            f"{stats['rows_dropped']} dropped"
+            + (f", last error: {stats['last_error']}" if stats["last_error"] else "")
+        )
+        sched = scheduler.stats()
+        print(
+            f"Scheduler: {sched['ticks_fired']} ticks, {sched['ticks_missed']} missed, "
+            f"{sched['ticks_late']} late (max {sched['max_lateness_s'] * 1000:.1f} ms)"
+        )
+        if band is not None:
+            kept = band.stats()
+            print(f"Deadband: {kept['rows_out']} of {kept['ticks_in']} ticks written, {kept['cells_held']} cells held")
+        print(timer.report())
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Log Atlas EZO conductivity probes to CSV")
+    parser.add_argument("--file", help="datalog name (prompted for when omitted)")
+    parser.add_argument("--rescan", action="store_true",
+                        help="ignore the cached device manifest and scan the whole I2C bus")
+    parser.add_argument("--fsync-rows", type=int, default=500,
+                        help="fsync the datalog after this many rows")
+    parser.add_argument("--fsync-seconds", type=float, default=10.0,
+                        help="fsync the datalog at least this often")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="samples per second (0 runs back to back as fast as the probes allow)")
+    parser.add_argument("--poll", action="store_true",
+                        help="read each probe as soon as it is ready instead of after the fixed timeout")
+    parser.add_argument("--bus", type=int, action="append", dest="buses",
+                        help="I2C bus to use, repeat for several (default: bus 1 only)")
+    parser.add_argument("--binary", action="store_true",
+                        help="write the compact binary log (export with Atlas_Binary_Log.py)")
+    parser.add_argument("--no-rollups", action="store_true",
+                        help="do not keep the 10 s / 1 min / 1 h rollup files")
+    parser.add_argument("--retention-days", type=float,
+                        help="delete raw datalogs older than this many days (their rollups are kept)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on this port (/metrics, /metrics.json)")
+    parser.add_argument("--phase-columns", action="store_true",
+                        help="log the time spent in each loop phase as extra columns")
+    parser.add_argument("--profile", choices=("cprofile", "sample"),
+                        help="profile a window of ticks with cProfile or the sampling profiler")
+    parser.add_argument("--profile-ticks", type=int, default=50,
+                        help="ticks to profile (default 50)")
+    parser.add_argument("--profile-start", type=int, default=0,
+                        help="tick to start profiling at (default 0)")
+    parser.add_argument("--quarantine-after", type=int, default=3,
+                        help="failed reads in a row before a probe is quarantined (0 = never)")
+    parser.add_argument("--shared-ring", nargs="?", const="atlas", metavar="NAME",
+                        help="publish samples to a shared memory ring (default name: atlas)")
+    parser.add_argument("--replay", metavar="DATALOG",
+                        help="replay a recorded datalog instead of reading the probes")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="replay speed, times real time (0 = as fast as possible)")
+    parser.add_argument("--segment-mb", type=float,
+                        help="start a new datalog segment after this many MB")
+    parser.add_argument("--segment-hours", type=float,
+                        help="start a new datalog segment every this many hours")
+    parser.add_argument("--compress", choices=("gz", "xz"),
+                        help="compress each datalog segment once it is closed")
+    parser.add_argument("--plan", metavar="CONFIG",
+                        help="JSON acquisition plan binding K0.1 #1..#3 to probes by address or name")
+    parser.add_argument("--deadband", action="append", metavar="[PROBE=]USCM",
+                        help="log a probe only when it moves more than this (µS/cm), e.g. 0.02 or 'K0.1 #3=0.05'")
+    parser.add_argument("--heartbeat", type=float, default=60.0,
+                        help="with --deadband, log every probe at least this often, seconds (0 = never)")
+    parser.add_argument("--derived", metavar="CONFIG",
+                        help="JSON list of extra derived channels to log (see Atlas_Derived.from_spec)")
+    args = parser.parse_args()
+    if args.deadband and args.binary:
+        parser.error("--deadband writes the CSV datalog, it cannot be used with --binary")
+    main(filename=args.file, rescan=args.rescan,
+         fsync_every_rows=args.fsync_rows, fsync_every_s=args.fsync_seconds,
+         rate_hz=args.rate or None, poll=args.poll, buses=args.buses,
+         log_format="binary" if args.binary else "csv",
+         rollups=not args.no_rollups, retention_days=args.retention_days,
+         metrics_port=args.metrics_port, phase_columns=args.phase_columns,
+         profile=args.profile, profile_ticks=args.profile_ticks, profile_start=args.profile_start,
+         quarantine_after=args.quarantine_after, shared_ring=args.shared_ring,
+         replay=args.replay, replay_speed=args.replay_speed or None,
+         segment_mb=args.segment_mb, segment_hours=args.segment_hours, compress=args.compress,
+         derived=args.derived, plan=args.plan, deadband=args.deadband, heartbeat_s=args.heartbeat or None)
@@ -0,0 +1,197 @@
+"""
+Atlas_Data_Writer.py
+
+Datalog output that stays off the acquisition thread.
+
+- CSV_Sink holds the log file open for the whole run and owns one csv.writer
+- Background_Writer takes rows through a bounded queue and writes them on its
+  own thread in batches. Rows are flushed to the OS after every batch and
+  fsync'd to the card every fsync_every_rows rows or fsync_every_s seconds,
+  whichever comes first (either can be None to disable it)
+- When storage stalls long enough for the queue to fill, write() drops the
+  row and counts it instead of blocking the next "R" command
+
+Usage:
+
+    with Background_Writer(CSV_Sink("run.csv", header)) as writer:
+        writer.write(row)
+    print(writer.stats())
+"""
+
+import csv
+import os
+import queue
+import threading
+from time import monotonic
+
+_STOP = object()
+
+
+class CSV_Sink:
+    """
+    A log file opened once, written through a single csv.writer.
+
+    mode "w" starts a new file and writes header; mode "a" appends and only
+    writes header if the file was empty.
+    """
+
+    def __init__(self, path, header=None, delimiter=";", mode="w", encoding=None):
+        self.path = path
+        self._file = open(path, mode, newline="", encoding=encoding)
+        self._writer = csv.writer(self._file, delimiter=delimiter)
+        if header and (mode == "w" or self._file.tell() == 0):
+            self._writer.writerow(header)
+            self._file.flush()
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+
+    def flush(self):
+        self._file.flush()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+class Background_Writer:
+    """
+    Bounded queue in front of a sink, drained by a daemon thread.
+
+    The sink needs write_rows(rows), flush(), sync() and close().
+    """
+
+    def __init__(self, sink, max_queue=4096, batch_size=256,
+                 fsync_every_rows=500, fsync_every_s=10.0):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.fsync_every_rows = fsync_every_rows
+        self.fsync_every_s = fsync_every_s
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._rows_written = 0
+        self._rows_dropped = 0  # only touched by the producer
+        self._rows_failed = 0   # only touched by the writer thread
+        self._syncs = 0
+        self._last_error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="atlas-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # ---- producer side (acquisition thread) ----------------------------------
+    def write(self, row):
+        """
+        Queue one row. Never blocks: returns False and counts the row as
+        dropped when the queue is full or the writer is closed.
+        """
+        if self._closed:
+            self._rows_dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self._rows_dropped += 1
+            return False
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "rows_written": self._rows_written,
+            "rows_dropped": self._rows_dropped + self._rows_failed,
+            "syncs": self._syncs,
+            "last_error": self._last_error,
+        }
+
+    def close(self, timeout=None):
+        """
+        Write everything still queued, fsync and close the sink.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        # the queue may be full: wait for room only while the writer thread
+        # is there to make it, so closing can never hang the caller
+        while self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
+
+    # ---- consumer side (writer thread) ---------------------------------------
+    def _sync_due(self, rows_since_sync, last_sync):
+        if not rows_since_sync:
+            return False
+        if self.fsync_every_rows is not None and rows_since_sync >= self.fsync_every_rows:
+            return True
+        if self.fsync_every_s is not None and monotonic() - last_sync >= self.fsync_every_s:
+            return True
+        return False
+
+    def _next_wait(self, rows_since_sync, last_sync):
+        if not rows_since_sync or self.fsync_every_s is None:
+            return None
+        return max(0.0, self.fsync_every_s - (monotonic() - last_sync))
+
+    def _run(self):
+        rows_since_sync = 0
+        last_sync = monotonic()
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self._next_wait(rows_since_sync, last_sync))
+            except queue.Empty:
+                item = None
+
+            batch = []
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            try:
+                if batch:
+                    self.sink.write_rows(batch)
+                    self.sink.flush()
+                    self._rows_written += len(batch)
+                    rows_since_sync += len(batch)
+                if self._sync_due(rows_since_sync, last_sync):
+                    self.sink.sync()
+                    self._syncs += 1
+                    rows_since_sync = 0
+                    last_sync = monotonic()
+            except Exception as e:
+                # any sink error (OSError, csv.Error, struct.error, a bad row) loses
+                # this batch only, the thread keeps draining the queue
+                self._rows_failed += len(batch)
+                self._last_error = f"{type(e).__name__}: {e}"
+
+        try:
+            self.sink.close()
+            self._syncs += 1
+        except Exception as e:
+            self._last_error = f"{type(e).__name__}: {e}"
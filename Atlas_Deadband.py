@@ -0,0 +1,161 @@
+"""
+Atlas_Deadband.py
+
+Change-driven logging: a channel's value is written only when it has moved
+beyond its deadband since the value last written, or when its heartbeat
+interval has passed, so long stable runs stop filling the SD card with
+repeats while transients keep every sample.
+
+- Deadband_Filter decides, per tick, which channels to write; bands are
+  absolute (in the channel's unit) and compared with the last written value,
+  not the last sample, so a slow drift is written once it adds up to a band
+- A channel going missing (None / NaN) or coming back is always a change
+- A tick with no channel to write is held back entirely; the next written
+  row says how many ticks were held before it ("Ticks Held"), so the full
+  tick grid can be rebuilt from the row times
+- In a deadband CSV a held cell is left empty and a missing value is written
+  as "nan"; Atlas_Log_Loader sees the "Ticks Held" column and forward-fills
+  the empty cells with the last written value (across chunks), so the loaded
+  channels are the step function the samples were within a band of
+- A rotating deadband CSV (Atlas_Segmented_Log) wraps each segment's sink in
+  a Segment_Fill_Sink, which writes the first row of every segment in full,
+  so each segment loads on its own
+- CSV only: the binary log has no empty cell to mark a held value with
+
+Usage:
+
+    band = Deadband_Filter([0.02, 0.02, 0.05], heartbeat_s=60)
+    kept = band.offer(t, [16.88, 11.61, 2.89])
+    if kept is not None:
+        mask, ticks_held = kept        # mask[i]: write channel i
+
+    last = {}
+    make_sink = lambda path: Segment_Fill_Sink(CSV_Sink(path, header), range(3, 9), last)
+"""
+
+import math
+
+# Column of a deadband CSV saying how many ticks were held before the row
+# (Atlas_Log_Loader forward-fills the held cells when it sees it)
+HELD_COLUMN = "Ticks Held"
+
+
+class Deadband_Filter:
+    """
+    Per-channel deadband with heartbeat. deadbands holds one band per
+    channel (0 writes every change); heartbeat_s (None for never) forces a
+    channel out when it has not been written for that long.
+    """
+
+    def __init__(self, deadbands, heartbeat_s=60.0):
+        self.deadbands = [0.0 if band is None else float(band) for band in deadbands]
+        self.heartbeat_s = heartbeat_s
+        self._last = [None] * len(self.deadbands)    # last written value (NaN = missing)
+        self._last_t = [None] * len(self.deadbands)
+        self._held = 0
+        self.ticks_in = 0
+        self.rows_out = 0
+        self.cells_held = 0
+
+    def _changed(self, i, t, value):
+        last_t = self._last_t[i]
+        if last_t is None:
+            return True
+        if self.heartbeat_s is not None and t - last_t >= self.heartbeat_s:
+            return True
+        last = self._last[i]
+        if value != value or last != last:
+            # missing now or before: a change unless it was and still is
+            return not (value != value and last != last)
+        return abs(value - last) > self.deadbands[i]
+
+    def offer(self, t, values, force=False):
+        """
+        One tick: t in seconds, one value per channel (None = missing).
+        Returns None when the tick can be held back, else (mask, ticks_held):
+        which values to write and how many ticks were held before this one.
+        force writes the row (mask as usual), e.g. when the error changed.
+        """
+        self.ticks_in += 1
+        values = [math.nan if v is None else v for v in values]
+        mask = [self._changed(i, t, v) for i, v in enumerate(values)]
+        if not force and not any(mask):
+            self._held += 1
+            return None
+        for i, write in enumerate(mask):
+            if write:
+                self._last[i] = values[i]
+                self._last_t[i] = t
+            else:
+                self.cells_held += 1
+        held, self._held = self._held, 0
+        self.rows_out += 1
+        return mask, held
+
+    def stats(self):
+        return {"ticks_in": self.ticks_in, "rows_out": self.rows_out, "cells_held": self.cells_held,
+                "rows_held": self.ticks_in - self.rows_out}
+
+
+class Segment_Fill_Sink:
+    """
+    Sink wrapper for one segment of a rotating deadband CSV. cells are the
+    row indices of the channel cells; last maps them to the last value
+    written and is shared by the segments, so the held (empty) cells of a
+    segment's first row are filled from the segment before.
+    """
+
+    def __init__(self, sink, cells, last):
+        self.sink = sink
+        self.cells = list(cells)
+        self.last = last
+        self._first = True
+
+    @property
+    def path(self):
+        return self.sink.path
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        if self._first:
+            first = list(rows[0])
+            for i in self.cells:
+                if first[i] == "" and i in self.last:
+                    first[i] = self.last[i]
+            rows = [first] + list(rows[1:])
+            self._first = False
+        for row in rows:
+            for i in self.cells:
+                if row[i] != "":
+                    self.last[i] = row[i]
+        self.sink.write_rows(rows)
+
+    def flush(self):
+        self.sink.flush()
+
+    def sync(self):
+        self.sink.sync()
+
+    def close(self):
+        self.sink.close()
+
+
+def parse_deadbands(specs, channels):
+    """
+    Bands per channel from "VALUE" (every channel) and "NAME=VALUE" strings;
+    NAME is matched as a substring of the channel names. Channels no spec
+    names get 0 (written on any change).
+    """
+    bands = [0.0] * len(channels)
+    for spec in specs or []:
+        name, sep, value = str(spec).rpartition("=")
+        if not sep:
+            bands = [float(value)] * len(channels)
+            continue
+        matched = [i for i, channel in enumerate(channels) if name.strip() in channel]
+        if not matched:
+            raise ValueError(f"deadband {spec!r} matches no channel of {channels}")
+        for i in matched:
+            bands[i] = float(value)
+    return bands
@@ -0,0 +1,217 @@
+"""
+Atlas_Derived.py
+
+Derived channels (resistivity, temperature compensation, TDS, deltas between
+probes) declared once and computed in one vectorized NumPy pass.
+
+- A Derived_Engine holds formulas registered against named channels; a
+  formula's inputs are logged channels or derived channels registered
+  before it, so chains (compensate, then convert to TDS) work
+- evaluate() takes a block of ticks as one array per channel and computes
+  every derived channel over the whole block at once: a live tick is a block
+  of one (evaluate_row), a loaded datalog is a block of millions
+  (evaluate_block on an Atlas_Log_Loader.Log_Block)
+- Missing inputs (None, NaN) and invalid ones (a conductivity of 0 has no
+  resistivity) come out as NaN, never as an exception; floating point
+  warnings are silenced for the pass and any inf becomes NaN
+- The standard formulas are plain NumPy functions, listed in FORMULAS by
+  name so an engine can also be built from a config (from_spec)
+
+Usage:
+
+    engine = Derived_Engine()
+    engine.register("K0.1 #1 Resistivity (MΩ·cm)", ["K0.1 #1 Conductivity (µS/cm)"], resistivity_mohm)
+    engine.register("Delta #1-#2 (µS/cm)", ["K0.1 #1 Conductivity (µS/cm)",
+                                            "K0.1 #2 Conductivity (µS/cm)"], difference)
+
+    engine.evaluate_row({"K0.1 #1 Conductivity (µS/cm)": 16.9, ...})   # one tick
+    engine.evaluate_block(load_log("run.csv"))                         # a whole log
+
+    engine = from_spec([{"name": "K0.1 #1 TDS (ppm)", "formula": "tds_ppm",
+                         "inputs": ["K0.1 #1 Conductivity (µS/cm)"], "params": {"factor": 0.5}}])
+"""
+
+import functools
+
+import numpy as np
+
+# Atlas EZO-EC default conductivity to TDS conversion factor
+TDS_FACTOR = 0.54
+# typical temperature coefficient of natural waters, per °C
+ALPHA_25C = 0.02
+
+
+def resistivity_mohm(cond_us_cm):
+    """
+    Resistivity (MΩ·cm) = 1 / Conductivity (µS/cm); NaN where cond <= 0.
+    """
+    return np.where(cond_us_cm > 0, 1.0 / cond_us_cm, np.nan)
+
+
+def compensate_25c(cond_us_cm, temp_c, alpha=ALPHA_25C, reference_c=25.0):
+    """
+    Conductivity referred to reference_c with a linear temperature
+    coefficient: cond / (1 + alpha * (T - reference)).
+    """
+    factor = 1.0 + alpha * (temp_c - reference_c)
+    return np.where(factor > 0, cond_us_cm / factor, np.nan)
+
+
+def cell_constant(cond_us_cm, k_set, k_actual):
+    """
+    Reading taken with the circuit set for cell constant k_set, corrected to
+    the probe's measured constant k_actual.
+    """
+    return cond_us_cm * (k_actual / k_set)
+
+
+def tds_ppm(cond_us_cm, factor=TDS_FACTOR):
+    """
+    Total dissolved solids (ppm) from conductivity (µS/cm).
+    """
+    return np.where(cond_us_cm >= 0, cond_us_cm * factor, np.nan)
+
+
+def difference(a, b):
+    return a - b
+
+
+def ratio(a, b):
+    return a / b
+
+
+FORMULAS = {
+    "resistivity_mohm": resistivity_mohm,
+    "compensate_25c": compensate_25c,
+    "cell_constant": cell_constant,
+    "tds_ppm": tds_ppm,
+    "difference": difference,
+    "ratio": ratio,
+}
+
+
+class Derived_Channel:
+    """
+    One registered formula: name = func(*inputs).
+    """
+
+    __slots__ = ("name", "inputs", "func")
+
+    def __init__(self, name, inputs, func):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.func = func
+
+    def __repr__(self):
+        func = getattr(self.func, "func", self.func)
+        return f"Derived_Channel({self.name!r} = {func.__name__}{self.inputs})"
+
+
+class Derived_Engine:
+    """
+    Derived channels in registration order.
+    """
+
+    def __init__(self):
+        self.channels = []
+        self._names = set()
+
+    def __len__(self):
+        return len(self.channels)
+
+    @property
+    def names(self):
+        return [c.name for c in self.channels]
+
+    @property
+    def sources(self):
+        """
+        The logged channels the formulas read, in order of first use.
+        """
+        seen = []
+        for c in self.channels:
+            for name in c.inputs:
+                if name not in self._names and name not in seen:
+                    seen.append(name)
+        return seen
+
+    def register(self, name, inputs, func, **params):
+        """
+        Add name = func(*inputs, **params). func gets float64 arrays and must
+        work elementwise on them.
+        """
+        if name in self._names:
+            raise ValueError(f"derived channel {name!r} already registered")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        if params:
+            func = functools.partial(func, **params)
+        channel = Derived_Channel(name, inputs, func)
+        self.channels.append(channel)
+        self._names.add(name)
+        return channel
+
+    def channel(self, name, *inputs, **params):
+        """
+        Decorator form of register.
+        """
+        def decorate(func):
+            self.register(name, inputs, func, **params)
+            return func
+        return decorate
+
+    def evaluate(self, columns):
+        """
+        Every derived channel over a block of ticks. columns maps each source
+        channel to its values (sequence or array, None / NaN = missing);
+        returns {name: float64 array} in registration order.
+        """
+        arrays = {}
+        n = None
+        for name in self.sources:
+            try:
+                col = columns[name]
+            except KeyError:
+                raise KeyError(f"no column for derived channel input {name!r}") from None
+            arrays[name] = np.asarray(col, dtype=np.float64)
+            n = len(arrays[name]) if n is None else n
+        out = {}
+        with np.errstate(all="ignore"):
+            for c in self.channels:
+                values = np.asarray(c.func(*(arrays[name] for name in c.inputs)), dtype=np.float64)
+                if n is not None and values.shape != (n,):
+                    values = np.broadcast_to(values, (n,)).copy()
+                values[~np.isfinite(values)] = np.nan
+                arrays[c.name] = out[c.name] = values
+        return out
+
+    def evaluate_row(self, values):
+        """
+        One tick: {source: value or None} -> {derived: float or None}.
+        """
+        out = self.evaluate({name: [values.get(name)] for name in self.sources})
+        return {name: None if col[0] != col[0] else float(col[0]) for name, col in out.items()}
+
+    def evaluate_block(self, block, aliases=None):
+        """
+        Derived channels of a Log_Block. aliases maps an engine source name
+        to the log's column name where they differ (older logs say
+        "Conductivity Reading (uS/cm)").
+        """
+        aliases = aliases or {}
+        return self.evaluate({name: block.channels[aliases.get(name, name)] for name in self.sources})
+
+
+def from_spec(spec, engine=None):
+    """
+    Engine from a list of {"name", "formula" (a FORMULAS key), "inputs",
+    "params" (optional)} entries, as read from a JSON config.
+    """
+    engine = Derived_Engine() if engine is None else engine
+    for entry in spec:
+        try:
+            func = FORMULAS[entry["formula"]]
+        except KeyError:
+            raise ValueError(f"unknown formula {entry.get('formula')!r} for {entry.get('name')!r}") from None
+        engine.register(entry["name"], entry["inputs"], func, **entry.get("params", {}))
+    return engine
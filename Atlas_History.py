@@ -0,0 +1,127 @@
+"""
+Atlas_History.py
+
+Bounded in-memory history of the logged channels, for the checks that look
+back over recent readings, in flat memory however long the run.
+
+- History_Store preallocates one array('d') ring per channel (plus one for
+  the times) at a fixed capacity, so a multi-week run on the Pi uses the same
+  memory on day 20 as in minute 1 and holds plain doubles, not boxed floats
+- append is O(1): every sample is stored twice, at slot i and i + capacity
+  (as in Atlas_Shared_Ring), so the last N samples of a channel are always
+  one contiguous, zero-copy memoryview (numpy.asarray takes it as is)
+- Optional spill: before a block of samples is overwritten it is written to
+  a binary datalog (Atlas_Binary_Log, or any sink with write_rows), so
+  nothing falls off the end; close() spills whatever is still in memory
+- Standard library only, like the logger itself
+
+Usage:
+
+    history = History_Store(["K0.1 #1", "K0.1 #2"], capacity=3600)
+    history.append(t, [16.88, 11.61])
+    history.last("K0.1 #1")          # 16.88
+    history.latest("K0.1 #1", 60)    # memoryview of the last 60 values
+    history.times(60)
+    history.close()
+"""
+
+import math
+from array import array
+
+from Atlas_Binary_Log import Binary_Log_Sink
+
+
+class History_Store:
+    """
+    The last `capacity` samples of every channel. spill is a path (a binary
+    log is created there) or a sink with write_rows((t, values, 0) rows);
+    spill_block samples are spilled at a time (default capacity / 4).
+    """
+
+    def __init__(self, channels, capacity=86_400, spill=None, spill_block=None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.channels = list(channels)
+        self.capacity = capacity
+        self._index = {name: i for i, name in enumerate(self.channels)}
+        slots = 2 * capacity
+        self._times = array("d", [math.nan]) * slots
+        self._values = [array("d", [math.nan]) * slots for _ in self.channels]
+        self._times_view = memoryview(self._times).toreadonly()
+        self._value_views = [memoryview(col).toreadonly() for col in self._values]
+        self.total = 0
+        self._owns_spill = isinstance(spill, str)
+        self._spill = Binary_Log_Sink(spill, self.channels) if self._owns_spill else spill
+        self.spill_block = min(spill_block or max(1, capacity // 4), capacity)
+        self.spilled = 0
+
+    def __len__(self):
+        """
+        Samples held (at most capacity).
+        """
+        return min(self.total, self.capacity)
+
+    def append(self, t, values):
+        """
+        One sample per channel at time t (None = missing, stored as NaN).
+        """
+        if self._spill is not None and self.total - self.spilled >= self.capacity:
+            self._spill_oldest(self.spill_block)
+        slot = self.total % self.capacity
+        mirror = slot + self.capacity
+        self._times[slot] = self._times[mirror] = t
+        for col, v in zip(self._values, values):
+            col[slot] = col[mirror] = math.nan if v is None else v
+        self.total += 1
+
+    def _window(self, n):
+        count = len(self) if n is None else min(n, len(self))
+        end = self.total % self.capacity + self.capacity
+        return slice(end - count, end)
+
+    def latest(self, name, n=None):
+        """
+        The last n values of a channel (default all held), oldest first, as
+        a read-only memoryview into the ring.
+        """
+        return self._value_views[self._index[name]][self._window(n)]
+
+    def times(self, n=None):
+        return self._times_view[self._window(n)]
+
+    def last(self, name):
+        """
+        The newest value of a channel.
+        """
+        if not self.total:
+            raise IndexError("history is empty")
+        return self._values[self._index[name]][(self.total - 1) % self.capacity]
+
+    def _spill_oldest(self, count):
+        count = min(count, self.total - self.spilled)
+        if count <= 0:
+            return
+        # mirrored, so the unspilled samples are contiguous from here
+        start = self.spilled % self.capacity
+        self._spill.write_rows([(self._times[i], [col[i] for col in self._values], 0)
+                                for i in range(start, start + count)])
+        self.spilled += count
+
+    def close(self):
+        """
+        Spill the samples still only in memory, and close a spill file
+        opened here.
+        """
+        if self._spill is None:
+            return
+        self._spill_oldest(self.total - self.spilled)
+        if self._owns_spill:
+            self._spill.close()
+        self._spill = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,151 @@
+"""
+Atlas_I2C_Async.py
+
+asyncio front end for Atlas_I2C_Driver_JQ.
+
+- Async_Atlas_I2C wraps an ordinary Atlas_I2C (same transport, timeouts and
+  learned conversion times), so the blocking API stays available on the
+  wrapped device and scripts that use it keep working unchanged
+- await dev.query(command) writes, awaits the EZO timeout (or polls for
+  readiness with poll=True) and reads, without blocking the event loop, so
+  long "R" / "Cal" waits on many boards overlap on one thread and a UI or
+  housekeeping coroutines keep running alongside acquisition
+- A per-address lock is held for the whole write/wait/read transaction, so
+  two coroutines can never interleave commands to one board, and a per-bus
+  lock is held around each bus transfer
+- read_recieve_all / query_all are the async counterparts of the driver's
+  module functions
+
+Usage:
+
+    device_list = wrap_devices(Config_AtlasI2C.get_devices())
+
+    async def main():
+        readings = await read_recieve_all(device_list)
+        status = await device_list[0].query("Status")
+
+    asyncio.run(main())
+"""
+
+import asyncio
+import time
+import weakref
+
+# event loop -> {lock key: asyncio.Lock}; locks are tied to the loop that made them
+_loop_locks = weakref.WeakKeyDictionary()
+
+
+def _lock(key):
+    table = _loop_locks.setdefault(asyncio.get_running_loop(), {})
+    lock = table.get(key)
+    if lock is None:
+        lock = table[key] = asyncio.Lock()
+    return lock
+
+
+def bus_lock(bus):
+    """
+    Lock held around every transfer on one I2C bus.
+    """
+    return _lock(("bus", bus))
+
+
+def address_lock(bus, address):
+    """
+    Lock held for a whole write/wait/read transaction with one board.
+    """
+    return _lock(("address", bus, address))
+
+
+class Async_Atlas_I2C:
+    """
+    Awaitable commands for one Atlas_I2C. Anything not defined here (name,
+    address, get_command_timeout, format_reading, ...) is read from the
+    wrapped device.
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def __repr__(self):
+        return f"Async_Atlas_I2C({self.device.get_device_info()})"
+
+    def transaction(self):
+        """
+        async with dev.transaction(): ...  to hold the board for several
+        writes and reads of your own.
+        """
+        return address_lock(self.device.bus, self.device.address)
+
+    async def write(self, command):
+        async with bus_lock(self.device.bus):
+            self.device.write(command)
+
+    async def read_reading(self, num_of_bytes=31):
+        async with bus_lock(self.device.bus):
+            return self.device.read_reading(num_of_bytes)
+
+    async def read(self, num_of_bytes=31):
+        return self.device.format_reading(await self.read_reading(num_of_bytes))
+
+    async def _poll_ready(self, command, sent_at, deadline=None):
+        dev = self.device
+        hard_deadline = sent_at + (dev.POLL_DEADLINE if deadline is None else deadline)
+        await asyncio.sleep(dev.first_poll_delay(command))
+        interval = dev.POLL_INTERVAL
+        while True:
+            reading = await self.read_reading()
+            if reading.status != dev.STATUS_PENDING:
+                dev.record_ready_time(command, reading.read_time - sent_at)
+                return reading
+            if reading.read_time >= hard_deadline:
+                return reading
+            await asyncio.sleep(min(interval, hard_deadline - reading.read_time))
+            interval = min(interval * dev.POLL_BACKOFF, dev.POLL_MAX_INTERVAL)
+
+    async def query(self, command, poll=False, structured=False):
+        """
+        Write a command, await the correct timeout (or readiness with
+        poll=True) and read the response. Returns the "Success ..." /
+        "Error ..." string, or the EZO_Reading with structured=True
+        ("sleep mode" / None after a Sleep command).
+        """
+        dev = self.device
+        async with self.transaction():
+            await self.write(command)
+            sent_at = time.monotonic()
+            timeout = dev.get_command_timeout(command)
+            if not timeout:
+                return None if structured else "sleep mode"
+            if poll:
+                reading = await self._poll_ready(command, sent_at)
+            else:
+                await asyncio.sleep(timeout)
+                reading = await self.read_reading()
+        return reading if structured else dev.format_reading(reading)
+
+
+def wrap_devices(device_list):
+    """
+    Async_Atlas_I2C for every device (devices already wrapped are kept).
+    """
+    return [dev if isinstance(dev, Async_Atlas_I2C) else Async_Atlas_I2C(dev) for dev in device_list]
+
+
+async def query_all(device_list, command, poll=False, structured=False):
+    """
+    The same command to every board at once; the waits overlap, so N boards
+    cost one timeout.
+    """
+    return list(await asyncio.gather(*(dev.query(command, poll=poll, structured=structured)
+                                       for dev in wrap_devices(device_list))))
+
+
+async def read_recieve_all(device_list, poll=False, structured=False):
+    """
+    "R" on every board; the async counterpart of the driver's read_recieve_all.
+    """
+    return await query_all(device_list, "R", poll=poll, structured=structured)
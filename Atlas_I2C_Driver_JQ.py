@@ -23,33 +23,241 @@ from serial import SerialException
 import io
 import fcntl
 import copy
+import glob
+import heapq
+import json
 import string
+import threading
 
 ###################################################################################################################################################
 # Class Definition - Atlas_I2C
 #       Atlas_I2C
 
-def read_recieve_all(device_list):
+def timeout_classes(device_list, command="R"):
+    '''
+    group the boards in "device_list" by how long "command" takes on them: a list of (timeout, [indices into device_list]),
+    fastest first. a timeout of None means the command puts the boards to sleep
+    '''
+    by_timeout = {}
+    for i, dev in enumerate(device_list):
+        by_timeout.setdefault(dev.get_command_timeout(command), []).append(i)
+    return sorted(by_timeout.items(), key=lambda item: (item[0] is not None, item[0] or 0))
+
+
+def read_cycle(device_list, command="R", poll=False, phases=None, classes=None):
+    '''
+    the fault tolerant write / wait / read of one command on every board, returns one reading per device in "device_list":
+    an EZO_Reading, a Read_Fault for a board that NACKed or is quarantined by its circuit breaker (see Atlas_Circuit_Breaker.py),
+    or None when the command puts the boards to sleep
+
+    a NACK or a board still answering 254 is retried a few times with a short backoff (Atlas_I2C.safe_write / safe_read_reading),
+    one failing board never aborts the cycle for the others, and quarantined boards are skipped so they add no time to it.
+    each board's breaker is told how its read went
+
+    boards are read in timeout classes ("classes", as timeout_classes returns them, default computed here): the slowest class is
+    written first, and each class is read as soon as its own timeout is up, so fast boards never wait for the slowest one
+
+    phases (a dict) gets the seconds spent in i2c_write / i2c_wait / i2c_read, or i2c_poll when polling
+    '''
+    if phases is None:
+        phases = {}
+    readings = [None] * len(device_list)
+    active = []
+    for i, dev in enumerate(device_list):
+        if dev.breaker is not None and not dev.breaker.allow():
+            readings[i] = Read_Fault(dev.address, "quarantined", dev.breaker.last_fault or "", time.monotonic())
+        else:
+            active.append(i)
+    if not active:
+        return readings
+
+    start = time.perf_counter()
+    if poll:
+        active_readings = poll_all([device_list[i] for i in active], command, structured=True)
+        for i, reading in zip(active, active_readings):
+            readings[i] = reading
+        phases["i2c_poll"] = time.perf_counter() - start
+    else:
+        if classes is None:
+            classes = timeout_classes(device_list, command)
+        allowed = set(active)
+        classes = [(timeout, [i for i in members if i in allowed]) for timeout, members in classes]
+        classes = [(timeout, members) for timeout, members in classes if members]
+        # slowest first, so its conversion overlaps the writes of the faster classes
+        due = []
+        for timeout, members in reversed(classes):
+            for i in members:
+                readings[i] = device_list[i].safe_write(command)
+            due.append((timeout, time.perf_counter(), members))
+        written = time.perf_counter()
+        phases["i2c_write"] = written - start
+        if any(timeout is None for timeout, _, _ in due):
+            return [None for _ in device_list]
+
+        waited = 0.0
+        for ready_at, members in sorted((sent + timeout, members) for timeout, sent, members in due):
+            wait = ready_at - time.perf_counter()
+            if wait > 0:
+                before = time.perf_counter()
+                time.sleep(wait)
+                waited += time.perf_counter() - before
+            for i in members:
+                if readings[i] is None:
+                    readings[i] = device_list[i].safe_read_reading()
+        phases["i2c_wait"] = waited
+        phases["i2c_read"] = time.perf_counter() - written - waited
+
+    for i in active:
+        if device_list[i].breaker is not None:
+            device_list[i].breaker.record(readings[i])
+    return readings
+
+
+def read_recieve_all(device_list, poll=False, structured=False, timer=None):
     '''
     write a command to the ALL I2C boards in passed in "Device_list" (device list should be a list of insances of this class!), wait the correct timeout, 
     and read the response
+
+    poll=True reads each board as soon as it stops answering 254 (still processing) instead of sleeping the full LONG_TIMEOUT
+    structured=True returns EZO_Reading records instead of "Success ..." / "Error ..." strings
+    timer (an Atlas_Profiling.Phase_Timer) gets the i2c_write / i2c_wait / i2c_read phases, or i2c_poll when polling
+
+    a board that fails (NACK, still busy, quarantined) gets its own "Error <device info>: <code>" (a Read_Fault when structured),
+    the other boards are read as usual - see read_cycle
     '''
-    responses = []
-    
-    for dev in device_list:
-        dev.write("R")
-        
-    current_timeout = device_list[0].get_command_timeout("R")
-    
-    if not current_timeout:
+    phases = {}
+    readings = read_cycle(device_list, "R", poll=poll, phases=phases)
+    if timer is not None:
+        for phase, seconds in phases.items():
+            timer.add(phase, seconds)
+
+    if all(reading is None for reading in readings):
         return "sleep mode"
-    
-    else:
-        time.sleep(current_timeout)
-        # print(current_timeout)
-        for dev in device_list:
-            responses.append(dev.read().strip('\x00').replace("\x00",''))
-        return responses
+    if structured:
+        return readings
+    return [dev.format_reading(reading) for dev, reading in zip(device_list, readings)]
+
+
+def query_all(device_list, command):
+    '''
+    write the same command to ALL boards in "device_list", wait ONE shared timeout (the longest any of them needs),
+    and read every response - so N devices cost one timeout instead of N
+    '''
+    for dev in device_list:
+        dev.write(command)
+
+    timeouts = [dev.get_command_timeout(command) for dev in device_list]
+    if not all(timeouts):
+        return ["sleep mode" for _ in device_list]
+
+    time.sleep(max(timeouts))
+    return [dev.read() for dev in device_list]
+
+
+def poll_all(device_list, command, deadline=None, structured=False):
+    '''
+    write the command to ALL boards, then poll each board's status byte until it is done processing (anything but 254)
+
+    the first poll of a board is timed from its learned conversion time for this command, after that the poll interval backs off
+    from POLL_INTERVAL to POLL_MAX_INTERVAL. polling stops at a hard deadline (default POLL_DEADLINE seconds after the writes),
+    a board still busy then reports "Error ...: 254" like a fixed sleep would have
+
+    structured=True returns the EZO_Reading records (which carry the time each one was read) instead of strings
+    a board that NACKs its write or its polls (after the retries in safe_write / safe_read_reading) gets a Read_Fault
+    '''
+    readings = [None] * len(device_list)
+    sent_at = []
+    for i, dev in enumerate(device_list):
+        readings[i] = dev.safe_write(command)
+        sent_at.append(time.monotonic())
+
+    if not all(dev.get_command_timeout(command) for dev in device_list):
+        return [None if structured else "sleep mode" for _ in device_list]
+
+    if deadline is None:
+        deadline = max(dev.POLL_DEADLINE for dev in device_list)
+    hard_deadline = sent_at[0] + deadline
+
+    pending = [(sent_at[i] + dev.first_poll_delay(command), i, dev.POLL_INTERVAL)
+               for i, dev in enumerate(device_list) if readings[i] is None]
+    heapq.heapify(pending)
+
+    while pending:
+        poll_at, i, interval = heapq.heappop(pending)
+        dev = device_list[i]
+        wait = min(poll_at, hard_deadline) - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+        reading = dev.safe_read_reading(retry_pending=False)
+        if reading.status == dev.STATUS_PENDING:
+            if reading.read_time < hard_deadline:
+                heapq.heappush(pending, (reading.read_time + interval, i, min(interval * dev.POLL_BACKOFF, dev.POLL_MAX_INTERVAL)))
+                continue
+        elif not isinstance(reading, Read_Fault):
+            dev.record_ready_time(command, reading.read_time - sent_at[i])
+        readings[i] = reading
+
+    if structured:
+        return readings
+    return [dev.format_reading(reading) for dev, reading in zip(device_list, readings)]
+
+
+###################################################################################################################################################
+# Class Definition - EZO_Reading
+#       One parsed response from a board, what the structured read path returns instead of a formatted string
+
+# translate table that clears the MSB of every byte the board sends after the status byte
+# NOTE: having to change the MSB to 0 is a glitch in the raspberry pi, and you shouldn't have to do this!
+MSB_MASK = bytes(i & 0x7F for i in range(256))
+
+class EZO_Reading:
+    '''
+    address   : I2C address of the board
+    status    : first byte of the response (1 success, 2 syntax error, 254 still processing, 255 no data), None for an empty read
+    payload   : response bytes after the status byte with the MSB cleared and NULs removed
+    value     : first comma separated field of the payload as a float, None if the read failed or is not numeric
+    read_time : time.monotonic() the bytes were read
+    '''
+    __slots__ = ("address", "status", "payload", "value", "read_time")
+
+    STATUS_SUCCESS = 1
+
+    def __init__(self, address, status, payload, value, read_time):
+        self.address = address
+        self.status = status
+        self.payload = payload
+        self.value = value
+        self.read_time = read_time
+
+    @property
+    def ok(self):
+        return self.status == self.STATUS_SUCCESS or self.status is None
+
+    def __repr__(self):
+        return "EZO_Reading(address={}, status={}, payload={!r}, value={})".format(self.address, self.status, self.payload, self.value)
+
+
+class Read_Fault(EZO_Reading):
+    '''
+    a read that produced no response from the board, in place of its EZO_Reading
+
+    code   : "nack" (IOError on the bus) or "quarantined" (skipped by the device's circuit breaker)
+    detail : the IOError text, or the fault that tripped the breaker
+    '''
+    __slots__ = ("code", "detail")
+
+    def __init__(self, address, code, detail, read_time):
+        EZO_Reading.__init__(self, address, None, b"", None, read_time)
+        self.code = code
+        self.detail = detail
+
+    @property
+    def ok(self):
+        return False
+
+    def __repr__(self):
+        return "Read_Fault(address={}, code={}, detail={!r})".format(self.address, self.code, self.detail)
             
 
 class Config_AtlasI2C:
@@ -64,22 +272,241 @@ class Config_AtlasI2C:
                 print(" - " + i.get_device_info())
         #print("")
     
-    def get_devices():
-        device = Atlas_I2C()
-        device_address_list = device.list_i2c_devices()
+    # known devices from the last full scan, checked at startup instead of probing all 128 addresses
+    MANIFEST_PATH = Path(__file__).with_name('Atlas_Devices_manifest.json')
+    # bus number -> the exception that stopped the last scan of that bus, empty when every bus scanned
+    scan_errors = {}
+
+    def list_buses():
+        '''
+        bus numbers the current transport can open (every /dev/i2c-N on the Pi), sorted
+        only a hint for choosing buses - nothing is scanned unless it is asked for by number
+        '''
+        available_buses = getattr(Atlas_I2C.transport_factory, "available_buses", None)
+        buses = sorted(available_buses()) if available_buses else []
+        return buses or [Atlas_I2C.DEFAULT_BUS]
+
+    def get_devices(manifest_path=None, rescan=False, buses=None):
+        '''
+        return the list of EZO devices on the default I2C bus (or on the buses listed in "buses"), ordered by bus then address
+
+        the device manifest from the last scan is tried first, with one cheap read per known address. if any device is missing
+        (or the manifest does not exist, or rescan is True) the full bus scan runs and the manifest is rewritten
+        '''
+        manifest_path = Path(manifest_path or Config_AtlasI2C.MANIFEST_PATH)
+
+        if not rescan:
+            device_list = Config_AtlasI2C.load_manifest(manifest_path)
+            if device_list and Config_AtlasI2C.verify_devices(device_list):
+                return device_list
+            Config_AtlasI2C.close_devices(device_list)
+            if device_list:
+                print(">> device manifest " + str(manifest_path) + " is out of date, rescanning the I2C bus")
+
+        device_list = Config_AtlasI2C.scan_all_buses(buses)
+        if device_list:
+            Config_AtlasI2C.save_manifest(device_list, manifest_path)
+        return device_list
+
+    def scan_all_buses(buses=None):
+        '''
+        scan the listed buses (default: only DEFAULT_BUS) at once, one thread per bus, and merge the results in bus order
+
+        other buses are opt-in: /dev/i2c-N also exists for HDMI DDC and camera buses, and probing every address there is
+        at best slow and at worst upsets the device on it. a bus that fails to scan is left out and its exception is kept
+        in Config_AtlasI2C.scan_errors
+        '''
+        buses = list(buses) if buses else [Atlas_I2C.DEFAULT_BUS]
+        results = {}
+        errors = {}
+
+        def scan(bus):
+            try:
+                results[bus] = Config_AtlasI2C.scan_devices(bus)
+            except Exception as e:
+                print(">> WARNING: could not scan I2C bus " + str(bus) + ": " + repr(e))
+                errors[bus] = e
+                results[bus] = []
+
+        threads = [threading.Thread(target=scan, args=(bus,), name="atlas-scan-" + str(bus)) for bus in buses]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        Config_AtlasI2C.scan_errors = errors
+        return [dev for bus in buses for dev in results[bus]]
+
+    def scan_devices(bus=None):
+        '''
+        probe every address on the bus, then identify all responders together - the "I" and "name,?" queries are each sent to every
+        device before a single shared wait
+        '''
+        device = Atlas_I2C(bus=bus)
+        try:
+            device_address_list = device.list_i2c_devices()
+        finally:
+            Config_AtlasI2C.close_devices([device])
+
+        # the candidates only live for the identification queries, they are closed whatever happens to them
+        candidates = []
         device_list = []
-        
-        for i in device_address_list:
-            device.set_i2c_address(i)
-            response = device.query("I")
+        try:
+            for i in device_address_list:
+                candidates.append(Atlas_I2C(address=i, bus=bus))
+            if not candidates:
+                return device_list
+
+            info_responses = query_all(candidates, "I")
+            name_responses = query_all(candidates, "name,?")
+
+            for dev, info, name in zip(candidates, info_responses, name_responses):
+                try:
+                    fields = info.split(",")
+                    moduletype = fields[1]
+                    firmware = fields[2].strip() if len(fields) > 2 else ""
+                    name = name.split(",")[1]
+                except IndexError:
+                    print(">> WARNING: device at I2C address " + str(dev.address) + " has not been identified as an EZO device, and will not be queried")
+                    continue
+                device_list.append(Atlas_I2C(address=dev.address, moduletype=moduletype, name=name, bus=dev.bus, firmware=firmware))
+        except BaseException:
+            Config_AtlasI2C.close_devices(device_list)
+            raise
+        finally:
+            Config_AtlasI2C.close_devices(candidates)
+        return device_list
+
+    def close_devices(device_list):
+        '''
+        close every device in the list, one that fails to close does not keep the others open
+        '''
+        for dev in device_list:
             try:
-                moduletype = response.split(",")[1] 
-                response = device.query("name,?").split(",")[1]
-            except IndexError:
-                print(">> WARNING: device at I2C address " + str(i) + " has not been identified as an EZO device, and will not be queried") 
-                continue
-            device_list.append(Atlas_I2C(address = i, moduletype = moduletype, name = response))
-        return device_list 
+                dev.close()
+            except OSError as e:
+                print(">> WARNING: could not close the device at I2C address " + str(dev.address) + ": " + str(e))
+
+    def verify_devices(device_list):
+        '''
+        one single byte read per device, a missing device NACKs and raises IOError
+        '''
+        for dev in device_list:
+            try:
+                dev.read(1)
+            except IOError:
+                return False
+        return True
+
+    def load_manifest(manifest_path=None):
+        '''
+        build the device list saved by save_manifest, an empty list if there is no usable manifest
+        '''
+        manifest_path = Path(manifest_path or Config_AtlasI2C.MANIFEST_PATH)
+        try:
+            with manifest_path.open('r') as file:
+                entries = json.load(file)["devices"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return []
+
+        device_list = []
+        for entry in entries:
+            try:
+                device_list.append(Atlas_I2C(address=int(entry["address"]),
+                                             moduletype=entry.get("moduletype", ""),
+                                             name=entry.get("name", ""),
+                                             bus=entry.get("bus"),
+                                             firmware=entry.get("firmware", "")))
+            except (KeyError, ValueError, TypeError, OSError):
+                Config_AtlasI2C.close_devices(device_list)
+                return []
+        return device_list
+
+    def save_manifest(device_list, manifest_path=None):
+        manifest_path = Path(manifest_path or Config_AtlasI2C.MANIFEST_PATH)
+        entries = [{"bus": dev.bus,
+                    "address": dev.address,
+                    "moduletype": dev.moduletype,
+                    "name": dev.name,
+                    "firmware": dev.firmware} for dev in device_list]
+        tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+        with tmp_path.open('w') as file:
+            json.dump({"version": 1, "devices": entries}, file, indent=2)
+        tmp_path.replace(manifest_path)
+
+###################################################################################################################################################
+# Class Definition - I2C_Transport
+#       Byte level access to one I2C bus. Atlas_I2C talks to the bus only through one of these so the driver can run against the real
+#       /dev/i2c-N device on the Pi or against the simulated EZO bus in Atlas_I2C_Sim.py
+
+class I2C_Transport:
+    '''
+    base class for the raw byte transports used by Atlas_I2C
+    '''
+    def set_address(self, addr):
+        raise NotImplementedError
+
+    def read(self, num_of_bytes):
+        raise NotImplementedError
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def readinto(self, buffer):
+        '''
+        read len(buffer) bytes into a writable buffer, returns the number of bytes read
+        '''
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class Linux_I2C_Transport(I2C_Transport):
+    '''
+    the real transport - open two file streams on /dev/i2c-{bus}, one for reading and one for writing
+    wb and rb indicate binary read and write
+    '''
+    # from the i2c-dev.h file in i2c-tools
+    I2C_SLAVE = 0x703
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.file_read = io.open(file="/dev/i2c-{}".format(bus),
+                                mode="rb",
+                                buffering=0)
+        self.file_write = io.open(file="/dev/i2c-{}".format(bus),
+                                mode="wb",
+                                buffering=0)
+
+    @staticmethod
+    def available_buses():
+        buses = []
+        for path in glob.glob("/dev/i2c-*"):
+            try:
+                buses.append(int(path.rsplit("-", 1)[1]))
+            except ValueError:
+                pass
+        return buses
+
+    def set_address(self, addr):
+        fcntl.ioctl(self.file_read, self.I2C_SLAVE, addr)
+        fcntl.ioctl(self.file_write, self.I2C_SLAVE, addr)
+
+    def read(self, num_of_bytes):
+        return self.file_read.read(num_of_bytes)
+
+    def readinto(self, buffer):
+        return self.file_read.readinto(buffer)
+
+    def write(self, data):
+        self.file_write.write(data)
+
+    def close(self):
+        self.file_read.close()
+        self.file_write.close()
+
 
 class Atlas_I2C:
 
@@ -94,27 +521,55 @@ class Atlas_I2C:
     DEFAULT_ADDRESS = 98
     LONG_TIMEOUT_COMMANDS = ("R", "CAL")
     SLEEP_COMMANDS = ("SLEEP", )
+    # status byte returned while the board is still processing the last command
+    STATUS_PENDING = 254
+    # readiness polling (see poll_all): first backoff step, backoff factor and ceiling,
+    # the hard stop after the write, how early to start polling ahead of the learned
+    # conversion time, and the weight given to each new conversion time measurement
+    POLL_INTERVAL = .02
+    POLL_BACKOFF = 1.5
+    POLL_MAX_INTERVAL = .1
+    POLL_DEADLINE = 1.5
+    POLL_LEAD = .9
+    READY_ESTIMATE_WEIGHT = .2
+    # retries inside one cycle (see safe_write / safe_read_reading): a NACK, or a board still answering 254
+    # after the fixed wait, is retried up to IO_RETRIES times, backing off from RETRY_BACKOFF to RETRY_MAX_BACKOFF
+    IO_RETRIES = 2
+    RETRY_BACKOFF = .01
+    RETRY_MAX_BACKOFF = .04
+
+    # called with the bus number to build the transport when one is not passed in,
+    # swap this out (see Atlas_I2C_Sim.py) to run the driver off the Pi
+    transport_factory = Linux_I2C_Transport
 
-    def __init__(self, address=None, moduletype = "", name = "", bus=None):
+    def __init__(self, address=None, moduletype = "", name = "", bus=None, transport=None, firmware = ""):
             '''
-            open two file streams, one for reading and one for writing
+            open the transport for the I2C bus
             the specific I2C channel is selected with bus
             it is usually 1, except for older revisions where its 0
-            wb and rb indicate binary read and write
             '''
             self._address = address or self.DEFAULT_ADDRESS
-            self.bus = bus or self.DEFAULT_BUS
+            self.bus = bus if bus is not None else self.DEFAULT_BUS
             self._long_timeout = self.LONG_TIMEOUT
             self._short_timeout = self.SHORT_TIMEOUT
-            self.file_read = io.open(file="/dev/i2c-{}".format(self.bus), 
-                                    mode="rb", 
-                                    buffering=0)
-            self.file_write = io.open(file="/dev/i2c-{}".format(self.bus),
-                                    mode="wb", 
-                                    buffering=0)
-            self.set_i2c_address(self._address)
+            self._transport = transport or self.transport_factory(self.bus)
+            try:
+                self.set_i2c_address(self._address)
+            except OSError:
+                # do not leak the file handles of a transport opened here
+                if transport is None:
+                    self._transport.close()
+                raise
             self._name = name
             self._module = moduletype
+            self._firmware = firmware
+            # learned time from write to ready per command, see record_ready_time
+            self._ready_estimate = {}
+            # reused by every read_reading
+            self._read_buffer = bytearray(31)
+            self._read_view = memoryview(self._read_buffer)
+            # Atlas_Circuit_Breaker.Circuit_Breaker when attached, read_cycle skips the board while it is open
+            self.breaker = None
 
 	
     @property
@@ -136,16 +591,20 @@ class Atlas_I2C:
     @property
     def moduletype(self):
         return self._module
+
+    @property
+    def firmware(self):
+        return self._firmware
+
+    @property
+    def transport(self):
+        return self._transport
         
     def set_i2c_address(self, addr):
         '''
         set the I2C communications to the slave specified by the address
-        the commands for I2C dev using the ioctl functions are specified in
-        the i2c-dev.h file from i2c-tools
         '''
-        I2C_SLAVE = 0x703
-        fcntl.ioctl(self.file_read, I2C_SLAVE, addr)
-        fcntl.ioctl(self.file_write, I2C_SLAVE, addr)
+        self._transport.set_address(addr)
         self._address = addr
 
     def write(self, cmd):
@@ -153,31 +612,11 @@ class Atlas_I2C:
         appends the null character and sends the string over I2C
         '''
         cmd += "\00"
-        self.file_write.write(cmd.encode('latin-1'))
+        self._transport.write(cmd.encode('latin-1'))
 
-    def handle_raspi_glitch(self, response):
-        '''
-        Change MSB to 0 for all received characters except the first 
-        and get a list of characters
-        NOTE: having to change the MSB to 0 is a glitch in the raspberry pi, 
-        and you shouldn't have to do this!
-        '''
-        if self.app_using_python_two():
-            return list(map(lambda x: chr(ord(x) & ~0x80), list(response)))
-        else:
-            return list(map(lambda x: chr(x & ~0x80), list(response)))
-            
     def app_using_python_two(self):
         return sys.version_info[0] < 3
 
-    def get_response(self, raw_data):
-        if self.app_using_python_two():
-            response = [i for i in raw_data if i != '\x00']
-        else:
-            response = raw_data
-
-        return response
-
     def response_valid(self, response):
         valid = True
         error_code = None
@@ -199,24 +638,107 @@ class Atlas_I2C:
         else:
             return self._module + " " + str(self.address) + " " + self._name
         
+    def read_reading(self, num_of_bytes=31):
+        '''
+        structured read - reads into the preallocated buffer, masks the MSB and then drops NULs (a byte that masks to 0 is
+        padding too) with bytes level operations, and returns an EZO_Reading
+        '''
+        if num_of_bytes > len(self._read_buffer):
+            self._read_buffer = bytearray(num_of_bytes)
+            self._read_view = memoryview(self._read_buffer)
+        count = self._transport.readinto(self._read_view[:num_of_bytes])
+        read_time = time.monotonic()
+        if not count:
+            return EZO_Reading(self._address, None, b"", None, read_time)
+
+        status = self._read_buffer[0]
+        payload = self._read_view[1:count].tobytes().translate(MSB_MASK).replace(b"\x00", b"")
+        value = None
+        if status == EZO_Reading.STATUS_SUCCESS:
+            try:
+                value = float(payload.split(b",", 1)[0])
+            except ValueError:
+                pass
+        return EZO_Reading(self._address, status, payload, value, read_time)
+
+    def format_reading(self, reading):
+        '''
+        the "Success <device info>: <payload>" / "Error <device info>: <code>" string for a reading
+        '''
+        if reading.ok:
+            return "Success " + self.get_device_info() + ": " + reading.payload.decode('latin-1')
+        if isinstance(reading, Read_Fault):
+            return "Error " + self.get_device_info() + ": " + reading.code
+        return "Error " + self.get_device_info() + ": " + str(reading.status)
+
+    def safe_write(self, cmd, retries=None):
+        '''
+        write that retries a NACK with a bounded backoff, returns None once written or a Read_Fault if every attempt failed
+        '''
+        retries = self.IO_RETRIES if retries is None else retries
+        delay = self.RETRY_BACKOFF
+        for attempt in range(retries + 1):
+            try:
+                self.write(cmd)
+                return None
+            except IOError as e:
+                error = e
+            if attempt < retries:
+                time.sleep(delay)
+                delay = min(delay * 2, self.RETRY_MAX_BACKOFF)
+        return Read_Fault(self._address, "nack", str(error), time.monotonic())
+
+    def safe_read_reading(self, retries=None, retry_pending=True):
+        '''
+        read_reading that never raises: a NACK (and with retry_pending a 254, still processing) is read again after a bounded
+        backoff, up to "retries" times. returns the last EZO_Reading, or a Read_Fault if the board never answered
+        '''
+        retries = self.IO_RETRIES if retries is None else retries
+        delay = self.RETRY_BACKOFF
+        for attempt in range(retries + 1):
+            try:
+                reading = self.read_reading()
+            except IOError as e:
+                reading = Read_Fault(self._address, "nack", str(e), time.monotonic())
+            else:
+                if reading.status != self.STATUS_PENDING or not retry_pending:
+                    return reading
+            if attempt < retries:
+                time.sleep(delay)
+                delay = min(delay * 2, self.RETRY_MAX_BACKOFF)
+        return reading
+
     def read(self, num_of_bytes=31):
         '''
         reads a specified number of bytes from I2C, then parses and displays the result
         '''
-        
-        raw_data = self.file_read.read(num_of_bytes)
-        response = self.get_response(raw_data=raw_data)
-        #print(response)
-        is_valid, error_code = self.response_valid(response=response)
-
-        if is_valid:
-            char_list = self.handle_raspi_glitch(response[1:])
-            result = "Success " + self.get_device_info() + ": " +  str(''.join(char_list))
-            #result = "Success: " +  str(''.join(char_list))
+        return self.format_reading(self.read_reading(num_of_bytes))
+
+    def _ready_key(self, command):
+        return command.upper().split(",")[0]
+
+    def ready_estimate(self, command):
+        '''
+        learned seconds from writing this command until the board is ready, None until measured
+        '''
+        return self._ready_estimate.get(self._ready_key(command))
+
+    def record_ready_time(self, command, elapsed):
+        key = self._ready_key(command)
+        previous = self._ready_estimate.get(key)
+        if previous is None:
+            self._ready_estimate[key] = elapsed
         else:
-            result = "Error " + self.get_device_info() + ": " + error_code
+            self._ready_estimate[key] = previous + self.READY_ESTIMATE_WEIGHT * (elapsed - previous)
 
-        return result
+    def first_poll_delay(self, command):
+        '''
+        how long after the write to take the first status poll
+        '''
+        estimate = self.ready_estimate(command)
+        if estimate is None:
+            return self.POLL_INTERVAL
+        return max(self.POLL_INTERVAL, estimate * self.POLL_LEAD)
 
     def get_command_timeout(self, command):
         timeout = None
@@ -227,11 +749,16 @@ class Atlas_I2C:
 
         return timeout
 
-    def query(self, command):
+    def query(self, command, poll=False):
         '''
         write a command to the board, wait the correct timeout, 
         and read the response
+
+        poll=True returns as soon as the board is ready instead of waiting the full timeout
         '''
+        if poll:
+            return poll_all([self], command)[0]
+
         self.write(command)
         current_timeout = self.get_command_timeout(command=command)
         if not current_timeout:
@@ -242,8 +769,7 @@ class Atlas_I2C:
         
     
     def close(self):
-        self.file_read.close()
-        self.file_write.close()
+        self._transport.close()
 
     def list_i2c_devices(self):
         '''
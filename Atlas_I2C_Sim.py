@@ -0,0 +1,273 @@
+"""
+Atlas_I2C_Sim.py
+
+In-memory stand-in for a bus of Atlas Scientific EZO boards so Atlas_I2C_Driver_JQ
+and the logging scripts can run (and be timed) off the Pi.
+
+- Simulated_EZO_Device models one EZO circuit: per-command conversion latency,
+  the status byte protocol (1 = success, 2 = syntax error, 254 = still
+  processing, 255 = no data to send) and gaussian noise on readings
+- Simulated_I2C_Bus holds the devices found on one bus number
+- Simulated_I2C_Network maps bus numbers to buses and is used as
+  Atlas_I2C.transport_factory, so unmodified driver code talks to it
+
+Typical use:
+
+    network = Simulated_I2C_Network({1: Simulated_I2C_Bus([
+        Simulated_EZO_Device(106, "EC", value=16.9),
+        Simulated_EZO_Device(107, "EC", value=0.0),
+    ])})
+    with network.installed():
+        device_list = Config_AtlasI2C.get_devices()
+"""
+
+import contextlib
+import errno
+import random
+import threading
+import time
+
+from Atlas_I2C_Driver_JQ import Atlas_I2C, I2C_Transport
+
+# EZO status bytes (first byte of every read)
+STATUS_SUCCESS = 1
+STATUS_SYNTAX_ERROR = 2
+STATUS_PENDING = 254
+STATUS_NO_DATA = 255
+
+# Time (s) a "R" takes to convert, per module type, from the EZO datasheets
+READ_CONVERSION_TIME = {
+    "EC": 0.6,
+    "PH": 0.9,
+    "ORP": 0.9,
+    "DO": 0.6,
+    "RTD": 0.6,
+    "PRS": 0.9,
+}
+DEFAULT_READ_CONVERSION_TIME = 0.9
+CAL_CONVERSION_TIME = 0.9
+COMMAND_CONVERSION_TIME = 0.3
+
+
+class Simulated_EZO_Device:
+    """
+    One simulated EZO circuit.
+
+    value/noise/drift shape the "R" output: value + drift * seconds_since_start
+    plus gaussian noise with standard deviation noise. conversion_time overrides
+    the datasheet "R" latency; the datasheet figures are treated as worst case
+    and every command finishes up to jitter (a fraction) sooner. time_scale multiplies every latency (use < 1 to run
+    benchmarks faster than real time).
+    """
+
+    def __init__(self, address, moduletype="EC", name="", firmware="2.16",
+                 value=10.0, noise=0.01, drift=0.0, decimals=2,
+                 conversion_time=None, jitter=0.05, time_scale=1.0,
+                 msb_glitch=False, seed=None):
+        self.address = address
+        self.moduletype = moduletype
+        self.name = name
+        self.firmware = firmware
+        self.value = value
+        self.noise = noise
+        self.drift = drift
+        self.decimals = decimals
+        self.conversion_time = (conversion_time if conversion_time is not None
+                                else READ_CONVERSION_TIME.get(moduletype.upper(),
+                                                              DEFAULT_READ_CONVERSION_TIME))
+        self.jitter = jitter
+        self.time_scale = time_scale
+        self.msb_glitch = msb_glitch
+        self.temperature = 25.0
+        self.cal_points = 0
+        self.asleep = False
+
+        self._rng = random.Random(seed if seed is not None else address)
+        self._start = time.monotonic()
+        self._pending = None  # (ready_at, status, payload)
+        self.commands = []  # every command received, for inspection
+
+    # ---- value model ---------------------------------------------------------
+    def sample(self, now=None):
+        now = time.monotonic() if now is None else now
+        v = self.value + self.drift * (now - self._start)
+        if self.noise:
+            v += self._rng.gauss(0.0, self.noise)
+        return v
+
+    def _latency(self, base):
+        spread = 1.0 - self._rng.uniform(0.0, self.jitter)
+        return max(0.0, base * spread * self.time_scale)
+
+    # ---- command handling ----------------------------------------------------
+    def _respond(self, cmd, now):
+        """
+        Returns (latency, status, payload) for a command string.
+        """
+        upper = cmd.upper()
+        if upper == "R":
+            fmt = "{:.%df}" % self.decimals
+            return self.conversion_time, STATUS_SUCCESS, fmt.format(self.sample(now))
+        if upper.startswith("CAL"):
+            if upper == "CAL,?":
+                return COMMAND_CONVERSION_TIME, STATUS_SUCCESS, "?CAL,{}".format(self.cal_points)
+            if upper == "CAL,CLEAR":
+                self.cal_points = 0
+            else:
+                self.cal_points = min(self.cal_points + 1, 3)
+            return CAL_CONVERSION_TIME, STATUS_SUCCESS, ""
+        if upper == "I":
+            return COMMAND_CONVERSION_TIME, STATUS_SUCCESS, "?I,{},{}".format(self.moduletype, self.firmware)
+        if upper == "NAME,?":
+            return COMMAND_CONVERSION_TIME, STATUS_SUCCESS, "?NAME,{}".format(self.name)
+        if upper.startswith("NAME,"):
+            self.name = cmd.split(",", 1)[1]
+            return COMMAND_CONVERSION_TIME, STATUS_SUCCESS, ""
+        if upper == "T,?":
+            return COMMAND_CONVERSION_TIME, STATUS_SUCCESS, "?T,{:.2f}".format(self.temperature)
+        if upper.startswith("T,"):
+            try:
+                self.temperature = float(cmd.split(",", 1)[1])
+            except ValueError:
+                return COMMAND_CONVERSION_TIME, STATUS_SYNTAX_ERROR, ""
+            return COMMAND_CONVERSION_TIME, STATUS_SUCCESS, ""
+        if upper == "STATUS":
+            return COMMAND_CONVERSION_TIME, STATUS_SUCCESS, "?STATUS,P,5.04"
+        return COMMAND_CONVERSION_TIME, STATUS_SYNTAX_ERROR, ""
+
+    def handle_write(self, data, now=None):
+        now = time.monotonic() if now is None else now
+        cmd = bytes(data).split(b"\x00", 1)[0].decode("latin-1").strip()
+        self.commands.append(cmd)
+        self.asleep = False
+        if cmd.upper().startswith(Atlas_I2C.SLEEP_COMMANDS):
+            # the board goes quiet until it is woken by the next write
+            self.asleep = True
+            self._pending = None
+            return
+        latency, status, payload = self._respond(cmd, now)
+        self._pending = (now + self._latency(latency), status, payload)
+
+    def handle_read(self, num_of_bytes, now=None):
+        now = time.monotonic() if now is None else now
+        if self._pending is None:
+            frame = bytes([STATUS_NO_DATA])
+        else:
+            ready_at, status, payload = self._pending
+            if now < ready_at:
+                frame = bytes([STATUS_PENDING])
+            else:
+                self._pending = None
+                body = payload.encode("latin-1")
+                if self.msb_glitch:
+                    body = bytes(b | 0x80 for b in body)
+                frame = bytes([status]) + body
+        frame = frame[:num_of_bytes]
+        return frame + b"\x00" * (num_of_bytes - len(frame))
+
+
+class Simulated_I2C_Bus:
+    """
+    The devices answering on one simulated bus, keyed by address.
+    """
+
+    def __init__(self, devices=()):
+        self.devices = {}
+        self.lock = threading.Lock()
+        for dev in devices:
+            self.add(dev)
+
+    def add(self, device):
+        self.devices[device.address] = device
+        return device
+
+    def remove(self, address):
+        return self.devices.pop(address, None)
+
+    def get(self, address):
+        return self.devices.get(address)
+
+
+class Simulated_I2C_Transport(I2C_Transport):
+    """
+    Per-Atlas_I2C handle on a Simulated_I2C_Bus; behaves like an open
+    /dev/i2c-N file: addressing an empty slot raises IOError on transfer.
+    """
+
+    def __init__(self, sim_bus, bus=None):
+        self.sim_bus = sim_bus
+        self.bus = bus
+        self._address = None
+        self.closed = False
+
+    def set_address(self, addr):
+        self._address = addr
+
+    def _device(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed transport")
+        dev = self.sim_bus.get(self._address)
+        if dev is None:
+            raise IOError(errno.EREMOTEIO, "Remote I/O error")
+        return dev
+
+    def read(self, num_of_bytes):
+        with self.sim_bus.lock:
+            return self._device().handle_read(num_of_bytes)
+
+    def write(self, data):
+        with self.sim_bus.lock:
+            self._device().handle_write(data)
+
+    def close(self):
+        self.closed = True
+
+
+class Simulated_I2C_Network:
+    """
+    Bus number -> Simulated_I2C_Bus. Call it with a bus number to get a
+    transport, which is the Atlas_I2C.transport_factory signature.
+    """
+
+    def __init__(self, buses=None):
+        self.buses = dict(buses or {})
+
+    def __call__(self, bus):
+        if bus not in self.buses:
+            raise FileNotFoundError(errno.ENOENT, "No such file or directory", "/dev/i2c-{}".format(bus))
+        return Simulated_I2C_Transport(self.buses[bus], bus=bus)
+
+    def available_buses(self):
+        return list(self.buses)
+
+    def devices(self):
+        for bus in self.buses.values():
+            for dev in bus.devices.values():
+                yield dev
+
+    @contextlib.contextmanager
+    def installed(self):
+        """
+        Route every Atlas_I2C created inside the block to this network.
+        """
+        previous = Atlas_I2C.transport_factory
+        Atlas_I2C.transport_factory = self
+        try:
+            yield self
+        finally:
+            Atlas_I2C.transport_factory = previous
+
+
+def make_cond_rig(values=(16.9, 11.6, 2.9), first_address=106, buses=(1,),
+                  noise=0.02, time_scale=1.0, seed=None):
+    """
+    Network that looks like the Novus conductivity rig: K0.1 EZO-EC boards
+    on consecutive addresses, dealt round-robin across the given buses.
+    """
+    network = Simulated_I2C_Network({bus: Simulated_I2C_Bus() for bus in buses})
+    for i, v in enumerate(values):
+        network.buses[buses[i % len(buses)]].add(
+            Simulated_EZO_Device(first_address + i, "EC", value=v, noise=noise,
+                                 time_scale=time_scale,
+                                 seed=None if seed is None else seed + i))
+    return network
@@ -0,0 +1,383 @@
+"""
+Atlas_Log_Loader.py
+
+Fast loader for every datalog layout in the archive.
+
+Layouts, detected from the header (and, for the two legacy ones, the first
+data row):
+  - "v2"          : Atlas_Cont_Read_I2C_V2.py logs - conductivity and
+                    resistivity per probe, ErrorFlag and ErrorDetail
+  - "legacy"      : i2c-Cont-Read-Atlas-devices.py logs with clean floats
+                    (e.g. "Novus Long COnd Only 3.csv")
+  - "legacy_list" : the older i2c-Cont-Read-Atlas-devices.py logs whose cells
+                    hold a list repr like "['Success EC 106 ', ' 16.88']"
+                    (e.g. "Novus Long Cond Only Test 1.csv")
+  - "binary"      : Atlas_Binary_Log files, mapped with numpy.memmap (or
+                    streamed when compressed)
+  - "rollup"      : Atlas_Rollup tier files; every "<channel> <stat>" column
+                    is a channel
+
+Text logs are read a chunk of lines at a time (bounded memory however big the
+file) and every chunk is split into cells with one str.split over the whole
+chunk. Columns are converted with NumPy string and astype operations, not per
+row Python code. Error cells, blanks and unparsable values become NaN.
+Files ending in .gz or .xz are decompressed on the fly.
+
+A deadband log (Atlas_Deadband, it has a "Ticks Held" column) leaves a cell
+empty while the channel holds its value: those cells are forward-filled
+with the last written value, carried across chunks, and only "nan" cells
+are missing.
+
+Usage:
+
+    log = load_log("Novus Long Cond Only Test 1.csv")
+    log.layout                       # "legacy_list"
+    log.time                         # datetime64[ms]
+    log.channels["K0.1 #1 Conductivity Reading (uS/cm)"]   # float64, NaN = error
+
+    for block in iter_blocks(path, chunk_rows=200_000):     # bounded memory
+        ...
+"""
+
+import csv
+import datetime
+import gzip
+import io
+import lzma
+
+import numpy as np
+
+import Atlas_Binary_Log
+from Atlas_Deadband import HELD_COLUMN
+
+TIME_COLUMN = "Time (Y-M-D-H-M-S)"
+ELAPSED_COLUMN = "Time from Start (Seconds)"
+LOOP_COLUMN = "Loop Time (Seconds)"
+ERROR_FLAG_COLUMN = "ErrorFlag"
+ERROR_DETAIL_COLUMN = "ErrorDetail"
+BUCKET_COLUMN = "Bucket Seconds"
+_NON_CHANNEL_COLUMNS = (TIME_COLUMN, ELAPSED_COLUMN, LOOP_COLUMN, ERROR_FLAG_COLUMN, ERROR_DETAIL_COLUMN,
+                        BUCKET_COLUMN, HELD_COLUMN)
+
+
+class Log_Block:
+    """
+    Typed arrays for a run of rows from one log.
+
+    layout     : "v2", "legacy", "legacy_list", "binary" or "rollup"
+    time       : datetime64[ms] wall time of each row (NaT if unparsable)
+    elapsed    : float64 "Time from Start (Seconds)"
+    loop_time  : float64 "Loop Time (Seconds)"
+    channels   : {column name: float64 array}, NaN where the probe errored
+    error_flag : int8, 1 where the row had an error (for the legacy layouts,
+                 where any channel is NaN)
+    """
+
+    __slots__ = ("layout", "time", "elapsed", "loop_time", "channels", "error_flag")
+
+    def __init__(self, layout, time, elapsed, loop_time, channels, error_flag):
+        self.layout = layout
+        self.time = time
+        self.elapsed = elapsed
+        self.loop_time = loop_time
+        self.channels = channels
+        self.error_flag = error_flag
+
+    def __len__(self):
+        return len(self.elapsed)
+
+    @property
+    def channel_names(self):
+        return list(self.channels)
+
+
+def open_text(path):
+    """
+    Text handle on a log, decompressing .gz/.xz; universal newlines.
+    """
+    path = str(path)
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", errors="replace", newline=None)
+    if path.endswith(".xz"):
+        return io.TextIOWrapper(lzma.open(path, "rb"), encoding="utf-8", errors="replace", newline=None)
+    return open(path, "r", encoding="utf-8", errors="replace", newline=None)
+
+
+def detect_layout(header, first_row=None):
+    """
+    Layout name for a header (list of column names) and optional first data
+    row (list of cells).
+    """
+    if ERROR_FLAG_COLUMN in header:
+        return "v2"
+    if BUCKET_COLUMN in header:
+        return "rollup"
+    if first_row is not None and any(cell.lstrip().startswith("[") for cell in first_row[3:]):
+        return "legacy_list"
+    return "legacy"
+
+
+def _to_float(col):
+    """
+    float64 array from a column of cells; blanks, "Error ..." cells and
+    anything unparsable become NaN. Cells holding a legacy list repr
+    "['Success EC 106 ', ' 16.88']" give the number after the last comma.
+    """
+    col = np.char.strip(col)
+    # judged on the whole cell: "['Error EC 106 ', ' 254']" carries a status
+    # code, not a reading, after its last comma
+    bad = (col == "") | (np.char.find(col, "Error") >= 0)
+    listed = np.char.startswith(col, "[")
+    if listed.any():
+        payload = np.char.strip(np.char.rpartition(col, ",")[..., 2], " '[]")
+        col = np.where(listed, payload, col)
+    col = np.where(bad, "nan", col)
+    try:
+        return col.astype(np.float64)
+    except ValueError:
+        # something odd in this chunk, fall back to element-wise for it only
+        def safe(cell):
+            try:
+                return float(cell)
+            except ValueError:
+                return np.nan
+        return np.fromiter((safe(c) for c in col), dtype=np.float64, count=len(col))
+
+
+def _to_time(col):
+    col = np.char.strip(col)
+    try:
+        return col.astype("datetime64[ms]")
+    except ValueError:
+        def safe(cell):
+            try:
+                return np.datetime64(cell, "ms")
+            except ValueError:
+                return np.datetime64("NaT", "ms")
+        return np.array([safe(c) for c in col], dtype="datetime64[ms]")
+
+
+def _split_chunk(lines, n_columns, delimiter):
+    """
+    2-D array of cells for a chunk of lines. Clean lines are split with one
+    str.split over the whole chunk; quoted lines (an ErrorDetail holding the
+    delimiter) and short or long lines go through the csv module.
+    """
+    arr = np.array(lines)
+    clean = (np.char.count(arr, delimiter) == n_columns - 1) & (np.char.find(arr, '"') < 0)
+    if clean.all():
+        fast_lines = lines
+        slow_rows = []
+    else:
+        fast_lines = arr[clean].tolist()
+        slow_rows = []
+        for row in csv.reader(arr[~clean].tolist(), delimiter=delimiter):
+            if len(row) < n_columns:
+                row = row + [""] * (n_columns - len(row))
+            slow_rows.append(row[:n_columns])
+
+    if fast_lines:
+        cells = np.array(delimiter.join(fast_lines).split(delimiter)).reshape(-1, n_columns)
+    else:
+        cells = np.zeros((0, n_columns), dtype=str)
+    if slow_rows:
+        cells = np.concatenate([cells, np.array(slow_rows, dtype=str).reshape(-1, n_columns)])
+        # put the rows back in file order
+        order = np.concatenate([np.flatnonzero(clean), np.flatnonzero(~clean)])
+        restored = np.empty_like(cells)
+        restored[order] = cells
+        cells = restored
+    return cells
+
+
+def _forward_fill(values, held, previous):
+    """
+    values with every held cell replaced by the last value before it;
+    previous stands before the first row.
+    """
+    if not held.any():
+        return values
+    extended = np.concatenate(([previous], values))
+    source = np.arange(len(extended))
+    source[1:][held] = 0
+    np.maximum.accumulate(source, out=source)
+    return extended[source[1:]]
+
+
+def _block_from_cells(layout, header, cells, held_values=None):
+    """
+    held_values (a dict, for a deadband log) carries each channel's last
+    value from one chunk to the next.
+    """
+    columns = {name: cells[:, i] for i, name in enumerate(header)}
+    channels = {name: _to_float(col) for name, col in columns.items() if name not in _NON_CHANNEL_COLUMNS}
+    if held_values is not None:
+        for name, values in channels.items():
+            values = _forward_fill(values, np.char.strip(columns[name]) == "", held_values.get(name, np.nan))
+            channels[name] = values
+            if len(values):
+                held_values[name] = values[-1]
+    n = len(cells)
+    nan = np.full(n, np.nan)
+
+    if ERROR_FLAG_COLUMN in columns:
+        error_flag = np.nan_to_num(_to_float(columns[ERROR_FLAG_COLUMN])).astype(np.int8)
+    elif channels:
+        error_flag = np.isnan(np.column_stack(list(channels.values()))).any(axis=1).astype(np.int8)
+    else:
+        error_flag = np.zeros(n, dtype=np.int8)
+
+    return Log_Block(
+        layout,
+        _to_time(columns[TIME_COLUMN]) if TIME_COLUMN in columns else np.full(n, np.datetime64("NaT", "ms")),
+        _to_float(columns[ELAPSED_COLUMN]) if ELAPSED_COLUMN in columns else nan,
+        _to_float(columns[LOOP_COLUMN]) if LOOP_COLUMN in columns else nan,
+        channels,
+        error_flag,
+    )
+
+
+def _binary_blocks(path, chunk_rows):
+    header, records = Atlas_Binary_Log.open_memmap(path)
+    chunks = (records[lo:lo + chunk_rows] for lo in range(0, max(len(records), 1), chunk_rows))
+    yield from _record_blocks(header, chunks)
+
+
+def _compressed_binary_blocks(path, chunk_rows):
+    """
+    Binary log inside a .gz/.xz file (a compressed Atlas_Segmented_Log
+    segment), decompressed chunk_rows records at a time.
+    """
+    opener = gzip.open if path.endswith(".gz") else lzma.open
+    with opener(path, "rb") as f:
+        header, _ = Atlas_Binary_Log.read_header_from(f, path)
+        dtype = Atlas_Binary_Log.record_dtype(len(header["channels"]))
+
+        def chunks():
+            while True:
+                data = f.read(dtype.itemsize * chunk_rows)
+                usable = len(data) - len(data) % dtype.itemsize
+                if usable:
+                    yield np.frombuffer(data[:usable], dtype=dtype)
+                if len(data) < dtype.itemsize * chunk_rows:
+                    return
+
+        yield from _record_blocks(header, chunks())
+
+
+def _is_compressed_binary(path):
+    opener = gzip.open if path.endswith(".gz") else lzma.open
+    with opener(path, "rb") as f:
+        return f.read(len(Atlas_Binary_Log.MAGIC)) == Atlas_Binary_Log.MAGIC
+
+
+def _record_blocks(header, chunks):
+    names = header["channels"]
+    start = header.get("start_time")
+    offset_ms = None
+
+    for chunk in chunks:
+        if start is None:
+            start = float(chunk["time"][0]) if len(chunk) else 0.0
+        if offset_ms is None:
+            # epoch seconds -> naive local time, to match the text logs
+            utc_offset = datetime.datetime.fromtimestamp(start).astimezone().utcoffset()
+            offset_ms = np.timedelta64(int(utc_offset.total_seconds() * 1000), "ms")
+        t = chunk["time"]
+        values = chunk["values"].astype(np.float64)
+        channels = {name: values[:, i] for i, name in enumerate(names)}
+        loop_time = channels.pop(LOOP_COLUMN, np.full(len(chunk), np.nan))
+        yield Log_Block(
+            "binary",
+            (t * 1000).astype("datetime64[ms]") + offset_ms,
+            t - start,
+            loop_time,
+            channels,
+            (chunk["error_bits"] != 0).astype(np.int8),
+        )
+
+
+def iter_blocks(path, chunk_rows=100_000, delimiter=";"):
+    """
+    Yield Log_Blocks of at most chunk_rows rows.
+    """
+    path = str(path)
+    if path.endswith((".gz", ".xz")):
+        if _is_compressed_binary(path):
+            yield from _compressed_binary_blocks(path, chunk_rows)
+            return
+    elif Atlas_Binary_Log.is_binary_log(path):
+        yield from _binary_blocks(path, chunk_rows)
+        return
+
+    with open_text(path) as f:
+        header_line = f.readline().rstrip("\n")
+        if not header_line:
+            return
+        header = next(csv.reader([header_line], delimiter=delimiter))
+        n_columns = len(header)
+        layout = None
+        held_values = {} if HELD_COLUMN in header else None
+
+        while True:
+            lines = []
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    lines.append(line)
+                    if len(lines) >= chunk_rows:
+                        break
+            if not lines:
+                return
+            if layout is None:
+                layout = detect_layout(header, lines[0].split(delimiter))
+            yield _block_from_cells(layout, header, _split_chunk(lines, n_columns, delimiter), held_values)
+            if len(lines) < chunk_rows:
+                return
+
+
+def concat_blocks(blocks):
+    blocks = list(blocks)
+    if not blocks:
+        return None
+    if len(blocks) == 1:
+        return blocks[0]
+    return Log_Block(
+        blocks[0].layout,
+        np.concatenate([b.time for b in blocks]),
+        np.concatenate([b.elapsed for b in blocks]),
+        np.concatenate([b.loop_time for b in blocks]),
+        {name: np.concatenate([b.channels[name] for b in blocks]) for name in blocks[0].channels},
+        np.concatenate([b.error_flag for b in blocks]),
+    )
+
+
+def load_log(path, chunk_rows=100_000, delimiter=";"):
+    """
+    Whole log as one Log_Block (None for an empty file).
+    """
+    return concat_blocks(iter_blocks(path, chunk_rows=chunk_rows, delimiter=delimiter))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Load Atlas datalogs and print a per-channel summary")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+    for path in args.paths:
+        t0 = time.perf_counter()
+        log = load_log(path)
+        if log is None:
+            print(f"{path}: empty")
+            continue
+        print(f"{path}: {log.layout}, {len(log)} rows, {int(log.error_flag.sum())} with errors, "
+              f"loaded in {time.perf_counter() - t0:.3f}s")
+        for name, values in log.channels.items():
+            good = values[~np.isnan(values)]
+            if len(good):
+                print(f"  {name}: mean={good.mean():.4g} min={good.min():.4g} max={good.max():.4g} "
+                      f"NaN={len(values) - len(good)}")
+            else:
+                print(f"  {name}: no values")
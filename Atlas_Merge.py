@@ -0,0 +1,301 @@
+"""
+Atlas_Merge.py
+
+Merge the logs of several rigs onto one time grid, in constant memory.
+
+- Every input is streamed a chunk at a time through Atlas_Log_Loader, so
+  any layout it reads works (V2 and legacy CSV, binary, .gz/.xz, and the
+  segment index of a rotated log)
+- The per-log row streams go through a heap-based k-way merge on timestamp
+  (heapq.merge), so rows come out in global time order whatever the number
+  of logs and however long they are
+- Grid_Aligner keeps, per log, only the samples within `tolerance` of the
+  grid point being filled, and emits a grid point as soon as the merged
+  stream has passed it by more than the tolerance: memory depends on
+  tolerance / sample period, never on file size
+- method "nearest" takes each log's closest sample within the tolerance,
+  "linear" interpolates between the samples on either side of the grid
+  point when both are within the tolerance (else falls back to nearest);
+  a log with nothing in range leaves its columns empty
+- Stretches where no log has data are skipped instead of filled with empty
+  rows (fill_gaps=True keeps them)
+- One wide semicolon CSV: the time, then "<label> <channel>" for every
+  channel of every log; .gz/.xz output is compressed on the fly
+
+Times are the logs' local wall clock times, so the rigs must share a time
+zone (and should run NTP).
+
+Usage:
+
+    merge_logs(["rigA.csv", "rigB.csv.gz"], "merged.csv", step=1.0,
+               tolerance=0.5, method="linear", channels=["Conductivity"])
+
+    python Atlas_Merge.py rigA.csv rigB.csv.gz -o merged.csv --step 1 --method linear
+"""
+
+import argparse
+import csv
+import gzip
+import heapq
+import lzma
+import math
+import os
+
+import numpy as np
+
+from Atlas_Log_Loader import iter_blocks
+from Atlas_Segmented_Log import INDEX_SUFFIX, iter_window
+
+METHODS = ("nearest", "linear")
+
+
+def _blocks(path, chunk_rows):
+    if str(path).endswith(INDEX_SUFFIX):
+        return iter_window(path, chunk_rows=chunk_rows)
+    return iter_blocks(path, chunk_rows=chunk_rows)
+
+
+def log_channels(path, channels=None):
+    """
+    Channel names of a log, limited to those containing one of the
+    substrings in channels (None keeps them all).
+    """
+    block = next(_blocks(path, 1), None)
+    if block is None:
+        return []
+    names = block.channel_names
+    if channels:
+        names = [name for name in names if any(c in name for c in channels)]
+    return names
+
+
+def iter_rows(path, names, chunk_rows=100_000):
+    """
+    (time, values) per row of a log: time in seconds (local wall clock as
+    if it were UTC), values a float64 array over names (NaN = missing).
+    Rows without a valid time are skipped.
+
+    The time stamps of 1 Hz logs are whole seconds (two rows can share
+    one), so where "Time from Start" is there the time is the run's start
+    plus that; the start is the latest stamp - elapsed seen, which is the
+    tightest bound the truncated stamps give. A run appended to the same
+    file (elapsed going back) starts over.
+    """
+    base = None
+    last_elapsed = -math.inf
+    for block in _blocks(path, chunk_rows):
+        valid = ~np.isnat(block.time)
+        times = block.time.astype("datetime64[ms]").astype(np.int64) / 1000.0
+        elapsed = block.elapsed
+        exact = valid & np.isfinite(elapsed)
+        if exact.any():
+            idx = np.flatnonzero(exact)
+            runs = np.split(idx, np.flatnonzero(np.diff(elapsed[idx]) < 0) + 1)
+            for n, run in enumerate(runs):
+                offset = float(np.max(times[run] - elapsed[run]))
+                if base is None or n > 0 or elapsed[run[0]] < last_elapsed:
+                    base = offset
+                else:
+                    base = max(base, offset)
+                times[run] = base + elapsed[run]
+                last_elapsed = elapsed[run[-1]]
+        if names:
+            values = np.column_stack([block.channels[name] for name in names])
+        else:
+            values = np.zeros((len(block), 0))
+        yield from zip(times[valid].tolist(), values[valid])
+
+
+def merge_rows(streams):
+    """
+    k-way merge of per-log (time, values) streams into (time, log index,
+    values), in time order; ties keep the logs' order.
+    """
+    return heapq.merge(*(_tagged(stream, k) for k, stream in enumerate(streams)),
+                       key=lambda item: (item[0], item[1]))
+
+
+def _tagged(stream, k):
+    for t, values in stream:
+        yield t, k, values
+
+
+class Grid_Aligner:
+    """
+    Turns a time ordered (time, log index, values) stream into rows on the
+    grid start + n * step. widths is the number of channels per log.
+    """
+
+    def __init__(self, widths, step=1.0, tolerance=None, method="nearest", start=None, fill_gaps=False):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}")
+        if step <= 0:
+            raise ValueError("step must be positive")
+        self.widths = list(widths)
+        self.step = step
+        self.tolerance = step / 2 if tolerance is None else tolerance
+        self.method = method
+        self.start = start
+        self.fill_gaps = fill_gaps
+        self._samples = [[] for _ in self.widths]  # per log: (time, values), oldest first
+        self._n = None  # index of the next grid point to emit
+        self._blanks = [np.full(w, np.nan) for w in self.widths]
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def _grid_time(self, n):
+        return self.start + n * self.step
+
+    def add(self, t, k, values):
+        """
+        One sample; yields the (grid time, [values per log]) rows it completes.
+        """
+        if self._n is None:
+            if self.start is None:
+                # align to multiples of step, like the rollups
+                self.start = math.ceil((t - self.tolerance) / self.step) * self.step
+            self._n = max(0, math.ceil((t - self.tolerance - self.start) / self.step))
+        while t > self._grid_time(self._n) + self.tolerance:
+            self._prune()
+            if not self.fill_gaps and not any(self._samples):
+                # nothing buffered: jump to the first grid point this sample can reach
+                self._n = max(self._n, math.ceil((t - self.tolerance - self.start) / self.step))
+                break
+            yield self._emit()
+        self._samples[k].append((t, values))
+        self.rows_in += 1
+
+    def finish(self):
+        """
+        Rows for the grid points the buffered samples still reach.
+        """
+        if self._n is None:
+            return
+        while True:
+            self._prune()
+            if not any(self._samples):
+                return
+            yield self._emit()
+
+    def _prune(self):
+        """
+        Drop the samples that neither the next grid point nor any later one can use.
+        """
+        lo = self._grid_time(self._n) - self.tolerance
+        for samples in self._samples:
+            drop = 0
+            while drop < len(samples) and samples[drop][0] < lo:
+                drop += 1
+            if drop:
+                del samples[:drop]
+
+    def _emit(self):
+        g = self._grid_time(self._n)
+        self._prune()
+        row = [self._value_at(g, samples, k) for k, samples in enumerate(self._samples)]
+        self._n += 1
+        self.rows_out += 1
+        return g, row
+
+    def _value_at(self, g, samples, k):
+        hi = g + self.tolerance
+        before = after = None
+        for t, values in samples:
+            if t > hi:
+                break
+            if t <= g:
+                before = (t, values)
+            elif after is None:
+                after = (t, values)
+        if before is None and after is None:
+            return self._blanks[k]
+        if self.method == "linear" and before is not None and after is not None:
+            (t0, v0), (t1, v1) = before, after
+            return v0 + (v1 - v0) * ((g - t0) / (t1 - t0))
+        if before is None:
+            return after[1]
+        if after is None:
+            return before[1]
+        return before[1] if g - before[0] <= after[0] - g else after[1]
+
+
+def _open_output(path):
+    path = str(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+    if path.endswith(".xz"):
+        return lzma.open(path, "wt", newline="", encoding="utf-8")
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def _label(path):
+    name = os.path.basename(str(path))
+    for suffix in (".gz", ".xz", INDEX_SUFFIX, ".csv", ".bin"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def _format_time(t, subsecond):
+    stamp = str(np.datetime64(int(round(t * 1000)), "ms")).replace("T", " ")
+    return stamp if subsecond else stamp[:19]
+
+
+def merge_logs(paths, output, step=1.0, tolerance=None, method="nearest", labels=None,
+               channels=None, start=None, fill_gaps=False, delimiter=";", chunk_rows=100_000):
+    """
+    Merge paths onto one grid and write the wide table to output. Returns
+    the Grid_Aligner (rows_in / rows_out counts).
+    """
+    paths = [str(p) for p in paths]
+    labels = list(labels) if labels else [_label(p) for p in paths]
+    if len(labels) != len(paths):
+        raise ValueError("need one label per log")
+    names = [log_channels(p, channels) for p in paths]
+    aligner = Grid_Aligner([len(n) for n in names], step=step, tolerance=tolerance, method=method,
+                           start=start, fill_gaps=fill_gaps)
+    subsecond = step < 1.0 or (start is not None and start % 1)
+
+    header = ["Time (Y-M-D-H-M-S)"] + [f"{label} {name}" for label, log in zip(labels, names) for name in log]
+    streams = [iter_rows(p, n, chunk_rows) for p, n in zip(paths, names)]
+
+    def cells(g, row):
+        out = [_format_time(g, subsecond)]
+        for values in row:
+            out.extend("" if v != v else v for v in values.tolist())
+        return out
+
+    with _open_output(output) as f:
+        writer = csv.writer(f, delimiter=delimiter)
+        writer.writerow(header)
+        for t, k, values in merge_rows(streams):
+            for g, row in aligner.add(t, k, values):
+                writer.writerow(cells(g, row))
+        for g, row in aligner.finish():
+            writer.writerow(cells(g, row))
+    return aligner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge Atlas datalogs from several rigs onto one time grid")
+    parser.add_argument("paths", nargs="+", help="datalogs (.csv, .bin, .gz/.xz, or a segment .index.json)")
+    parser.add_argument("-o", "--output", required=True, help="merged CSV (.gz/.xz to compress)")
+    parser.add_argument("--step", type=float, default=1.0, help="grid step in seconds (default 1)")
+    parser.add_argument("--tolerance", type=float,
+                        help="how far a sample may be from a grid point, seconds (default step / 2)")
+    parser.add_argument("--method", choices=METHODS, default="nearest")
+    parser.add_argument("--label", action="append", dest="labels",
+                        help="column prefix per log, in order (default: file name)")
+    parser.add_argument("--channel", action="append", dest="channels",
+                        help="only channels whose name contains this, repeat for several")
+    parser.add_argument("--fill-gaps", action="store_true",
+                        help="write empty rows where no log has data")
+    args = parser.parse_args()
+    aligner = merge_logs(args.paths, args.output, step=args.step, tolerance=args.tolerance,
+                         method=args.method, labels=args.labels, channels=args.channels,
+                         fill_gaps=args.fill_gaps)
+    print(f"{aligner.rows_in} samples from {len(args.paths)} logs -> {aligner.rows_out} rows in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Atlas_Metrics.py
+
+Live metrics for an acquisition loop, served over HTTP without ever blocking it.
+
+- Metrics_Registry is updated by the acquisition thread only: latest value
+  per channel, sample and error-row counters, the error ratio over the last
+  ERROR_WINDOW rows, loop-time and per-device read-latency histograms, writer
+  queue depth and scheduler counters
+- publish() freezes the current state into a new snapshot dict and swaps it
+  in with a single reference assignment; readers only ever see a complete
+  snapshot and no lock is shared with the acquisition thread
+- Metrics_Server runs a small HTTP server on its own daemon thread:
+    /metrics       Prometheus text exposition format
+    /metrics.json  the snapshot as JSON
+
+Usage:
+
+    metrics = Metrics_Registry(channels)
+    server = Metrics_Server(metrics, port=9108)
+    ...
+    metrics.observe_row(values, error)          # once per sample
+    metrics.observe_loop(loop_time)
+    metrics.observe_read(device_name, latency)
+    metrics.publish()
+    ...
+    server.close()
+"""
+
+import bisect
+import collections
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; EZO conversions are 0.6 - 0.9 s, so the buckets are dense there
+LOOP_BUCKETS = (.05, .1, .25, .5, .6, .7, .8, .9, 1.0, 1.25, 1.5, 2.0, 5.0)
+READ_BUCKETS = (.01, .05, .1, .25, .5, .6, .7, .8, .9, 1.0, 1.5, 2.0)
+ERROR_WINDOW = 600
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (Prometheus style: le upper bounds plus +Inf).
+    """
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, x):
+        self.counts[bisect.bisect_left(self.bounds, x)] += 1
+        self.total += x
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = []
+        running = 0
+        for c in self.counts:
+            running += c
+            cumulative.append(running)
+        return {"le": list(self.bounds) + ["+Inf"], "cumulative": cumulative,
+                "sum": self.total, "count": self.count}
+
+
+class Metrics_Registry:
+    """
+    Metrics for one acquisition loop. Every observe_* / set_* call must come
+    from the same thread; publish() makes the result visible to the server.
+    """
+
+    def __init__(self, channels, error_window=ERROR_WINDOW):
+        self.channels = list(channels)
+        self.values = [None] * len(self.channels)
+        self.samples = 0
+        self.error_rows = 0
+        self._recent_errors = collections.deque(maxlen=error_window)
+        self._recent_error_count = 0
+        self.loop_time = Histogram(LOOP_BUCKETS)
+        self.read_latency = {}
+        self.gauges = {}
+        self.started = time.time()
+        self._snapshot = self._build()
+
+    def observe_row(self, values, error=False):
+        """
+        One logged row: the channel values (None = missing) and whether the
+        row carried an error.
+        """
+        self.samples += 1
+        for i, v in enumerate(values):
+            if v is not None:
+                self.values[i] = v
+        error = bool(error)
+        if error:
+            self.error_rows += 1
+        if len(self._recent_errors) == self._recent_errors.maxlen:
+            self._recent_error_count -= self._recent_errors[0]
+        self._recent_errors.append(error)
+        self._recent_error_count += error
+
+    def observe_loop(self, seconds):
+        self.loop_time.observe(seconds)
+
+    def observe_read(self, device, seconds):
+        hist = self.read_latency.get(device)
+        if hist is None:
+            hist = self.read_latency[device] = Histogram(READ_BUCKETS)
+        hist.observe(seconds)
+
+    def set_gauge(self, name, value):
+        """
+        Any other number to export, e.g. writer queue depth.
+        """
+        self.gauges[name] = value
+
+    def _build(self):
+        recent = len(self._recent_errors)
+        return {
+            "time": time.time(),
+            "uptime_s": time.time() - self.started,
+            "channels": dict(zip(self.channels, self.values)),
+            "samples_total": self.samples,
+            "error_rows_total": self.error_rows,
+            "error_ratio_recent": self._recent_error_count / recent if recent else 0.0,
+            "loop_seconds": self.loop_time.snapshot(),
+            "read_latency_seconds": {dev: h.snapshot() for dev, h in self.read_latency.items()},
+            "gauges": dict(self.gauges),
+        }
+
+    def publish(self):
+        self._snapshot = self._build()
+
+    def snapshot(self):
+        return self._snapshot
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _histogram_lines(name, hist, labels=""):
+    sep = "," if labels else ""
+    lines = []
+    for le, count in zip(hist["le"], hist["cumulative"]):
+        le = le if le == "+Inf" else repr(float(le))
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {count}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {_number(hist['sum'])}")
+    lines.append(f"{name}_count{suffix} {hist['count']}")
+    return lines
+
+
+def prometheus_text(snap, prefix="atlas"):
+    lines = [
+        f"# HELP {prefix}_channel_value Latest value of each logged channel.",
+        f"# TYPE {prefix}_channel_value gauge",
+    ]
+    for channel, value in snap["channels"].items():
+        lines.append(f'{prefix}_channel_value{{channel="{_label(channel)}"}} {_number(value)}')
+    lines += [
+        f"# TYPE {prefix}_samples_total counter",
+        f"{prefix}_samples_total {snap['samples_total']}",
+        f"# HELP {prefix}_error_rows_total Rows logged with ErrorFlag set.",
+        f"# TYPE {prefix}_error_rows_total counter",
+        f"{prefix}_error_rows_total {snap['error_rows_total']}",
+        f"# HELP {prefix}_error_ratio_recent Fraction of the most recent rows with ErrorFlag set.",
+        f"# TYPE {prefix}_error_ratio_recent gauge",
+        f"{prefix}_error_ratio_recent {_number(snap['error_ratio_recent'])}",
+        f"# TYPE {prefix}_uptime_seconds gauge",
+        f"{prefix}_uptime_seconds {_number(snap['uptime_s'])}",
+        f"# HELP {prefix}_loop_seconds Time spent per acquisition loop.",
+        f"# TYPE {prefix}_loop_seconds histogram",
+    ]
+    lines += _histogram_lines(f"{prefix}_loop_seconds", snap["loop_seconds"])
+    lines += [
+        f"# HELP {prefix}_read_latency_seconds Time from the start of a read cycle to each device's response.",
+        f"# TYPE {prefix}_read_latency_seconds histogram",
+    ]
+    for device, hist in snap["read_latency_seconds"].items():
+        lines += _histogram_lines(f"{prefix}_read_latency_seconds", hist, f'device="{_label(device)}"')
+    for name, value in snap["gauges"].items():
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class Metrics_Server:
+    """
+    Serves a Metrics_Registry's latest snapshot on its own daemon thread.
+    Each snapshot is rendered once, on the first scrape that sees it.
+    """
+
+    def __init__(self, registry, host="0.0.0.0", port=9108):
+        self.registry = registry
+        self._rendered = (None, None, None)  # snapshot, prometheus text, json
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path in ("/", "/metrics"):
+                    body, ctype = server.render()[0], "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body, ctype = server.render()[1], "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass  # keep the acquisition console clean
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="atlas-metrics", daemon=True)
+        self._thread.start()
+
+    def render(self):
+        snap = self.registry.snapshot()
+        cached_snap, text, js = self._rendered
+        if cached_snap is not snap:
+            text = prometheus_text(snap)
+            js = json.dumps(snap, default=str)
+            self._rendered = (snap, text, js)
+        return text, js
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
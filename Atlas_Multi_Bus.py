@@ -0,0 +1,236 @@
+"""
+Atlas_Multi_Bus.py
+
+Concurrent acquisition across several I2C buses.
+
+Multi_Bus_Reader groups a device list by bus and gives each bus its own
+worker thread. read_all() starts every worker at once; each runs the usual
+write "R" / wait / read cycle for its own devices (waiting each device's "R"
+timeout, or polling for readiness) and the results
+are merged back into the order of the original device list. Buses run in
+parallel, so probes added on a second bus add no time to the loop.
+
+Each tick carries the time its slowest bus spent writing, waiting and
+reading (Bus_Tick.phases) for Atlas_Profiling, and each cycle runs in a
+profiled_section so a cProfile run covers the workers too.
+
+Each bus reads its devices in timeout classes compiled once per command
+(the driver's timeout_classes, or an Atlas_Acquisition_Plan's with plan=):
+fast boards are read as soon as they are ready, not after the slowest.
+
+A device that fails only spoils its own slot: the cycle is the driver's
+read_cycle, which retries NACKs and stuck 254s and skips devices whose
+circuit breaker (Atlas_Circuit_Breaker.py) has quarantined them.
+
+Between cycles each worker drains its devices' command queues (see
+Atlas_Command_Queue.py) until the next cycle is due: pass idle_until to
+read_all, otherwise the worker assumes the same interval as the last cycle.
+
+Usage:
+
+    reader = Multi_Bus_Reader(device_list)
+    tick = reader.read_all(idle_until=scheduler.next_deadline())
+    tick.readings    # EZO_Reading per device, in device_list order
+    tick.responses   # the same as the strings read_recieve_all returns
+    tick.read_times  # time.monotonic() each response was read
+    reader.close()
+"""
+
+import queue
+import threading
+import time
+
+from Atlas_Command_Queue import queue_for
+from Atlas_I2C_Driver_JQ import Read_Fault, read_cycle, timeout_classes
+from Atlas_Profiling import profiled_section
+
+_STOP = object()
+
+
+class Bus_Tick:
+    """
+    Merged result of one read_all().
+
+    readings : EZO_Reading per device, in device_list order (None for a
+               device that was asleep, a Read_Fault for one that NACKed or
+               is quarantined)
+    devices  : the device list the readings line up with
+    started  : time.monotonic() read_all() was called
+    finished : time.monotonic() the last bus finished
+    phases   : {"i2c_write" | "i2c_wait" | "i2c_read" | "i2c_poll": seconds},
+               the longest of any bus (buses run in parallel)
+    """
+
+    __slots__ = ("readings", "devices", "started", "finished", "phases")
+
+    def __init__(self, readings, devices, started, finished, phases=None):
+        self.readings = readings
+        self.devices = devices
+        self.started = started
+        self.finished = finished
+        self.phases = phases or {}
+
+    @property
+    def responses(self):
+        """
+        The "Success ..." / "Error ..." strings read_recieve_all returns.
+        """
+        return ["sleep mode" if reading is None else dev.format_reading(reading)
+                for dev, reading in zip(self.devices, self.readings)]
+
+    @property
+    def read_times(self):
+        """
+        time.monotonic() each response was read, None where there was none.
+        """
+        return [None if reading is None or isinstance(reading, Read_Fault) else reading.read_time
+                for reading in self.readings]
+
+
+class Bus_Worker:
+    """
+    Runs the write/wait/read cycle for the devices on one bus on its own thread.
+    """
+
+    def __init__(self, bus, devices, poll=False, plan=None):
+        self.bus = bus
+        self.devices = list(devices)
+        self.poll = poll
+        self.plan = plan
+        self._classes = {}  # command -> timeout classes of self.devices
+        self._jobs = queue.Queue(maxsize=1)
+        self._results = queue.Queue(maxsize=1)
+        self._last_start = None
+        self._interval = None
+        self.phases = {}
+        self._thread = threading.Thread(target=self._run, name=f"atlas-bus-{bus}", daemon=True)
+        self._thread.start()
+
+    def start_cycle(self, command="R", idle_until=None):
+        self._jobs.put((command, idle_until))
+
+    def wait_cycle(self):
+        """
+        Returns the cycle's readings or raises what the cycle raised.
+        """
+        ok, result = self._results.get()
+        if not ok:
+            raise result
+        return result
+
+    def stop(self):
+        self._jobs.put(_STOP)
+        self._thread.join()
+
+    def classes(self, command="R"):
+        classes = self._classes.get(command)
+        if classes is None:
+            if self.plan is not None:
+                classes = self.plan.classes_for(self.devices, command)
+            else:
+                classes = timeout_classes(self.devices, command)
+            self._classes[command] = classes
+        return classes
+
+    def cycle(self, command="R"):
+        phases = {}
+        readings = read_cycle(self.devices, command, poll=self.poll, phases=phases,
+                              classes=self.classes(command))
+        self.phases = phases
+        return readings
+
+    def run_idle(self, until):
+        """
+        Send queued commands for this bus's devices until `until`, highest
+        priority first across the devices.
+        """
+        queues = [q for q in (queue_for(dev, create=False) for dev in self.devices) if q is not None]
+        while True:
+            waiting = sorted((q for q in queues if len(q)), key=lambda q: q.peek_priority())
+            # a command too long for the gap does not hold up shorter ones behind it
+            if not any(q.run_one(until) for q in waiting):
+                return
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is _STOP:
+                return
+            command, idle_until = job
+            started = time.monotonic()
+            if self._last_start is not None:
+                self._interval = started - self._last_start
+            self._last_start = started
+            try:
+                with profiled_section():
+                    readings = self.cycle(command)
+                self._results.put((True, readings))
+            except Exception as e:
+                self._results.put((False, e))
+                continue
+            if idle_until is None and self._interval is not None:
+                idle_until = started + self._interval
+            self.run_idle(idle_until if idle_until is not None else started)
+
+
+class Multi_Bus_Reader:
+    """
+    One Bus_Worker per bus in device_list; read_all() reads them all in parallel.
+    plan (an Atlas_Acquisition_Plan) sets the devices' "R" timeouts.
+    """
+
+    def __init__(self, device_list, poll=False, plan=None):
+        self.device_list = list(device_list)
+        by_bus = {}
+        for dev in self.device_list:
+            by_bus.setdefault(dev.bus, []).append(dev)
+
+        # where each worker's results go in the merged tick
+        self._slots = {}
+        position = {id(dev): i for i, dev in enumerate(self.device_list)}
+        self.workers = []
+        for bus in sorted(by_bus):
+            worker = Bus_Worker(bus, by_bus[bus], poll=poll, plan=plan)
+            self.workers.append(worker)
+            self._slots[bus] = [position[id(dev)] for dev in by_bus[bus]]
+
+    @property
+    def buses(self):
+        return [worker.bus for worker in self.workers]
+
+    def read_all(self, command="R", idle_until=None):
+        """
+        One cycle on every bus. idle_until (time.monotonic()) is when the next
+        cycle is due; queued commands are sent in the gap until then.
+        """
+        started = time.monotonic()
+        for worker in self.workers:
+            worker.start_cycle(command, idle_until)
+
+        readings = [None] * len(self.device_list)
+        phases = {}
+        error = None
+        for worker in self.workers:
+            try:
+                bus_readings = worker.wait_cycle()
+            except Exception as e:
+                error = error or e
+                continue
+            for slot, reading in zip(self._slots[worker.bus], bus_readings):
+                readings[slot] = reading
+            for phase, seconds in worker.phases.items():
+                phases[phase] = max(seconds, phases.get(phase, 0.0))
+        if error is not None:
+            raise error
+        return Bus_Tick(readings, self.device_list, started, time.monotonic(), phases)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,328 @@
+"""
+Atlas_Profiling.py
+
+Per-phase timing for the acquisition hot path, plus an opt-in profiler hook.
+
+- Phase_Timer splits each loop iteration into named phases with lap() (one
+  perf_counter call per phase boundary) and feeds each phase's duration to a
+  Log_Histogram: quarter-octave buckets from 1 us, so recording is a log2 and
+  an increment, with min/max/mean and bucket-resolution percentiles
+- last holds the phases of the current tick (for extra CSV columns) and
+  report() is the table printed when the logger exits
+- Profile_Hook attaches cProfile, or a built-in sampling profiler (stacks of
+  every thread every few ms, written as collapsed stacks for flamegraph.pl /
+  speedscope, rooted at the thread name), for N ticks starting at a chosen
+  tick
+- The I2C work runs on the Atlas_Multi_Bus worker threads, which cProfile
+  does not see before Python 3.12: the workers wrap each cycle in
+  profiled_section(), which profiles it into the running cProfile session
+  (a no-op when there is none), and the hook merges every thread's stats
+
+Usage:
+
+    timer = Phase_Timer()
+    timer.begin()
+    ...write...;  timer.lap("write")
+    ...sleep...;  timer.lap("wait")
+    timer.add("i2c_read", seconds)       # a duration measured elsewhere
+    print(timer.report())
+
+    hook = Profile_Hook("cprofile", ticks=50, start_tick=10, output="run.prof")
+    for tick in scheduler:
+        hook.tick(tick_number)
+        ...
+    hook.close()
+
+    with profiled_section():        # on a worker thread
+        ...
+"""
+
+import collections
+import contextlib
+import cProfile
+import math
+import pstats
+import sys
+import threading
+import time
+from time import perf_counter
+
+_BUCKETS_PER_OCTAVE = 4
+_BASE = 1e-6
+_N_BUCKETS = 120  # 1 us .. ~1e3 s
+
+
+class Log_Histogram:
+    """
+    Counts in logarithmic buckets; bucket b holds values in
+    [BASE * 2**(b/4), BASE * 2**((b+1)/4)).
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * _N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds <= _BASE:
+            b = 0
+        else:
+            b = min(int(math.log2(seconds / _BASE) * _BUCKETS_PER_OCTAVE), _N_BUCKETS - 1)
+        self.counts[b] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        if not self.count:
+            return math.nan
+        rank = math.ceil(pct / 100.0 * self.count)
+        running = 0
+        for b, c in enumerate(self.counts):
+            running += c
+            if running >= rank:
+                # geometric middle of the bucket, clamped to what was seen
+                mid = _BASE * 2 ** ((b + .5) / _BUCKETS_PER_OCTAVE)
+                return min(max(mid, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+
+class Phase_Timer:
+    """
+    Named phase durations per tick. Not thread-safe: use it from the thread
+    that runs the loop and hand it durations measured elsewhere with add().
+    """
+
+    def __init__(self):
+        self.histograms = collections.OrderedDict()
+        self.last = {}
+        self._mark = None
+
+    def begin(self):
+        """
+        Start of a tick: clears last and starts the first lap.
+        """
+        self.last = {}
+        self._mark = perf_counter()
+
+    def lap(self, phase):
+        """
+        Time since the previous lap (or begin) is charged to phase.
+        """
+        now = perf_counter()
+        self.add(phase, now - self._mark)
+        self._mark = now
+
+    def skip(self):
+        """
+        Restart the lap clock without charging the time to any phase.
+        """
+        self._mark = perf_counter()
+
+    def add(self, phase, seconds):
+        hist = self.histograms.get(phase)
+        if hist is None:
+            hist = self.histograms[phase] = Log_Histogram()
+        hist.add(seconds)
+        self.last[phase] = self.last.get(phase, 0.0) + seconds
+
+    def report(self, title="Phase timing"):
+        lines = [f"{title} (ms)",
+                 f"  {'phase':<16}{'count':>8}{'mean':>10}{'p50':>10}{'p99':>10}{'max':>10}"]
+        for phase, h in self.histograms.items():
+            lines.append(f"  {phase:<16}{h.count:>8}{h.mean * 1e3:>10.3f}{h.percentile(50) * 1e3:>10.3f}"
+                         f"{h.percentile(99) * 1e3:>10.3f}{h.max * 1e3:>10.3f}")
+        return "\n".join(lines)
+
+
+class Thread_Profiles:
+    """
+    One cProfile.Profile per thread for the threads that enter a
+    profiled_section while the session is active. close() waits for the
+    sections still running, after which the profiles can be merged.
+    """
+
+    def __init__(self):
+        self.profiles = {}
+        self.active = True
+        self._running = 0
+        self._cond = threading.Condition()
+
+    def enter(self):
+        with self._cond:
+            if not self.active:
+                return None
+            self._running += 1
+            name = threading.current_thread().name
+            profile = self.profiles.get(name)
+            if profile is None:
+                profile = self.profiles[name] = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def exit(self, profile):
+        profile.disable()
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def close(self, timeout=5.0):
+        with self._cond:
+            self.active = False
+            self._cond.wait_for(lambda: not self._running, timeout)
+
+
+# the session of the running cProfile Profile_Hook, None when there is none
+_thread_profiles = None
+
+
+@contextlib.contextmanager
+def profiled_section():
+    """
+    Profile the enclosed work of a thread other than the loop's into the
+    running cProfile session. From Python 3.12 one cProfile sees every
+    thread and no session is opened.
+    """
+    session = _thread_profiles
+    profile = session.enter() if session is not None else None
+    try:
+        yield
+    finally:
+        if profile is not None:
+            session.exit(profile)
+
+
+class Sampling_Profiler:
+    """
+    Samples the stacks of every thread (or only thread_id) every interval
+    seconds from a daemon thread; counts identical stacks, each rooted at
+    its thread's name.
+    """
+
+    def __init__(self, thread_id=None, interval=.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="atlas-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_id is not None and ident != self.thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(names.get(ident, str(ident)))
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, n=15):
+        """
+        The leaf frames that were sampled most, as (frame, share) pairs.
+        """
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(leaf, count / total) for leaf, count in leaves.most_common(n)]
+
+
+class Profile_Hook:
+    """
+    Profiles ticks [start_tick, start_tick + ticks) of the loop. kind is
+    "cprofile" (pstats dump to output) or "sample" (collapsed stacks to
+    output). Call tick() at the top of every iteration and close() on exit.
+    """
+
+    def __init__(self, kind="cprofile", ticks=50, start_tick=0, output=None):
+        if kind not in ("cprofile", "sample"):
+            raise ValueError("kind must be 'cprofile' or 'sample'")
+        self.kind = kind
+        self.ticks = ticks
+        self.start_tick = start_tick
+        self.output = output or ("atlas.prof" if kind == "cprofile" else "atlas.folded")
+        self._profiler = None
+        self._seen = 0
+        self.done = False
+
+    def tick(self, n=None):
+        if self.done:
+            return
+        n = self._seen if n is None else n
+        self._seen += 1
+        if self._profiler is None and n >= self.start_tick:
+            self._start()
+        elif self._profiler is not None and n >= self.start_tick + self.ticks:
+            self._finish()
+
+    def _start(self):
+        global _thread_profiles
+        if self.kind == "cprofile":
+            if sys.version_info < (3, 12):
+                _thread_profiles = Thread_Profiles()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = Sampling_Profiler()
+            self._profiler.start()
+        self._started = time.monotonic()
+
+    def _finish(self):
+        global _thread_profiles
+        profiler, self._profiler = self._profiler, None
+        self.done = True
+        elapsed = time.monotonic() - self._started
+        if self.kind == "cprofile":
+            profiler.disable()
+            stats = pstats.Stats(profiler)
+            session, _thread_profiles = _thread_profiles, None
+            if session is not None:
+                session.close()
+                for profile in session.profiles.values():
+                    stats.add(profile)
+            stats.dump_stats(self.output)
+            threads = 1 + (len(session.profiles) if session is not None else 0)
+            print(f"Profiled {self.ticks} ticks ({elapsed:.1f} s, {threads} thread(s)) -> {self.output}")
+            stats.sort_stats("cumulative").print_stats(20)
+        else:
+            profiler.stop()
+            profiler.write_collapsed(self.output)
+            print(f"Sampled {self.ticks} ticks ({elapsed:.1f} s) -> {self.output}")
+            for leaf, share in profiler.top():
+                print(f"  {share * 100:5.1f}%  {leaf}")
+
+    def close(self):
+        if self._profiler is not None:
+            self._finish()
@@ -0,0 +1,200 @@
+"""
+Atlas_Replay.py
+
+Feeds a recorded datalog back through the acquisition pipeline.
+
+- Replay_Source stands in for Multi_Bus_Reader (read_all) and for the
+  driver's read_recieve_all: each call returns the next recorded tick as
+  EZO_Readings or "Success ..." / "Error ..." strings, so parsing,
+  resistivity, stability, writers and metrics run unchanged on it
+- One replay device (an Atlas_I2C on a transport that refuses bus traffic)
+  per recorded conductivity channel, so device info and error strings look
+  like the rig's
+- speed=1.0 replays in real time from the log's "Time from Start" column,
+  speed=N at N times real time, speed=None as fast as the pipeline runs
+- A value missing from the recording (the probe errored in the field)
+  replays as a Read_Fault with code "missing" for that device only
+- The log is streamed a chunk at a time (Atlas_Log_Loader.iter_blocks), so
+  hours of data replay in constant memory; any layout the loader reads
+  works (legacy, legacy_list, v2, binary, compressed)
+- tick_time and tick_elapsed hold the recorded wall time and "Time from
+  Start" of the tick just returned, so a logger can stamp replayed rows
+  with the recording's time rather than the (compressed) replay time
+- At the end of the log read_all raises Replay_Finished
+
+Usage:
+
+    source = Replay_Source("Novus Long COnd Only 3.csv", speed=10)
+    tick = source.read_all()              # Bus_Tick, like Multi_Bus_Reader
+    source.tick_time, source.tick_elapsed # when it was recorded
+    source.read_recieve_all()             # strings, like the driver
+    source.close()
+
+    python Atlas_Cont_Read_I2C_V2.py --replay "Novus Long COnd Only 3.csv" --replay-speed 0
+"""
+
+import datetime
+import time
+
+from Atlas_I2C_Driver_JQ import Atlas_I2C, EZO_Reading, I2C_Transport, Read_Fault
+from Atlas_Log_Loader import iter_blocks
+from Atlas_Multi_Bus import Bus_Tick
+
+# bus number the replay devices report; no real bus has it
+REPLAY_BUS = -1
+# the rig's K0.1 probes start at 106
+FIRST_ADDRESS = 106
+
+
+class Replay_Finished(Exception):
+    """
+    The recording has no more ticks.
+    """
+
+
+class No_Bus_Transport(I2C_Transport):
+    """
+    Transport of a replay device: there is no bus behind it.
+    """
+
+    def set_address(self, addr):
+        pass
+
+    def read(self, num_of_bytes):
+        raise IOError("replay device: no I2C bus")
+
+    def write(self, data):
+        raise IOError("replay device: no I2C bus")
+
+
+def _device_name(channel):
+    # "K0.1 #1 Conductivity Reading (uS/cm)" -> "K0.1 #1"
+    return channel.split(" Conductivity", 1)[0].strip()
+
+
+class Replay_Source:
+    """
+    Recorded ticks from one datalog, paced at `speed` times real time.
+    channels picks the recorded channels to replay, one substring per
+    device (default: every conductivity channel, in log order).
+    tick_time (datetime, None before the first tick) and tick_elapsed
+    (seconds) are the recorded time of the last tick returned.
+    """
+
+    def __init__(self, path, speed=1.0, channels=None, first_address=FIRST_ADDRESS, chunk_rows=10_000):
+        self.path = str(path)
+        self.speed = speed or None
+        self._blocks = iter_blocks(self.path, chunk_rows=chunk_rows)
+        block = next(self._blocks, None)
+        if block is None:
+            raise ValueError(f"{self.path} has no rows to replay")
+
+        names = block.channel_names
+        if channels is None:
+            self.channels = [name for name in names if "Conductivity" in name]
+        else:
+            self.channels = []
+            for wanted in channels:
+                matches = [name for name in names if wanted in name]
+                if not matches:
+                    raise ValueError(f"{self.path} has no channel matching {wanted!r}")
+                self.channels.append(matches[0])
+        if not self.channels:
+            raise ValueError(f"{self.path} has no conductivity channels")
+
+        self.devices = [Atlas_I2C(address=first_address + i, moduletype="EC", name=_device_name(name),
+                                  bus=REPLAY_BUS, transport=No_Bus_Transport())
+                        for i, name in enumerate(self.channels)]
+        self.device_list = self.devices
+        self._load(block)
+        self._first_elapsed = None
+        self._wall_start = None
+        self.tick_time = None
+        self.tick_elapsed = None
+        self.ticks = 0
+
+    def _load(self, block):
+        self._elapsed = block.elapsed.tolist()
+        self._times = block.time.tolist()  # datetime, None for NaT
+        self._columns = [block.channels[name].tolist() for name in self.channels]
+        self._row = 0
+
+    def _next_row(self):
+        while self._row >= len(self._elapsed):
+            block = next(self._blocks, None)
+            if block is None:
+                raise Replay_Finished()
+            self._load(block)
+        row = self._row
+        self._row += 1
+        return self._times[row], self._elapsed[row], [column[row] for column in self._columns]
+
+    def _stamp(self, recorded, elapsed):
+        # an unparsable time or elapsed is carried on from the previous tick
+        if elapsed != elapsed:
+            elapsed = self.tick_elapsed if self.tick_elapsed is not None else 0.0
+        if recorded is None and self.tick_time is not None:
+            recorded = self.tick_time + datetime.timedelta(seconds=elapsed - self.tick_elapsed)
+        self.tick_time = recorded
+        self.tick_elapsed = elapsed
+
+    def _pace(self, elapsed):
+        if self._wall_start is None or elapsed != elapsed:
+            self._wall_start = time.monotonic()
+            self._first_elapsed = elapsed if elapsed == elapsed else 0.0
+            return
+        if self.speed is None:
+            return
+        wait = self._wall_start + (elapsed - self._first_elapsed) / self.speed - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def next_readings(self):
+        """
+        The next recorded tick as one EZO_Reading (or Read_Fault) per device,
+        returned when it is due.
+        """
+        recorded, elapsed, values = self._next_row()
+        self._pace(elapsed)
+        self._stamp(recorded, elapsed)
+        now = time.monotonic()
+        self.ticks += 1
+        readings = []
+        for dev, value in zip(self.devices, values):
+            if value != value:
+                readings.append(Read_Fault(dev.address, "missing", "not in the recording", now))
+            else:
+                readings.append(EZO_Reading(dev.address, EZO_Reading.STATUS_SUCCESS, repr(value).encode("latin-1"), value, now))
+        return readings
+
+    def read_all(self, command="R", idle_until=None):
+        """
+        Multi_Bus_Reader.read_all: the next tick as a Bus_Tick.
+        """
+        started = time.monotonic()
+        readings = self.next_readings()
+        return Bus_Tick(readings, self.devices, started, time.monotonic())
+
+    def read_recieve_all(self, device_list=None, poll=False, structured=False, timer=None):
+        """
+        The driver's read_recieve_all: the next tick as strings (or readings
+        when structured). device_list is ignored; the devices are the
+        recording's.
+        """
+        start = time.perf_counter()
+        readings = self.next_readings()
+        if timer is not None:
+            timer.add("i2c_poll" if poll else "i2c_read", time.perf_counter() - start)
+        if structured:
+            return readings
+        return [dev.format_reading(reading) for dev, reading in zip(self.devices, readings)]
+
+    def close(self):
+        self._blocks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
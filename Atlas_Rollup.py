@@ -0,0 +1,227 @@
+"""
+Atlas_Rollup.py
+
+Incremental rollups of a datalog, kept up to date while it is written.
+
+- Rollup_Engine takes every sample (epoch time + one value per channel) and
+  maintains 10 s, 1 min and 1 h buckets with min, max, mean, std and the
+  count of valid (non-missing) values per channel
+- Only the 10 s tier sees raw samples (Welford update, constant time per
+  sample); a closed 10 s bucket is merged into the 1 min bucket and that
+  into the 1 h bucket with the parallel mean/variance combination, so no
+  tier ever re-reads anything
+- Buckets are aligned to the epoch (10 s buckets start on :00, :10, ...) so
+  rollups from different rigs line up. Each closed bucket is one row in
+  <log>_rollup_<tier>.csv, written through a Background_Writer; the partial
+  buckets are written when the engine is closed
+- prune_raw_logs deletes raw datalogs older than N days, but only those
+  whose hourly rollup exists, so the coarse history is always kept (the
+  segments of a rotated log count as that log)
+
+Usage:
+
+    rollups = Rollup_Engine("run.csv", channels)
+    rollups.add(now.timestamp(), values)        # None = missing
+    rollups.close()
+
+    prune_raw_logs(".", keep_days=30)
+"""
+
+import datetime
+import math
+import os
+import re
+
+from Atlas_Data_Writer import Background_Writer, CSV_Sink
+
+# (bucket seconds, file label)
+DEFAULT_TIERS = ((10, "10s"), (60, "1min"), (3600, "1h"))
+RAW_LOG_SUFFIXES = (".csv", ".bin", ".csv.gz", ".csv.xz", ".bin.gz", ".bin.xz")
+ROLLUP_MARKER = "_rollup_"
+# "run.0003.csv" is segment 3 of run.csv (Atlas_Segmented_Log)
+SEGMENT_NUMBER = re.compile(r"\.\d{4,}(?=\.[^.]+$)")
+STAT_NAMES = ("min", "max", "mean", "std", "count")
+
+
+class Channel_Stats:
+    """
+    Running min/max/mean/variance of one channel over one bucket.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+    def row(self):
+        if not self.count:
+            return ["", "", "", "", 0]
+        std = self.std
+        return [self.min, self.max, self.mean, "" if std is None else std, self.count]
+
+
+class Rollup_Tier:
+    """
+    One bucket width: the bucket being filled and the file closed ones go to.
+    """
+
+    def __init__(self, seconds, label, channels, path, coarser=None):
+        self.seconds = seconds
+        self.label = label
+        self.coarser = coarser
+        self.bucket_start = None
+        self.stats = [Channel_Stats() for _ in channels]
+        self.samples = 0
+        header = ["Time (Y-M-D-H-M-S)", "Bucket Seconds"]
+        header += [f"{name} {stat}" for name in channels for stat in STAT_NAMES]
+        self.path = path
+        self.writer = Background_Writer(CSV_Sink(path, header), fsync_every_rows=1)
+
+    def _bucket(self, t):
+        return math.floor(t / self.seconds) * self.seconds
+
+    def _roll(self, t):
+        bucket = self._bucket(t)
+        if bucket != self.bucket_start:
+            if self.bucket_start is not None:
+                self.close_bucket()
+            self.bucket_start = bucket
+
+    def add_sample(self, t, values):
+        self._roll(t)
+        for stats, v in zip(self.stats, values):
+            if v is not None and v == v:
+                stats.add(v)
+        self.samples += 1
+
+    def add_bucket(self, start, stats):
+        self._roll(start)
+        for mine, theirs in zip(self.stats, stats):
+            mine.merge(theirs)
+        self.samples += 1
+
+    def close_bucket(self):
+        """
+        Write the current bucket, hand it to the coarser tier and start empty.
+        """
+        if self.bucket_start is None or not self.samples:
+            return
+        stamp = datetime.datetime.fromtimestamp(self.bucket_start).strftime("%Y-%m-%d %H:%M:%S")
+        row = [stamp, self.seconds]
+        for stats in self.stats:
+            row += stats.row()
+        self.writer.write(row)
+        if self.coarser is not None:
+            self.coarser.add_bucket(self.bucket_start, self.stats)
+        for stats in self.stats:
+            stats.reset()
+        self.samples = 0
+
+
+def rollup_path(log_path, label):
+    stem, _ = os.path.splitext(log_path)
+    return f"{stem}{ROLLUP_MARKER}{label}.csv"
+
+
+class Rollup_Engine:
+    """
+    All tiers for one datalog; add() once per sample.
+    """
+
+    def __init__(self, log_path, channels, tiers=DEFAULT_TIERS):
+        self.channels = list(channels)
+        self.tiers = []
+        coarser = None
+        for seconds, label in sorted(tiers, reverse=True):
+            coarser = Rollup_Tier(seconds, label, self.channels, rollup_path(log_path, label), coarser)
+            self.tiers.insert(0, coarser)
+
+    @property
+    def paths(self):
+        return [tier.path for tier in self.tiers]
+
+    def add(self, t, values):
+        """
+        t in epoch seconds; values one per channel, None or NaN when missing.
+        """
+        self.tiers[0].add_sample(t, values)
+
+    def close(self):
+        # finest first so each partial bucket is merged before its parent is written
+        for tier in self.tiers:
+            tier.close_bucket()
+        for tier in self.tiers:
+            tier.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def prune_raw_logs(directory, keep_days, now=None, keep=()):
+    """
+    Delete raw datalogs in directory last modified more than keep_days ago
+    that have an hourly (coarsest) rollup next to them. Rollup files and the
+    paths in keep are never touched. Returns the deleted paths.
+    """
+    if keep_days is None:
+        return []
+    cutoff = (now if now is not None else datetime.datetime.now().timestamp()) - keep_days * 86400
+    keep = {os.path.abspath(p) for p in keep}
+    coarsest = DEFAULT_TIERS[-1][1]
+    removed = []
+    for entry in os.scandir(directory):
+        name = entry.name
+        if not entry.is_file() or ROLLUP_MARKER in name or not name.endswith(RAW_LOG_SUFFIXES):
+            continue
+        if os.path.abspath(entry.path) in keep or entry.stat().st_mtime >= cutoff:
+            continue
+        base = entry.path
+        for suffix in (".gz", ".xz"):
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        base = SEGMENT_NUMBER.sub("", base)
+        if not os.path.exists(rollup_path(base, coarsest)):
+            continue
+        os.remove(entry.path)
+        removed.append(entry.path)
+    return removed
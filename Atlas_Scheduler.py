@@ -0,0 +1,146 @@
+"""
+Atlas_Scheduler.py
+
+Fixed-cadence tick source for the acquisition loops.
+
+Tick n is due at start + n * period on the time.monotonic() clock, so jitter in
+one iteration (a slow read, a CSV stall) never shifts the ones after it and
+the sample times form an exact grid. When an iteration overruns by one or more
+whole periods those ticks are skipped and counted as missed rather than fired
+back to back to catch up; a tick that fires more than late_tolerance after its
+deadline is counted as late.
+
+Usage:
+
+    scheduler = Fixed_Rate_Scheduler(rate_hz=1.0)
+    for tick in scheduler:
+        ...            # tick.offset is the exact time from start on the grid
+    print(scheduler.stats())
+
+rate_hz=None runs free (each tick fires as soon as the previous one is done),
+which is the old back-to-back behaviour.
+"""
+
+from time import monotonic, sleep
+
+
+class Tick:
+    """
+    One scheduled acquisition slot.
+
+    index    : tick number on the grid (gaps appear where ticks were missed)
+    offset   : index * period, seconds from the start of the run
+    deadline : monotonic time the tick was due
+    fired    : monotonic time it actually fired
+    lateness : fired - deadline
+    missed   : ticks skipped immediately before this one
+    """
+
+    __slots__ = ("index", "offset", "deadline", "fired", "lateness", "missed")
+
+    def __init__(self, index, offset, deadline, fired, missed):
+        self.index = index
+        self.offset = offset
+        self.deadline = deadline
+        self.fired = fired
+        self.lateness = fired - deadline
+        self.missed = missed
+
+    def __repr__(self):
+        return (f"Tick(index={self.index}, offset={self.offset:.3f}, "
+                f"lateness={self.lateness * 1000:.2f} ms, missed={self.missed})")
+
+
+class Fixed_Rate_Scheduler:
+    """
+    Iterate to get Ticks at rate_hz on absolute monotonic deadlines.
+
+    late_tolerance defaults to 10 % of the period. max_ticks stops the
+    iteration after that many ticks have fired.
+    """
+
+    def __init__(self, rate_hz=1.0, late_tolerance=None, max_ticks=None,
+                 clock=monotonic, sleeper=sleep):
+        if rate_hz is not None and rate_hz <= 0:
+            raise ValueError("rate_hz must be positive (or None to run free)")
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz if rate_hz else 0.0
+        self.late_tolerance = (late_tolerance if late_tolerance is not None
+                               else 0.1 * self.period)
+        self.max_ticks = max_ticks
+        self._clock = clock
+        self._sleep = sleeper
+
+        self.start_time = None
+        self._next_index = 0
+        self.ticks_fired = 0
+        self.ticks_missed = 0
+        self.ticks_late = 0
+        self.max_lateness = 0.0
+
+    def start(self, at=None):
+        """
+        Anchor the grid; the first tick is due at `at` (default now).
+        """
+        self.start_time = self._clock() if at is None else at
+        self._next_index = 0
+
+    def next_deadline(self):
+        """
+        Monotonic time the next tick is due (None before start()).
+        """
+        if self.start_time is None:
+            return None
+        if not self.period:
+            return self._clock()
+        return self.start_time + self._next_index * self.period
+
+    def wait_next(self):
+        """
+        Sleep until the next deadline and return its Tick.
+        """
+        if self.start_time is None:
+            self.start()
+
+        if not self.period:
+            now = self._clock()
+            tick = Tick(self._next_index, now - self.start_time, now, now, 0)
+            self._next_index += 1
+            self.ticks_fired += 1
+            return tick
+
+        deadline = self.start_time + self._next_index * self.period
+        now = self._clock()
+        missed = 0
+        if now < deadline:
+            self._sleep(deadline - now)
+            now = self._clock()
+        else:
+            # whole periods already gone by are dropped, not replayed
+            missed = int((now - deadline) // self.period)
+            if missed:
+                self._next_index += missed
+                deadline = self.start_time + self._next_index * self.period
+
+        tick = Tick(self._next_index, self._next_index * self.period, deadline, now, missed)
+        self._next_index += 1
+        self.ticks_fired += 1
+        self.ticks_missed += missed
+        if tick.lateness > self.late_tolerance:
+            self.ticks_late += 1
+        if tick.lateness > self.max_lateness:
+            self.max_lateness = tick.lateness
+        return tick
+
+    def __iter__(self):
+        while self.max_ticks is None or self.ticks_fired < self.max_ticks:
+            yield self.wait_next()
+
+    def stats(self):
+        return {
+            "rate_hz": self.rate_hz,
+            "ticks_fired": self.ticks_fired,
+            "ticks_missed": self.ticks_missed,
+            "ticks_late": self.ticks_late,
+            "max_lateness_s": self.max_lateness,
+        }
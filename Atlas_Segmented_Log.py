@@ -0,0 +1,337 @@
+"""
+Atlas_Segmented_Log.py
+
+Rotating datalog segments, compressed in the background, with an index of
+the time range in each.
+
+- Rotating_Sink is a Background_Writer sink that writes <stem>.0001<ext>,
+  <stem>.0002<ext>, ... through an inner sink per segment (CSV_Sink or
+  Binary_Log_Sink) and starts the next one when the segment reaches
+  max_bytes or when the rows cross a max_seconds boundary (boundaries are
+  aligned to the epoch, so daily segments start at midnight UTC)
+- Each closed segment is handed to a Segment_Compressor thread that streams
+  it into <segment>.gz or .xz, fsyncs it and removes the original, so the
+  writer thread never waits on the compressor
+- <stem>.index.json lists every segment with its file, first and last row
+  time (epoch seconds), row count, size and state ("open", "closed",
+  "compressed"); it is replaced atomically whenever it changes
+- segments_for / iter_window pick the segments that overlap a time window
+  from the index and read only those (Atlas_Log_Loader reads .gz/.xz text
+  and binary segments)
+
+Usage:
+
+    sink = Rotating_Sink("run.csv", lambda path: CSV_Sink(path, header),
+                         max_bytes=64 << 20, max_seconds=86400,
+                         compression="gz", time_of=csv_row_time)
+    writer = Background_Writer(sink)
+
+    for block in iter_window("run.index.json", start, end):
+        ...
+"""
+
+import datetime
+import gzip
+import json
+import lzma
+import math
+import os
+import queue
+import shutil
+import threading
+
+COMPRESSORS = {"gz": gzip.open, "xz": lzma.open}
+INDEX_SUFFIX = ".index.json"
+_STOP = object()
+
+
+def segment_path(path, number):
+    stem, ext = os.path.splitext(str(path))
+    return f"{stem}.{number:04d}{ext}"
+
+
+def index_path_for(path):
+    return os.path.splitext(str(path))[0] + INDEX_SUFFIX
+
+
+def csv_row_time(row):
+    """
+    Epoch seconds of a CSV row whose first cell is the logged time stamp.
+    """
+    return datetime.datetime.fromisoformat(row[0]).timestamp()
+
+
+def binary_row_time(row):
+    """
+    Epoch seconds of a (time, values, error_bits) Binary_Log_Sink row.
+    """
+    return row[0]
+
+
+class Segment_Index:
+    """
+    The index file of one segmented log. Updated from the writer and the
+    compressor threads.
+    """
+
+    def __init__(self, path, log_path):
+        self.path = path
+        self.log = os.path.basename(str(log_path))
+        self.segments = []
+        self._lock = threading.Lock()
+
+    def add(self, file):
+        with self._lock:
+            entry = {"segment": len(self.segments) + 1, "file": os.path.basename(file),
+                     "start": None, "end": None, "rows": 0, "bytes": 0, "state": "open"}
+            self.segments.append(entry)
+            return entry
+
+    def record(self, entry, rows, start, end):
+        """
+        Rows appended to an entry; saved with the next update or save.
+        """
+        with self._lock:
+            entry["rows"] += rows
+            if entry["start"] is None:
+                entry["start"] = start
+            entry["end"] = end
+
+    def update(self, entry, **fields):
+        with self._lock:
+            entry.update(fields)
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "log": self.log, "segments": self.segments}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class Segment_Compressor:
+    """
+    Streams closed segments into compressed files on its own thread.
+    """
+
+    def __init__(self, compression="gz", level=None, chunk_size=1 << 20):
+        if compression not in COMPRESSORS:
+            raise ValueError(f"compression must be one of {sorted(COMPRESSORS)}")
+        self.compression = compression
+        self.level = level
+        self.chunk_size = chunk_size
+        self.compressed = 0
+        self.last_error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="atlas-compress", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, done=None):
+        """
+        Compress path in the background; done(compressed path, size) is called
+        from the compressor thread afterwards.
+        """
+        self._queue.put((path, done))
+
+    def compress(self, path):
+        target = f"{path}.{self.compression}"
+        tmp = target + ".tmp"
+        if self.compression == "gz":
+            kwargs = {"compresslevel": 6 if self.level is None else self.level}
+        else:
+            kwargs = {"preset": 6 if self.level is None else self.level}
+        with open(path, "rb") as src, COMPRESSORS[self.compression](tmp, "wb", **kwargs) as dst:
+            shutil.copyfileobj(src, dst, self.chunk_size)
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, target)
+        os.remove(path)
+        return target
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            path, done = item
+            try:
+                target = self.compress(path)
+            except OSError as e:
+                self.last_error = f"{path}: {type(e).__name__}: {e}"
+                continue
+            self.compressed += 1
+            if done is not None:
+                done(target, os.path.getsize(target))
+
+    def close(self):
+        """
+        Finish every queued segment, then stop.
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+class Rotating_Sink:
+    """
+    Background_Writer sink that rotates through numbered segments.
+
+    make_sink(path) opens the inner sink of one segment. max_bytes and
+    max_seconds (either may be None) decide when to rotate; max_seconds
+    needs time_of(row) -> epoch seconds, which also fills in the index time
+    ranges. compression "gz" / "xz" compresses closed segments.
+    """
+
+    def __init__(self, path, make_sink, max_bytes=None, max_seconds=None, compression=None,
+                 time_of=None, index_path=None):
+        if max_seconds is not None and time_of is None:
+            raise ValueError("time based rotation needs time_of")
+        self.path = str(path)
+        self.make_sink = make_sink
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.time_of = time_of
+        self.index = Segment_Index(index_path or index_path_for(self.path), self.path)
+        self.compressor = Segment_Compressor(compression) if compression else None
+        self.rotations = 0
+        self._sink = None
+        self._entry = None
+        self._bucket = None
+        self._open_next()
+
+    @property
+    def segment_path(self):
+        return self._sink.path
+
+    def _open_next(self):
+        path = segment_path(self.path, len(self.index.segments) + 1)
+        self._sink = self.make_sink(path)
+        self._entry = self.index.add(path)
+        self._bucket = None
+        self.index.save()
+
+    def _close_current(self):
+        self._sink.close()
+        entry = self._entry
+        self.index.update(entry, bytes=os.path.getsize(self._sink.path), state="closed")
+        if self.compressor is not None:
+            self.compressor.submit(self._sink.path, lambda target, size: self.index.update(
+                entry, file=os.path.basename(target), bytes=size, state="compressed"))
+
+    def _rotate(self):
+        self._close_current()
+        self.rotations += 1
+        self._open_next()
+
+    def _bucket_of(self, t):
+        return math.floor(t / self.max_seconds)
+
+    def write_rows(self, rows):
+        if self.max_bytes is not None and self._entry["rows"] and os.path.getsize(self._sink.path) >= self.max_bytes:
+            self._rotate()
+        if self.max_seconds is not None:
+            # split the batch where it crosses a segment boundary
+            start = 0
+            for i, row in enumerate(rows):
+                bucket = self._bucket_of(self.time_of(row))
+                if self._bucket is None:
+                    self._bucket = bucket
+                elif bucket != self._bucket:
+                    self._write(rows[start:i])
+                    self._rotate()
+                    self._bucket = bucket
+                    start = i
+            rows = rows[start:]
+        self._write(rows)
+
+    def _write(self, rows):
+        if not rows:
+            return
+        self._sink.write_rows(rows)
+        if self.time_of is not None:
+            self.index.record(self._entry, len(rows), self.time_of(rows[0]), self.time_of(rows[-1]))
+        else:
+            self.index.record(self._entry, len(rows), None, None)
+
+    def flush(self):
+        self._sink.flush()
+
+    def sync(self):
+        self._sink.sync()
+        self.index.update(self._entry, bytes=os.path.getsize(self._sink.path))
+
+    def close(self):
+        if self._sink is None:
+            return
+        self._close_current()
+        self._sink = None
+        if self.compressor is not None:
+            self.compressor.close()
+
+
+def load_index(index_path):
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _epoch(t):
+    if t is None or isinstance(t, (int, float)):
+        return t
+    return t.timestamp()
+
+
+def segments_for(index_path, start=None, end=None):
+    """
+    Paths of the segments whose rows overlap [start, end] (epoch seconds or
+    datetimes, None for open ended), in order. Segments that no longer
+    exist (pruned) are left out.
+    """
+    start, end = _epoch(start), _epoch(end)
+    folder = os.path.dirname(os.path.abspath(index_path))
+    paths = []
+    for seg in load_index(index_path)["segments"]:
+        if seg["rows"] and seg["start"] is not None:
+            if end is not None and seg["start"] > end:
+                continue
+            # an open segment may have grown since the index was written
+            if start is not None and seg["state"] != "open" and seg["end"] < start:
+                continue
+        path = os.path.join(folder, seg["file"])
+        if os.path.exists(path):
+            paths.append(path)
+    return paths
+
+
+def iter_window(index_path, start=None, end=None, chunk_rows=100_000):
+    """
+    Log_Blocks of the rows in [start, end] from only the segments that
+    overlap it.
+    """
+    # only the readers need numpy, not the logger on the Pi
+    import numpy as np
+
+    from Atlas_Log_Loader import Log_Block, iter_blocks
+
+    lo = None if start is None else np.datetime64(datetime.datetime.fromtimestamp(_epoch(start)), "ms")
+    hi = None if end is None else np.datetime64(datetime.datetime.fromtimestamp(_epoch(end)), "ms")
+    for path in segments_for(index_path, start, end):
+        for block in iter_blocks(path, chunk_rows=chunk_rows):
+            if lo is None and hi is None:
+                yield block
+                continue
+            keep = np.ones(len(block), dtype=bool)
+            if lo is not None:
+                keep &= block.time >= lo
+            if hi is not None:
+                keep &= block.time <= hi
+            if keep.all():
+                yield block
+            elif keep.any():
+                yield Log_Block(block.layout, block.time[keep], block.elapsed[keep], block.loop_time[keep],
+                                  {name: col[keep] for name, col in block.channels.items()},
+                                  block.error_flag[keep])
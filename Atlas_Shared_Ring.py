@@ -0,0 +1,313 @@
+"""
+Atlas_Shared_Ring.py
+
+Live samples in shared memory, so plotters, controllers and stability checks
+in other processes never tail the CSV or touch the I2C bus themselves.
+
+- The acquisition loop is the only writer: Shared_Ring_Writer publishes each
+  tick (epoch time, one float64 per channel, NaN when missing, and the error
+  bits) into a fixed-layout multiprocessing.shared_memory block
+- Every sample is stored twice, at slot i and slot i + capacity, so the
+  latest N samples are always one contiguous slice and a reader gets plain
+  NumPy views of them: no copy, no file I/O
+- A 64-bit generation counter works as a seqlock: it is odd while a sample is
+  being written and head = generation // 2 is the number of samples
+  published. A reader checks it again after using a view (valid()) or asks
+  for a checked copy (latest(n, copy=True)), since the writer never waits
+  for readers
+- Any number of readers can attach and detach at any time; the writer marks
+  the ring closed on exit
+
+Block layout (little-endian):
+
+    8 bytes   magic b"ATLASRNG"
+    uint16    format version
+    uint16    closed flag
+    uint32    capacity (samples)
+    uint32    number of channels
+    uint32    length of the JSON header ({"channels": [...], ...})
+    ...       uint64 generation at offset 64
+    JSON      at offset 128
+    data      at HEADER_SIZE: float64 time[2 * capacity],
+              float64 values[2 * capacity][channels], uint32 errors[2 * capacity]
+
+Usage:
+
+    ring = Shared_Ring_Writer("atlas", channels)        # acquisition side
+    ring.write(epoch_time, values, error_bits)
+    ring.close()
+
+    ring = Shared_Ring_Reader("atlas")                  # any other process
+    snap = ring.latest(600)     # snap.times, snap.values[:, i], snap.errors
+    ...use the views...
+    if ring.valid(snap): ...    # not overwritten while in use
+
+    python Atlas_Shared_Ring.py atlas     # print the live samples
+"""
+
+import argparse
+import json
+import math
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAGIC = b"ATLASRNG"
+VERSION = 1
+_PREAMBLE = struct.Struct("<8sHHIII")
+_GENERATION_OFFSET = 64
+_JSON_OFFSET = 128
+HEADER_SIZE = 4096
+DEFAULT_NAME = "atlas"
+DEFAULT_CAPACITY = 3600
+
+# rings written by this process, whose resource tracker entry is the writer's
+_written_here = set()
+
+
+def _layout(capacity, n_channels):
+    """
+    Byte offsets of the data arrays and the total block size.
+    """
+    slots = 2 * capacity
+    times = HEADER_SIZE
+    values = times + 8 * slots
+    errors = values + 8 * slots * n_channels
+    return times, values, errors, errors + 4 * slots
+
+
+def _views(buf, capacity, n_channels):
+    times_at, values_at, errors_at, _ = _layout(capacity, n_channels)
+    slots = 2 * capacity
+    generation = np.ndarray((1,), np.uint64, buf, _GENERATION_OFFSET)
+    times = np.ndarray((slots,), np.float64, buf, times_at)
+    values = np.ndarray((slots, n_channels), np.float64, buf, values_at)
+    errors = np.ndarray((slots,), np.uint32, buf, errors_at)
+    return generation, times, values, errors
+
+
+class Shared_Ring_Writer:
+    """
+    The single writer of a ring. A stale ring of the same name (left by a
+    logger that was killed) is replaced.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, channels=(), capacity=DEFAULT_CAPACITY, extra=None):
+        self.name = name
+        self.channels = list(channels)
+        self.capacity = capacity
+        meta = json.dumps({"channels": self.channels, "created": time.time(), **(extra or {})}).encode("utf-8")
+        if _JSON_OFFSET + len(meta) > HEADER_SIZE:
+            raise ValueError("ring header too large")
+        size = _layout(capacity, len(self.channels))[3]
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _written_here.add(name)
+        buf = self._shm.buf
+        buf[:_PREAMBLE.size] = _PREAMBLE.pack(MAGIC, VERSION, 0, capacity, len(self.channels), len(meta))
+        buf[_JSON_OFFSET:_JSON_OFFSET + len(meta)] = meta
+        self._generation, self._times, self._values, self._errors = _views(buf, capacity, len(self.channels))
+        self._generation[0] = 0
+        self._times[:] = math.nan
+        self._values[:] = math.nan
+        self._errors[:] = 0
+        self.head = 0
+
+    def write(self, t, values, error_bits=0):
+        """
+        Publish one sample: epoch time t, one value per channel (None = missing).
+        """
+        slot = self.head % self.capacity
+        mirror = slot + self.capacity
+        row = [math.nan if v is None else v for v in values]
+        generation = self._generation
+        generation[0] += 1  # odd: writing
+        self._times[slot] = self._times[mirror] = t
+        self._values[slot] = row
+        self._values[mirror] = row
+        self._errors[slot] = self._errors[mirror] = error_bits
+        self.head += 1
+        generation[0] += 1  # even: head = generation // 2
+
+    def close(self, unlink=True):
+        if self._shm is None:
+            return
+        struct.pack_into("<H", self._shm.buf, 10, 1)
+        self._generation = self._times = self._values = self._errors = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+        _written_here.discard(self.name)
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class Ring_Snapshot:
+    """
+    The latest samples as views into the ring: times (n,), values
+    (n, channels), errors (n,). head is the number of samples published
+    when it was taken; the last sample is sample head - 1.
+    """
+
+    __slots__ = ("times", "values", "errors", "head")
+
+    def __init__(self, times, values, errors, head):
+        self.times = times
+        self.values = values
+        self.errors = errors
+        self.head = head
+
+    def __len__(self):
+        return len(self.times)
+
+
+class Shared_Ring_Reader:
+    """
+    Attaches to a ring by name; never writes to it.
+    """
+
+    def __init__(self, name=DEFAULT_NAME):
+        self.name = name
+        # the writer owns the block; keep this process's resource tracker
+        # from unlinking it when the reader exits
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13
+            self._shm = shared_memory.SharedMemory(name=name)
+            if name not in _written_here:
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+        buf = self._shm.buf
+        magic, version, _, self.capacity, n_channels, meta_len = _PREAMBLE.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError(f"{name} is not an Atlas shared ring")
+        if version > VERSION:
+            raise ValueError(f"unsupported ring version {version}")
+        self.header = json.loads(bytes(buf[_JSON_OFFSET:_JSON_OFFSET + meta_len]).decode("utf-8"))
+        self.channels = self.header["channels"]
+        self._generation, times, values, errors = _views(buf, self.capacity, n_channels)
+        for view in (times, values, errors):
+            view.flags.writeable = False
+        self._times, self._values, self._errors = times, values, errors
+
+    @property
+    def head(self):
+        """
+        Samples published so far.
+        """
+        return int(self._generation[0]) // 2
+
+    @property
+    def closed(self):
+        return bool(struct.unpack_from("<H", self._shm.buf, 10)[0])
+
+    def channel(self, name):
+        return self.channels.index(name)
+
+    def _stable_generation(self):
+        while True:
+            generation = int(self._generation[0])
+            if not generation & 1:
+                return generation
+            time.sleep(0)
+
+    def latest(self, n=None, copy=False):
+        """
+        The last n samples (default and at most capacity - 1; fewer if
+        fewer were written). Views unless copy, in which case the copy is
+        checked against the generation counter and retaken if torn.
+        """
+        limit = self.capacity - 1
+        n = limit if n is None else min(n, limit)
+        while True:
+            head = self._stable_generation() // 2
+            count = min(n, head)
+            end = head % self.capacity + self.capacity
+            window = slice(end - count, end)
+            snap = Ring_Snapshot(self._times[window], self._values[window], self._errors[window], head)
+            if not copy:
+                return snap
+            snap = Ring_Snapshot(snap.times.copy(), snap.values.copy(), snap.errors.copy(), head)
+            if self.valid(snap, count):
+                return snap
+
+    def valid(self, snapshot, count=None):
+        """
+        Whether none of the samples in snapshot (views) have been overwritten
+        since it was taken.
+        """
+        count = len(snapshot) if count is None else count
+        generation = int(self._generation[0])
+        # the sample being written (odd generation) already clobbers its slot
+        newest = generation // 2 + (generation & 1)
+        return newest - self.capacity <= snapshot.head - count
+
+    def wait(self, after, timeout=None, interval=.01):
+        """
+        Block until more than `after` samples have been published; returns
+        the new head, or None on timeout or when the writer has closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            head = self.head
+            if head > after:
+                return head
+            if self.closed or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            time.sleep(interval)
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._generation = self._times = self._values = self._errors = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # snapshots still in use; the mapping goes with the last of them
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the samples an Atlas logger publishes to shared memory")
+    parser.add_argument("name", nargs="?", default=DEFAULT_NAME, help="ring name (default: atlas)")
+    args = parser.parse_args()
+    with Shared_Ring_Reader(args.name) as ring:
+        print(" | ".join(ring.channels))
+        seen = ring.head
+        try:
+            while True:
+                head = ring.wait(seen)
+                if head is None:
+                    print("Ring closed by the writer")
+                    return
+                snap = ring.latest(head - seen, copy=True)
+                for t, row, bits in zip(snap.times, snap.values, snap.errors):
+                    stamp = time.strftime("%H:%M:%S", time.localtime(t))
+                    cells = ["N/A" if v != v else f"{v:.4g}" for v in row]
+                    print(f"{stamp} {' | '.join(cells)}" + (f"  errors=0x{bits:x}" if bits else ""))
+                seen = snap.head
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
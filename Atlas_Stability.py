@@ -0,0 +1,312 @@
+"""
+Atlas_Stability.py
+
+Streaming stability detection for any number of probes, constant time and
+memory per sample.
+
+- Rolling_Window keeps the last `window` (time, value) samples in a fixed ring
+  and maintains mean, variance and the least-squares slope with Welford-style
+  add/remove updates (re-summed from the ring once per `window` samples so
+  rounding never accumulates)
+- Probe_Stability estimates each probe's noise sigma online from successive
+  differences (sigma = sqrt(E[d^2] / 2), which ignores slow trends) instead of
+  a hard-coded SIGMA constant. A sample is stable when its step from the
+  previous one is within k * sigma (the old 4.5 * sigma rule) and the rolling
+  slope does not drift more than k * sigma across the window
+- Consecutive stable samples and the time stability started are tracked so
+  "stable for 30 s" is a comparison, not a scan of every reading
+- Each probe moves through "warming" -> "unstable" / "stable" -> "settled"
+  (stable for hold_s seconds); every change is returned as a Stability_Event
+
+Usage:
+
+    monitor = Stability_Monitor(hold_s=30, window=30)
+    for event in monitor.update_all(tick.offset, {"K0.1 #1": 16.88, "K0.1 #2": 11.61}):
+        print(event)
+    if monitor.all_settled():
+        ...
+"""
+
+import math
+
+WARMING = "warming"
+UNSTABLE = "unstable"
+STABLE = "stable"
+SETTLED = "settled"
+
+
+class Rolling_Window:
+    """
+    Mean, variance and slope (value per second) of the last `window` samples.
+    """
+
+    def __init__(self, window=30):
+        if window < 2:
+            raise ValueError("window must hold at least 2 samples")
+        self.window = window
+        self._t = [0.0] * window
+        self._y = [0.0] * window
+        self._head = 0
+        self._since_resum = 0
+        self.n = 0
+        self._t0 = None   # times are kept relative to the first sample
+        self._mean_t = 0.0
+        self._mean_y = 0.0
+        self._m2_t = 0.0
+        self._m2_y = 0.0
+        self._c_ty = 0.0
+
+    def _add(self, t, y):
+        self.n += 1
+        dt = t - self._mean_t
+        dy = y - self._mean_y
+        self._mean_t += dt / self.n
+        self._mean_y += dy / self.n
+        self._m2_t += dt * (t - self._mean_t)
+        self._m2_y += dy * (y - self._mean_y)
+        self._c_ty += dt * (y - self._mean_y)
+
+    def _remove(self, t, y):
+        self.n -= 1
+        if not self.n:
+            self._mean_t = self._mean_y = self._m2_t = self._m2_y = self._c_ty = 0.0
+            return
+        dt = t - self._mean_t
+        dy = y - self._mean_y
+        self._mean_t -= dt / self.n
+        self._mean_y -= dy / self.n
+        self._m2_t -= dt * (t - self._mean_t)
+        self._m2_y -= dy * (y - self._mean_y)
+        self._c_ty -= dt * (y - self._mean_y)
+
+    def _resum(self):
+        ts, ys = self._t, self._y
+        n = self.n
+        mean_t = sum(ts) / n
+        mean_y = sum(ys) / n
+        self._mean_t, self._mean_y = mean_t, mean_y
+        self._m2_t = sum((t - mean_t) ** 2 for t in ts)
+        self._m2_y = sum((y - mean_y) ** 2 for y in ys)
+        self._c_ty = sum((t - mean_t) * (y - mean_y) for t, y in zip(ts, ys))
+
+    def push(self, t, y):
+        if self._t0 is None:
+            self._t0 = t
+        t -= self._t0
+        if self.n == self.window:
+            self._remove(self._t[self._head], self._y[self._head])
+        self._t[self._head] = t
+        self._y[self._head] = y
+        self._head = (self._head + 1) % self.window
+        self._add(t, y)
+
+        self._since_resum += 1
+        if self.n == self.window and self._since_resum >= self.window:
+            self._resum()
+            self._since_resum = 0
+
+    def clear(self):
+        self.__init__(self.window)
+
+    @property
+    def full(self):
+        return self.n == self.window
+
+    @property
+    def mean(self):
+        return self._mean_y if self.n else math.nan
+
+    @property
+    def variance(self):
+        return max(self._m2_y, 0.0) / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.n > 1 else math.nan
+
+    @property
+    def slope(self):
+        return self._c_ty / self._m2_t if self.n > 1 and self._m2_t > 0 else math.nan
+
+    @property
+    def span(self):
+        """
+        Seconds between the oldest and newest sample in the window.
+        """
+        if self.n < 2:
+            return 0.0
+        newest = self._t[self._head - 1]
+        oldest = self._t[self._head % self.window] if self.full else self._t[0]
+        return newest - oldest
+
+
+class Stability_Event:
+    """
+    A probe changed state.
+    """
+
+    __slots__ = ("probe", "state", "previous", "time", "value", "sigma", "slope", "stable_for")
+
+    def __init__(self, probe, state, previous, time, value, sigma, slope, stable_for):
+        self.probe = probe
+        self.state = state
+        self.previous = previous
+        self.time = time
+        self.value = value
+        self.sigma = sigma
+        self.slope = slope
+        self.stable_for = stable_for
+
+    def __repr__(self):
+        return (f"Stability_Event({self.probe}: {self.previous} -> {self.state} at t={self.time:.1f}s, "
+                f"value={self.value}, sigma={self.sigma:.4g}, stable for {self.stable_for:.1f}s)")
+
+
+class Probe_Stability:
+    """
+    Stability state of one probe.
+
+    sigma    : fixed noise sigma; None estimates it online
+    k        : threshold in sigmas for the step and for drift across the window
+    window   : samples in the rolling window
+    hold_s   : seconds of continuous stability before the probe is "settled"
+    resolution : smallest reading step the probe reports; sigma never drops
+                 below half of it so a quiet probe is not flagged by one LSB
+    sigma_alpha : weight of each new squared difference in the sigma estimate
+    """
+
+    def __init__(self, name, sigma=None, k=4.5, window=30, hold_s=30.0,
+                 resolution=0.01, sigma_alpha=0.05):
+        self.name = name
+        self.fixed_sigma = sigma
+        self.k = k
+        self.hold_s = hold_s
+        self.resolution = resolution
+        self.sigma_alpha = sigma_alpha
+        self.stats = Rolling_Window(window)
+
+        self.state = WARMING
+        self.last_value = None
+        self.last_time = None
+        self.delta = math.nan
+        self.stable_count = 0
+        self.stable_since = None
+        self._diff_sq = None   # smoothed squared successive difference
+        self._diff_n = 0
+
+    @property
+    def sigma(self):
+        if self.fixed_sigma is not None:
+            return self.fixed_sigma
+        if self._diff_sq is None:
+            return math.nan
+        return max(math.sqrt(self._diff_sq / 2.0), self.resolution / 2.0)
+
+    def stable_for(self, t=None):
+        if self.stable_since is None:
+            return 0.0
+        return (self.last_time if t is None else t) - self.stable_since
+
+    def _learn_sigma(self, delta):
+        d2 = delta * delta
+        self._diff_n += 1
+        if self._diff_sq is None:
+            self._diff_sq = d2
+        elif self._diff_n < self.stats.window:
+            # plain mean until there are enough differences to smooth
+            self._diff_sq += (d2 - self._diff_sq) / self._diff_n
+        else:
+            self._diff_sq += self.sigma_alpha * (d2 - self._diff_sq)
+
+    def update(self, t, value):
+        """
+        Feed one sample (t in seconds). Returns a Stability_Event if the
+        state changed, else None. A missing value (None/NaN) breaks the
+        stable run.
+        """
+        previous = self.state
+        if value is None or value != value:
+            self.stable_count = 0
+            self.stable_since = None
+            self.state = UNSTABLE if previous != WARMING else WARMING
+            self.last_time = t
+            return self._event(previous, t, value)
+
+        if self.last_value is not None:
+            self.delta = abs(value - self.last_value)
+            sigma = self.sigma
+            # learn the noise only from steps that look like noise, so a
+            # transient does not inflate the threshold that judges it
+            if self.fixed_sigma is None and (sigma != sigma or self.delta <= self.k * sigma
+                                             or self._diff_n < self.stats.window):
+                self._learn_sigma(self.delta)
+        self.stats.push(t, value)
+        self.last_value = value
+        self.last_time = t
+
+        if not self.stats.full:
+            self.state = WARMING
+            return self._event(previous, t, value)
+
+        sigma = self.sigma
+        limit = self.k * sigma
+        drift = abs(self.stats.slope) * self.stats.span if self.stats.slope == self.stats.slope else 0.0
+        if self.delta <= limit and drift <= limit:
+            if self.stable_since is None:
+                self.stable_since = t
+            self.stable_count += 1
+            self.state = SETTLED if t - self.stable_since >= self.hold_s else STABLE
+        else:
+            self.stable_count = 0
+            self.stable_since = None
+            self.state = UNSTABLE
+        return self._event(previous, t, value)
+
+    def _event(self, previous, t, value):
+        if self.state == previous:
+            return None
+        return Stability_Event(self.name, self.state, previous, t, value,
+                               self.sigma, self.stats.slope, self.stable_for(t))
+
+
+class Stability_Monitor:
+    """
+    Probe_Stability per probe name, created on first use with the monitor's
+    settings (override per probe with add()).
+    """
+
+    def __init__(self, **probe_settings):
+        self.probe_settings = probe_settings
+        self.probes = {}
+
+    def add(self, name, **settings):
+        self.probes[name] = Probe_Stability(name, **{**self.probe_settings, **settings})
+        return self.probes[name]
+
+    def update(self, name, t, value):
+        probe = self.probes.get(name) or self.add(name)
+        return probe.update(t, value)
+
+    def update_all(self, t, values):
+        """
+        Feed {name: value} sampled at t; returns the list of state changes.
+        """
+        events = []
+        for name, value in values.items():
+            event = self.update(name, t, value)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def state(self, name):
+        return self.probes[name].state
+
+    def all_settled(self, names=None):
+        probes = self.probes.values() if names is None else (self.probes[n] for n in names)
+        return all(p.state == SETTLED for p in probes)
+
+    def summary(self):
+        return {name: {"state": p.state, "value": p.last_value, "mean": p.stats.mean,
+                       "std": p.stats.std, "sigma": p.sigma, "slope": p.stats.slope,
+                       "stable_for": p.stable_for()}
+                for name, p in self.probes.items()}
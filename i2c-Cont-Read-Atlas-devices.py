@@ -1,15 +1,23 @@
 ####################################   Package Imports    ####################################
 
 from Atlas_I2C_Driver_JQ import Atlas_I2C, Config_AtlasI2C, read_recieve_all
+from Atlas_Data_Writer import Background_Writer, CSV_Sink
+from Atlas_History import History_Store
+from Atlas_Multi_Bus import Multi_Bus_Reader
+from Atlas_Profiling import Phase_Timer, Profile_Hook
+from Atlas_Rollup import Rollup_Engine
+from Atlas_Scheduler import Fixed_Rate_Scheduler
+from Atlas_Stability import Stability_Monitor
 from time import sleep, time
 import datetime
-import csv
 # import sm_tc
 # from tricont_cseries_DT_Driver import cseries_DT
 
 
 ####################################   Define Stability Function    ####################################
 def check_stability(reading, reading_list, sigma, stability_dict, probe_name):
+    # kept for old notebooks; the loop below uses Stability_Monitor, which
+    # estimates sigma online and needs no reading history
     delta = round(abs(reading - reading_list[-2]),7)
     if delta > 4.5 * sigma:
         stability_dict[probe_name] += 1
@@ -85,13 +93,8 @@ def main():
     
     
     # ####################################   Cont Read Protocol    ####################################     
-    Unitrode_pH_list = []
-    Ecotrode_pH_list = []
-    Mettler_pH_list = []
-    
-    temp_1_list = []
-    temp_2_list = []
-    Ref_temp_list = []
+    # last hour of every channel in fixed, preallocated memory (the full record is the CSV)
+    history = History_Store(['K1.0', 'K0.1 #1', 'K0.1 #2', 'K0.1 #3'], capacity=3600)
     
     # Press_1_list = []
     # Press_2_list = []    
@@ -99,22 +102,45 @@ def main():
     # pH_stability_dict = {'Uni': 0, 'Eco': 0, 'Mettler':0}  # Tracks consecutive instability
     
     # stable_period = 0  # Tracks consecutive stable period
+
+    # rolling mean/sigma/slope per probe, "settled" once stable for 30 s
+    stability = Stability_Monitor(window=30, hold_s=30.0)
+    pump_active = False
  
-    with open(filename, "w", newline='') as DataoutCsv:
-        csv_writer = csv.writer(DataoutCsv, delimiter=';')
-        csv_writer.writerow(["Time (Y-M-D-H-M-S)","Time from Start (Seconds)", "Loop Time (Seconds)", "K1.0 Conductivity Reading (uS/cm)" , "K0.1 #1 Conductivity Reading (uS/cm)", "K0.1 #2 Conductivity Reading (uS/cm)", "K0.1 #3 Conductivity Reading (uS/cm)"])
-        # csv_writer.writerow(["Time (Y-M-D-H-M-S)","Time from Start (Seconds)", "Loop Time (Seconds)", "Unitrode Reading (pH)", "Unitrode Temp (C)", "Ecotrode Reading (pH)", "Ecotrode Temp (C)","Mettler Reading (pH)", "Reference Themrocouple Temp (C)"])
+    # file stays open for the whole run, rows are written on a background thread
+    csv_writer = Background_Writer(CSV_Sink(filename, ["Time (Y-M-D-H-M-S)","Time from Start (Seconds)", "Loop Time (Seconds)", "K1.0 Conductivity Reading (uS/cm)" , "K0.1 #1 Conductivity Reading (uS/cm)", "K0.1 #2 Conductivity Reading (uS/cm)", "K0.1 #3 Conductivity Reading (uS/cm)"]))
+    # csv_writer = Background_Writer(CSV_Sink(filename, ["Time (Y-M-D-H-M-S)","Time from Start (Seconds)", "Loop Time (Seconds)", "Unitrode Reading (pH)", "Unitrode Temp (C)", "Ecotrode Reading (pH)", "Ecotrode Temp (C)","Mettler Reading (pH)", "Reference Themrocouple Temp (C)"]))
+    # 10 s / 1 min / 1 h min/max/mean/std next to the datalog
+    rollups = Rollup_Engine(filename, ["K1.0 Conductivity (uS/cm)", "K0.1 #1 Conductivity (uS/cm)", "K0.1 #2 Conductivity (uS/cm)", "K0.1 #3 Conductivity (uS/cm)"])
+    # one reader thread per I2C bus
+    reader = Multi_Bus_Reader(device_list)
+
+    # fixed 1 Hz grid on monotonic deadlines instead of running back to back
+    scheduler = Fixed_Rate_Scheduler(rate_hz=1.0)
+
+    # time per loop phase, printed on exit; set profile to "cprofile" or "sample" to profile ticks 10-59 as well
+    timer = Phase_Timer()
+    profile = None
+    hook = Profile_Hook(profile, ticks=50, start_tick=10,
+                        output=filename_s + (".prof" if profile == "cprofile" else ".folded")) if profile else None
     try:
-        time_elapsed_start = time()
+        time_elapsed_start = datetime.datetime.now()
         loop_time = None
+        scheduler.start()
         
-        while True:
+        for tick in scheduler:
+            if hook is not None:
+                hook.tick(tick.index)
+            timer.begin()
             loop_time_start = time()
            
-            now = datetime.datetime.now()
-            time_elapsed_loop_end = time()
-            time_elapsed_overall = time_elapsed_loop_end - time_elapsed_start
-            I2C_readings = read_recieve_all(device_list)
+            now = time_elapsed_start + datetime.timedelta(seconds=tick.offset)
+            time_elapsed_overall = tick.offset
+            bus_tick = reader.read_all()
+            I2C_readings = bus_tick.responses
+            timer.lap("read")
+            for phase, seconds in bus_tick.phases.items():
+                timer.add(phase, seconds)
             
             reading_pH_Mettler = I2C_readings[0].split(':')
             reading_pH_Unitrode = I2C_readings[1].split(':')
@@ -129,51 +155,38 @@ def main():
                pass
 
             if reading_pH_Mettler[-1] != b'*OK\r' :
-                Ecotrode_pH_list.append(float(reading_pH_Ecotrode[1]))
-                Unitrode_pH_list.append(float(reading_pH_Unitrode[1]))
-                Mettler_pH_list.append(float(reading_pH_Mettler[1]))
-                
-                temp_1_list.append(float(reading_Temp_1[1]))
+                history.append(time_elapsed_overall, [float(reading_pH_Mettler[1]), float(reading_pH_Unitrode[1]),
+                                                      float(reading_pH_Ecotrode[1]), float(reading_Temp_1[1])])
                 # temp_2_list.append(float(reading_Temp_2[1]))
                 # Ref_temp_list.append(float(reading_RTD_Ref[1]))
                 
                 # Press_1_list.append(float(reading_Press_1[1]))
                 # Press_2_list.append(float(reading_Press_2[1]))
+                timer.lap("parse")
+
+                print('\n')
+                print(f"Time Elapsed:{time_elapsed_overall}\nK1.0 Conductivity:{reading_pH_Mettler[1]} uS/cm \nK0.1 #1 Conductivity:{reading_pH_Unitrode[1]} uS/cm \nK0.1 #2 Conductivity:{reading_pH_Ecotrode[1]} uS/cm \nK0.1 #3 Conductivity:{reading_Temp_1[1]} uS/cm")
+
+
+                # print(f"Time Elapsed:{time_elapsed_overall}\nTemp 1:{reading_Temp_2[1]} C     Temp 2:{reading_Temp_1[1]} C     Ref Temp:{reading_RTD_Ref[1]} C")
+                # print(f"Ecotrode:{reading_pH_Ecotrode[1]} pH     Unitrode:{reading_pH_Unitrode[1]} pH     Mettler:{reading_pH_Mettler[1]} pH")
+
+                # Check for stability
+                latest = {name: history.last(name) for name in history.channels}
+                for event in stability.update_all(time_elapsed_overall, latest):
+                    print(f"{event.probe}: {event.previous} -> {event.state} (sigma {event.sigma:.4g}, slope {event.slope:.3g}/s)")
+
+                if stability.all_settled() != pump_active:
+                    pump_active = stability.all_settled()  # Reached 30 seconds of stability on every probe
+                    print(f"All probes stable for 30 s: {pump_active}")
+                timer.lap("stability")
 
-                if Ecotrode_pH_list[0] or Unitrode_pH_list[0] or Mettler_pH_list[0] or temp_1_list[0] is not float:
-                    pass
+                loop_time_end = time()
+                loop_time = (loop_time_end-loop_time_start)
+                rollups.add(now.timestamp(), [latest[name] for name in history.channels])
+                csv_writer.write([now.strftime("%Y-%m-%d %H:%M:%S"),time_elapsed_overall, loop_time, reading_pH_Mettler[1],reading_pH_Unitrode[1],reading_pH_Ecotrode[1], reading_Temp_1[1]])
+                timer.lap("log")
                 
-                    print('\n')
-                    print(f"Time Elapsed:{time_elapsed_overall}\nK1.0 Conductivity:{reading_pH_Mettler[1]} uS/cm \nK0.1 #1 Conductivity:{reading_pH_Unitrode[1]} uS/cm \nK0.1 #2 Conductivity:{reading_pH_Ecotrode[1]} uS/cm \nK0.1 #3 Conductivity:{reading_Temp_1[1]} uS/cm")
-
-
-                    # print(f"Time Elapsed:{time_elapsed_overall}\nTemp 1:{reading_Temp_2[1]} C     Temp 2:{reading_Temp_1[1]} C     Ref Temp:{reading_RTD_Ref[1]} C")
-                    # print(f"Ecotrode:{reading_pH_Ecotrode[1]} pH     Unitrode:{reading_pH_Unitrode[1]} pH     Mettler:{reading_pH_Mettler[1]} pH")
-
-                # if len(Unitrode_pH_list) > 2 and len(Ecotrode_pH_list) and len(Mettler_pH_list) > 2:
-                #         # Check for stability
-                #         Ecotrode_delta, Ecotrode_stability = check_stability(float(reading_pH_Ecotrode[1]), Ecotrode_pH_list, SIGMA_PH, pH_stability_dict, 'Eco')
-                #         Unitrode_delta, Unitrode_stability = check_stability(float(reading_pH_Unitrode[1]), Unitrode_pH_list, SIGMA_PH, pH_stability_dict, 'Uni')
-                #         Mettler_delta, Mettler_stability = check_stability(float(reading_pH_Mettler[1]), Mettler_pH_list, SIGMA_PH, pH_stability_dict, 'Mettler')
-                        
-                #         print(f"Time Elapsed:{time_elapsed_overall}     Stable Count: {stable_period}\n\nUnitrode :{reading_pH_Unitrode[1]}pH       Stable?:{Unitrode_stability}    Delta:{Unitrode_delta} \nEcotrode :{reading_pH_Ecotrode[1]}pH       Stable?:{Ecotrode_stability}    Delta:{Ecotrode_delta} \nMettler :{reading_pH_Mettler[1]}pH       Stable?:{Mettler_stability}    Delta:{Mettler_delta}\n\n\n")
-
-                #         if Ecotrode_stability == 'Stable' and Ecotrode_stability == 'Stable' and Mettler_stability == 'Stable':
-                #             stable_period += 1
-                #             if stable_period > 30:  # Reached 30 seconds of initial stability
-                #                 pump_active = True
-                #         else:
-                #             stable_period = 0  # Reset stable period if not stable
-                #             pump_active = False         
-                                                
-
-                    now = datetime.datetime.now()
-                    loop_time_end = time()
-                    loop_time = (loop_time_end-loop_time_start)
-                    with open(filename, "a", newline='') as DataoutCsv:
-                        csv_writer = csv.writer(DataoutCsv, delimiter=';')
-                        csv_writer.writerow([now.strftime("%Y-%m-%d %H:%M:%S"),time_elapsed_overall, loop_time, reading_pH_Mettler[1],reading_pH_Unitrode[1],reading_pH_Ecotrode[1], reading_Temp_1[1]])
-                    
                 # if loop_time == None:
                 #     loop_time_end = time()
                 #     loop_time = (loop_time_end-loop_time_start)                
@@ -182,7 +195,16 @@ def main():
                 
     except KeyboardInterrupt:
             print("Data Logging Stopped By User")
-            exit()  
+            print("Scheduler:", scheduler.stats())
+    finally:
+            # also on an error, so the rows still queued reach the datalog
+            if hook is not None:
+                hook.close()
+            print(timer.report())
+            reader.close()
+            csv_writer.close()
+            rollups.close()
+            history.close()
 
 
 